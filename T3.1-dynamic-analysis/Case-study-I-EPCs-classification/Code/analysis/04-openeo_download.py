@@ -183,57 +183,47 @@ print('Evaluating tails timeseries...')
 # Get clouds data 
 data_cloud = openeo_utils.get_data_cloud_mask(my_env.OPENEODIR / 'cloud-mask')
 
-# Filter winter and summer months
-mask = [month in [11, 12, 1, 2, 5, 6, 7, 8, 9] for month in data_cloud['date_time'].dt.month]
-data_cloud = data_cloud[mask]
-data_cloud = data_cloud.reset_index(drop = True)
-
-# Compute number of buildings per tail
-tails['n_build'] = tails['geometry'].apply(lambda x:\
-    sum(verified_data['geometry'].within(x))
-    )
-
-# Joining data
-data_cloud = data_cloud.join(
-    tails.set_index('id_name').drop(['id_parent', 'geometry'], axis = 1),
-    on = 'id_name')
-
-# Compute score (the higher the better)
-data_cloud['score'] = data_cloud.apply(lambda x:\
-    (1 - x['cloud_mask']) * x['n_build'], axis = 1)
-
 # All data are between 10:15 and 10:40
 min_time = data_cloud['date_time'].dt.time.min()
 max_time = data_cloud['date_time'].dt.time.max()
 print('Range time: {} - {}'.format(min_time, max_time))
 
+# Compute number of buildings per tail
+tails['n_build'] = openeo_utils.get_tails_n_build(
+    tails = tails,
+    building_data = verified_data
+)
+
+# Compute score of each date for each tail (the higher the better)
+scores_cloud = openeo_utils.score_acquisition_dates(
+    data_cloud = data_cloud,
+    tails = tails
+)
+
 # %%
-# Group by date
-data_cloud['date'] = data_cloud['date_time'].dt.date
-
-# Summarize tails with multiple values same day
-info_cloud = data_cloud.groupby(['id_name', 'date'], as_index = False)\
-    .agg(
-        n_build = ('n_build', 'first'),
-        cloud_mask = ('cloud_mask', 'max'),
-        score = ('score', 'min')
-    )
+# Select the date maximizing the buildings not covered by clouds.
+# The same date is used for all tails (by = 'tail' to select a date for each tail)
+winter_months = [11, 12, 1, 2]
+summer_months = [5, 6, 7, 8, 9]
+
+dates_winter = openeo_utils.select_acquisition_dates(
+    scores = scores_cloud,
+    cloud_threshold = .2,
+    months = winter_months,
+    by = 'global',
+    n_dates = 1
+)
 
-# Summarize info for each day
-info_cloud = info_cloud.groupby(['date'], as_index = False)\
-    .agg(
-        n_tail = ('date', 'size'),
-        n_build_sum = ('n_build', 'sum'),
-        cloud_mask_avg = ('cloud_mask', 'mean'),
-        cloud_mask_max = ('cloud_mask', 'max'),
-        score_sum = ('score', 'sum')
-    )
+dates_summer = openeo_utils.select_acquisition_dates(
+    scores = scores_cloud,
+    cloud_threshold = .2,
+    months = summer_months,
+    by = 'global',
+    n_dates = 1
+)
 
-# Possible good dates
-sel_dates = ['2021-12-07', '2022-01-11', '2022-01-16', # Winter
-             '2021-07-20', '2021-08-14'] # Summer
-mask = [str(date) in sel_dates for date in info_cloud['date']]
-info_cloud[mask].sort_values(by = ['score_sum'], ascending = False)
+print('Winter dates:', dates_winter['date'].unique())
+print('Summer dates:', dates_summer['date'].unique())
 
 
 # %%
@@ -262,73 +252,61 @@ openeo_utils.plot_tails_grid(
     building_data = verified_data
 )
 
+# Download plans (temporal extent is the selected date +/- 1 day)
+plan_winter = openeo_utils.get_download_plan(
+    tails = tails,
+    selected_dates = dates_winter,
+    days_buffer = 1
+)
+
+plan_summer = openeo_utils.get_download_plan(
+    tails = tails,
+    selected_dates = dates_summer,
+    days_buffer = 1
+)
+
 # %%
 # ATTENTION: the OpenEO servers are not stable (if the download of a raster 
 # fails, just try again: unfortunately, the server do not show the error which 
 # causes the problem)
 
-# winter day '2022-01-11'
-start_date_winter = '2022-01-10'
-end_date_winter = '2022-01-12'  
-# summer day '2022-08-14'
-start_date_summer = '2021-08-13'
-end_date_summer = '2021-08-15'  
-
+bands = ['AOT', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B11', 'B12', 
+         'B8A', 'SCL', 'WVP', 'CLOUD_MASK']
 
 # %%
 # Winter
 
 # Download tails (if fails try up to 1 + 3 times) 
-n_trial = 0
-fails = tails['id_name'].unique()
-while ((len(fails) > 0) & (n_trial < 4)):
-    print("Downloading winter images...")
-    mask = [id in fails for id in tails['id_name']]
-    tails_to_download = tails[mask]
-
-    successes, fails = openeo_utils.download_datacube_loop(
-        tails = tails_to_download,
-        start_date = start_date_winter,
-        end_date = end_date_winter,
-        bands = ['AOT', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B11', 
-                 'B12', 'B8A', 'SCL', 'WVP', 'CLOUD_MASK'],
-        aggregate = 'temporal',
-        out_dir = my_env.OPENEODIR / 'winter',
-        connection = connection,
-        collection = my_env.COLLECTION_ID,
-        backend_server = my_env.BACKEND_SERVER,
-        client_id = my_env.CLIENT_ID
-        )
-
-    n_trial = n_trial + 1
+print("Downloading winter images...")
+successes, fails = openeo_utils.download_plan_loop(
+    plan = plan_winter,
+    bands = bands,
+    aggregate = 'temporal',
+    out_dir = my_env.OPENEODIR / 'winter',
+    connection = connection,
+    collection = my_env.COLLECTION_ID,
+    backend_server = my_env.BACKEND_SERVER,
+    client_id = my_env.CLIENT_ID,
+    max_trials = 4
+    )
 
 
 # %%
 # Summer
 
 # Download tails (if fails try up to 1 + 3 times) 
-n_trial = 0
-fails = tails['id_name'].unique()
-while ((len(fails) > 0) & (n_trial < 4)):
-    print("Downloading summer images...")
-    mask = [id in fails for id in tails['id_name']]
-    tails_to_download = tails[mask]
-
-    successes, fails = openeo_utils.download_datacube_loop(
-        tails = tails_to_download,
-        start_date = start_date_summer,
-        end_date = end_date_summer,
-        bands = ['AOT', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B11', 'B12', 
-                 'B8A', 'SCL', 'WVP', 'CLOUD_MASK'],
-        aggregate = 'temporal',
-        out_dir = my_env.OPENEODIR / 'summer',
-        connection = connection,
-        collection = my_env.COLLECTION_ID,
-        backend_server = my_env.BACKEND_SERVER,
-        client_id = my_env.CLIENT_ID
-        )
-    
-    n_trial = n_trial + 1
+print("Downloading summer images...")
+successes, fails = openeo_utils.download_plan_loop(
+    plan = plan_summer,
+    bands = bands,
+    aggregate = 'temporal',
+    out_dir = my_env.OPENEODIR / 'summer',
+    connection = connection,
+    collection = my_env.COLLECTION_ID,
+    backend_server = my_env.BACKEND_SERVER,
+    client_id = my_env.CLIENT_ID,
+    max_trials = 4
+    )
 
 
 #==================
@@ -16,6 +16,7 @@ import math
 import numpy as np
 import time
 import matplotlib.pyplot as plt
+import sys
 import timeit
 import rasterio
 from rasterio.plot import show
@@ -25,6 +26,7 @@ from rasterio.plot import show_hist
 # Custom modules
 from src.utils import my_utils
 from src.utils import openeo_utils
+from src.utils import pipeline_utils
 
 if my_utils.in_ipython():
     # Automatic reload custom module to allow interactive development
@@ -49,6 +51,14 @@ my_env = env_loader.configuration.get('my_env')
 # Pass environment variables to custom module
 openeo_utils.my_env = my_env
 
+# Script parameters (passed by analysis/run_pipeline.py). Parameter 'part' 
+# allows downloading only OSM data ('osm') or only ERA5 data ('era5')
+params = pipeline_utils.get_params({
+    'part':'all'
+})
+run_osm = params['part'] in ['all', 'osm']
+run_era5 = params['part'] in ['all', 'era5']
+
 
 # %%
 #----    Data Loading    ----
@@ -73,6 +83,49 @@ mask = [point.within(S2_all.geometry.iloc[0]) for point in verified_data.geometr
 verified_data = verified_data[mask].reset_index(drop = True)
 
 
+# %%
+#----    Get Era5 Data    ----
+
+if run_era5:
+
+    # get data ERA5 2m temperature https://cds.climate.copernicus.eu/cdsapp#!/dataset/reanalysis-era5-single-levels?tab=overview
+
+    # Data have been downloaded manually form the website.
+
+    # Winter data includes
+    # [1:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 8 hrs:from 202201110000,
+    #  2:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 9 hrs:from 202201110000,
+    #  3:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 10 hrs:from 202201110000,
+    #  4:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 11 hrs:from 202201110000,
+    #  5:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 12 hrs:from 202201110000,
+    #  6:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 13 hrs:from 202201110000,
+    #  7:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 14 hrs:from 202201110000]
+    #  data at time 10 is used
+    data_winter = openeo_utils.get_data_era_5(my_env.ERA5WINTER_IMPORT, 
+                                              layer=2, 
+                                              crs = verified_data.crs)
+
+    # Summer data includes
+    # [1:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 10 hrs:from 202108140000,
+    #  2:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 11 hrs:from 202108140000]
+    # data at time 10 is used
+    data_summer = openeo_utils.get_data_era_5(my_env.ERA5SUMMER_IMPORT, 
+                                              layer=0,
+                                              crs = verified_data.crs)
+
+
+    data_era5 = pd.merge(data_winter, data_summer, 
+                         on='geometry', 
+                         suffixes= ('_winter', '_summer'))
+    data_era5 = data_era5.loc[:,['temp_winter', 'temp_summer', 'geometry']]
+
+    data_era5.to_file(my_env.ERA5TEMPERATURE, index = False, driver = 'GeoJSON')
+
+# Stages downloading only ERA5 data end here
+if not run_osm:
+    sys.exit(0)
+
+
 # %%
 #----    Define Tail Grid    ----
 
@@ -215,43 +268,3 @@ openeo_utils.plot_satellite(
     points = verified_data.loc[mask],
     figsize = (10, 10)
     )
-
-# %%
-#----    Get Era5 Data    ----
-
-# get data ERA5 2m temperature https://cds.climate.copernicus.eu/cdsapp#!/dataset/reanalysis-era5-single-levels?tab=overview
-
-# Data have been downloaded manually form the website.
-
-# Winter data includes
-# [1:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 8 hrs:from 202201110000,
-#  2:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 9 hrs:from 202201110000,
-#  3:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 10 hrs:from 202201110000,
-#  4:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 11 hrs:from 202201110000,
-#  5:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 12 hrs:from 202201110000,
-#  6:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 13 hrs:from 202201110000,
-#  7:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 14 hrs:from 202201110000]
-#  data at time 10 is used
-data_winter = openeo_utils.get_data_era_5(my_env.ERA5WINTER_IMPORT, 
-                                          layer=2, 
-                                          crs = verified_data.crs)
-
-# Summer data includes
-# [1:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 10 hrs:from 202108140000,
-#  2:2 metre temperature:K (instant):regular_ll:surface:level 0:fcst time 11 hrs:from 202108140000]
-# data at time 10 is used
-data_summer = openeo_utils.get_data_era_5(my_env.ERA5SUMMER_IMPORT, 
-                                          layer=0,
-                                          crs = verified_data.crs)
-
-
-data_era5 = pd.merge(data_winter, data_summer, 
-                     on='geometry', 
-                     suffixes= ('_winter', '_summer'))
-data_era5 = data_era5.loc[:,['temp_winter', 'temp_summer', 'geometry']]
-
-# %%
-data_era5.to_file(my_env.ERA5TEMPERATURE, index = False, driver = 'GeoJSON')
-
-
-# %%
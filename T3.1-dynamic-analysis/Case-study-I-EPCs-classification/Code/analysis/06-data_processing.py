@@ -17,11 +17,14 @@ import geopandas as gpd
 from shapely import wkt
 from shapely.geometry import Polygon
 import re
+import sys
 import timeit
 
 # Custom modules
 from src.utils import my_utils
 from src.utils import openeo_utils
+from src.utils import filter_utils
+from src.utils import pipeline_utils
 
 if my_utils.in_ipython():
     # Automatic reload custom module to allow interactive development
@@ -30,6 +33,7 @@ if my_utils.in_ipython():
     get_ipython().run_line_magic('reload_ext', 'autoreload')
     get_ipython().run_line_magic('aimport', 'src.utils.my_utils')
     get_ipython().run_line_magic('aimport', 'src.utils.openeo_utils')
+    get_ipython().run_line_magic('aimport', 'src.utils.filter_utils')
     get_ipython().run_line_magic('autoreload', '1')
 
 # load environment variables
@@ -46,6 +50,20 @@ my_env = env_loader.configuration.get('my_env')
 # Pass environment variables to custom module
 openeo_utils.my_env = my_env
 
+# Script parameters (passed by analysis/run_pipeline.py). Parameter 'part' 
+# allows computing only the bands statistics of a season ('winter', 'summer') 
+# or only the final dataset ('finalize')
+params = pipeline_utils.get_params({
+    'part':'all',
+    'date_max':'2021-08-14',
+    'distance_max':50,
+    'area_min':100,
+    'cloud_max':.2,
+    'shadow_val':100
+})
+seasons = [season for season in ['winter', 'summer'] if params['part'] in ['all', season]]
+finalize = params['part'] in ['all', 'finalize']
+
 
 # %%
 #----    Data Loading    ----
@@ -85,28 +103,29 @@ my_data = my_data.join(
 my_data['distance'] = my_data['geometry'].distance(my_data['geometry_point'])
 
 # Keep only buildings within available S2 images
-mask_S2 = [point.within(S2_all.geometry.iloc[0]) for point in my_data['geometry_point']]
+mask_S2 = my_data['geometry_point'].within(S2_all.geometry.iloc[0])
 
 # Keep buildings with certification previous to '2021-08-14'
-mask_date = my_data['DATA_INS'] <= '2021-08-14'
+mask_date = my_data['DATA_INS'] <= params['date_max']
 
 # Remove entries with empty geometry 
 mask_geom = ~ my_data['geometry'].isnull()
 
 # Remove entries with distance higher than 50m
-mask_distance = my_data['distance'] <= 50
+mask_distance = my_data['distance'] <= params['distance_max']
 
 # All buildings are expected more than 100 m2
-mask_area = my_data.area >= 100
-
-mask = pd.DataFrame(zip(
-    mask_S2, 
-    mask_date, 
-    mask_geom, 
-    mask_distance, 
-    mask_area)).apply(all, axis = 1)
+mask_area = my_data.area >= params['area_min']
 
-my_data = my_data[mask]
+my_data, report_filters = filter_utils.apply_filters(
+    data = my_data,
+    filters = {
+        'S2':mask_S2,
+        'date':mask_date,
+        'geom':mask_geom,
+        'distance':mask_distance,
+        'area':mask_area
+    })
 
 # Remove entries with same geometry (keep the closest one)
 my_data = my_data.sort_values(by = 'distance') 
@@ -117,6 +136,41 @@ my_data = my_data.sort_index()
 my_data = my_data.drop(['distance'], axis = 1)
 my_data = my_data.reset_index(drop = True)
 
+# %%
+#----    Images Data    ----
+
+# Tails of each season are merged in a single Cloud-Optimized GeoTIFF. This 
+# allows windowed reads for any building without considering tails borders.
+my_env.BANDSSTATSDIR.mkdir(parents = True, exist_ok = True)
+
+for season in seasons:
+    print('Getting {} images data...'.format(season))
+
+    files_season = [
+        my_env.OPENEODIR / season / file \
+        for file in os.listdir(my_env.OPENEODIR / season)\
+        if not file.startswith('.DS_Store')
+        ]
+
+    mosaic_season = openeo_utils.mosaic_tails(
+        files = files_season,
+        out_file = my_env.OPENEOMOSAICDIR / '{}.tif'.format(season),
+        vrt_only = False
+        )
+
+    bands_stats_season = openeo_utils.get_mosaic_bands_stats(
+        file = mosaic_season,
+        geom_data = my_data
+        )
+
+    bands_stats_season = bands_stats_season.add_prefix(season + "_")
+    bands_stats_season.to_pickle(my_env.BANDSSTATSDIR / '{}.pkl'.format(season))
+
+# Stages computing only the bands statistics of a season end here
+if not finalize:
+    sys.exit(0)
+
+
 # %%
 #----    Add ERA5 temperature data    ----
 
@@ -136,48 +190,13 @@ for i, row in data_era5.iterrows():
     my_data.loc[mask, 'temp_summer'] = row['temp_summer']
 
 
-# %%
-#----    Winter Images Data    ----
-print('Getting winter images data...')
-
-files_winter = [
-    my_env.OPENEODIR / 'winter'/ file \
-    for file in os.listdir(my_env.OPENEODIR / 'winter')\
-    if not file.startswith('.DS_Store')
-    ]
-
-bands_stats_winter = openeo_utils.loop_get_bands_stats(
-    files = files_winter,
-    geom_data = my_data
-    )
-
-bands_stats_winter = bands_stats_winter.add_prefix("winter_")
-
-
-# %%
-#----    Summer Images Data    ----
-print('Getting summer images data...')
-
-files_summer = [
-    my_env.OPENEODIR / 'summer'/ file \
-    for file in os.listdir(my_env.OPENEODIR / 'summer')\
-    if not file.startswith('.DS_Store')
-    ]
-
-
-bands_stats_summer = openeo_utils.loop_get_bands_stats(
-    files = files_summer,
-    geom_data = my_data
-    )
-
-bands_stats_summer = bands_stats_summer.add_prefix("summer_")
-
-
 # %%
 #----    Finalize Dataset    ----
 print('Finalizing dataset...')
 
 # Combine winter and summer bands
+bands_stats_winter = pd.read_pickle(my_env.BANDSSTATSDIR / 'winter.pkl')
+bands_stats_summer = pd.read_pickle(my_env.BANDSSTATSDIR / 'summer.pkl')
 bands_stats = pd.concat([bands_stats_winter, bands_stats_summer], axis = 1)
 
 # Check
@@ -206,29 +225,30 @@ my_data = my_data.drop(['geometry', 'geometry_point', 'id_tail'], axis = 1)
 # Filtering
 
 # Clouds
-mask_clouds_summer = my_data['summer_CLOUD_MASK_max'] <= .2
-mask_clouds_winter = my_data['winter_CLOUD_MASK_max'] <= .2
+mask_clouds_summer = my_data['summer_CLOUD_MASK_max'] <= params['cloud_max']
+mask_clouds_winter = my_data['winter_CLOUD_MASK_max'] <= params['cloud_max']
 
 # Shadow
 bands_summer = ['summer_' + band + '_max' for band in ['B02','B03', 'B04', 'B05', 'B06']]
-mask_shadow_summer = ~ openeo_utils.test_shadow(
+mask_shadow_summer = ~ filter_utils.test_shadow(
     data = my_data,
     col_bands = bands_summer,
-    val = 100)
+    val = params['shadow_val'])
 
 bands_winter = ['winter_' + band + '_max' for band in ['B02','B03', 'B04', 'B05', 'B06']]
-mask_shadow_winter = ~ openeo_utils.test_shadow(
+mask_shadow_winter = ~ filter_utils.test_shadow(
     data = my_data,
     col_bands = bands_winter,
-    val = 100)
+    val = params['shadow_val'])
 
-mask = pd.DataFrame(zip(
-    mask_clouds_summer, 
-    mask_clouds_winter, 
-    mask_shadow_summer, 
-    mask_shadow_winter)).apply(all, axis = 1)
-
-my_data = my_data[mask]
+my_data, report_filters = filter_utils.apply_filters(
+    data = my_data,
+    filters = {
+        'clouds_summer':mask_clouds_summer,
+        'clouds_winter':mask_clouds_winter,
+        'shadow_summer':mask_shadow_summer,
+        'shadow_winter':mask_shadow_winter
+    })
 
 # %%
 # Save the data 
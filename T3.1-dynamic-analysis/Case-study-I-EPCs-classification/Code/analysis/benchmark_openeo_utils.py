@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# %%
+#----    Settings    ----
+
+import json
+import pandas as pd
+
+# Custom modules
+from src.utils import my_utils
+from src.utils import benchmark_utils
+
+if my_utils.in_ipython():
+    # Automatic reload custom module to allow interactive development
+    # https://stackoverflow.com/a/35597119/12481476
+    from IPython import get_ipython
+    get_ipython().run_line_magic('reload_ext', 'autoreload')
+    get_ipython().run_line_magic('aimport', 'src.utils.benchmark_utils')
+    get_ipython().run_line_magic('autoreload', '1')
+
+# load environment variables
+from py_config_env import EnvironmentLoader
+
+env_loader = EnvironmentLoader(
+    env_file='my-env',  # File to load
+    env_path='environments'  # Path where files are contained
+)
+
+# Object containing loaded environmental variables
+my_env = env_loader.configuration.get('my_env')
+
+pd.set_option('display.width', 200)
+
+# Scales and functions to benchmark (None for all functions)
+SCALES = benchmark_utils.SCALES
+FUNCTIONS = None
+N_REPEAT = 3
+
+
+# %%
+#----    Run Benchmarks    ----
+
+# Synthetic data only, no OpenEO or OSM connection is required
+report = benchmark_utils.run_benchmarks(
+    scales = SCALES,
+    functions = FUNCTIONS,
+    n_repeat = N_REPEAT
+)
+
+my_env.BENCHMARKDIR.mkdir(parents = True, exist_ok = True)
+report_file = my_env.BENCHMARKDIR / 'openeo-utils_{}.json'.format(report['info']['date'])
+with open(report_file, 'w') as f:
+    json.dump(report, f, indent = 2)
+
+print('\nReport saved in {}'.format(report_file))
+
+
+# %%
+#----    Compare with Previous Report    ----
+
+reports = sorted(my_env.BENCHMARKDIR.glob('openeo-utils_*.json'))
+
+if len(reports) > 1:
+    with open(reports[-2], 'r') as f:
+        report_old = json.load(f)
+
+    print('\nComparison with {} (commit {})'.format(
+        reports[-2].name, report_old['info']['commit']))
+    print(benchmark_utils.compare_reports(report_old, report))
+
+
+#==================
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# %%
+#----    Settings    ----
+
+from pathlib import Path
+
+# Custom modules
+from src.utils import my_utils
+from src.utils import pipeline_utils
+
+if my_utils.in_ipython():
+    # Automatic reload custom module to allow interactive development
+    # https://stackoverflow.com/a/35597119/12481476
+    from IPython import get_ipython
+    get_ipython().run_line_magic('reload_ext', 'autoreload')
+    get_ipython().run_line_magic('aimport', 'src.utils.pipeline_utils')
+    get_ipython().run_line_magic('autoreload', '1')
+
+# load environment variables
+from py_config_env import EnvironmentLoader
+
+env_loader = EnvironmentLoader(
+    env_file='my-env',  # File to load
+    env_path='environments'  # Path where files are contained
+)
+
+# Object containing loaded environmental variables
+my_env = env_loader.configuration.get('my_env')
+
+# Stages to run even if up to date (e.g., ['04-openeo_download'])
+FORCE = []
+
+# Maximum number of stages running in parallel
+MAX_WORKERS = 2
+
+
+# %%
+#----    Stages    ----
+
+# Parameters of the buildings selection (shared by all 06 stages as the bands
+# statistics depend on the selected buildings)
+params_processing = {
+    'date_max':'2021-08-14',
+    'distance_max':50,
+    'area_min':100
+}
+
+# Parameters of the final filters (only used by the finalize stage, so that
+# changing them does not rerun the bands statistics)
+params_filters = {
+    'cloud_max':.2,
+    'shadow_val':100
+}
+
+# Modules imported by the scripts (directly or through other modules), hashed
+# in the stage keys
+utils_dir = Path('src/utils')
+code_cened = [utils_dir / 'my_utils.py', utils_dir / 'cened_utils.py']
+code_openeo = [utils_dir / 'my_utils.py', utils_dir / 'openeo_utils.py',
+               utils_dir / 'filter_utils.py']
+code_processing = code_openeo + [utils_dir / 'pipeline_utils.py']
+code_models = [utils_dir / 'my_utils.py', utils_dir / 'models_utils.py']
+
+# Note: the three 06 stages run parts of the same script, so editing any part
+# of 06-data_processing.py reruns all of them
+
+inputs_processing = [
+    my_env.CENEDPROCESSEDSHAPE,
+    my_env.S2EURAC,
+    my_env.OSMBUILDINGS
+]
+
+stages = [
+    {
+        'name':'01-cened_filtering',
+        'script':Path('analysis/01-cened_filtering.py'),
+        'inputs':[my_env.CENEDTABLE],
+        'outputs':[my_env.CENEDOUTPUT]
+    },
+    {
+        'name':'02-cened_geocoding',
+        'script':Path('analysis/02-cened_geocoding.py'),
+        'inputs':[my_env.CENEDOUTPUT, my_env.GEOREGION, my_env.GEOMUNICIPALITY],
+        'outputs':[my_env.CENEDGEOCODED, my_env.CENEDGEOCODEDSHAPE],
+        'code':code_cened
+    },
+    {
+        'name':'03-cened_processing',
+        'script':Path('analysis/03-cened_processing.py'),
+        'inputs':[my_env.CENEDOUTPUT, my_env.CENEDGEOCODEDSHAPE, my_env.GEOREGION],
+        'outputs':[my_env.CENEDPROCESSED, my_env.CENEDPROCESSEDSHAPE],
+        'code':code_cened
+    },
+    {
+        'name':'04-openeo_download',
+        'script':Path('analysis/04-openeo_download.py'),
+        'inputs':[my_env.CENEDPROCESSEDSHAPE, my_env.GEOREGION,
+                  my_env.EXTERNALDIR / 'S2_tiles.geojson'],
+        'outputs':[my_env.S2EURAC,
+                   my_env.OPENEODIR / 'cloud-mask',
+                   my_env.OPENEODIR / 'winter',
+                   my_env.OPENEODIR / 'summer'],
+        'code':code_openeo
+    },
+    {
+        'name':'05-osm_download',
+        'script':Path('analysis/05-osm_meteo_download.py'),
+        'inputs':[my_env.CENEDPROCESSEDSHAPE, my_env.GEOREGION, my_env.S2EURAC],
+        'outputs':[my_env.OSMBUILDINGS],
+        'params':{'part':'osm'},
+        'code':code_processing
+    },
+    {
+        'name':'05-meteo_download',
+        'script':Path('analysis/05-osm_meteo_download.py'),
+        'inputs':[my_env.CENEDPROCESSEDSHAPE, my_env.GEOREGION, my_env.S2EURAC,
+                  my_env.ERA5WINTER_IMPORT, my_env.ERA5SUMMER_IMPORT],
+        'outputs':[my_env.ERA5TEMPERATURE],
+        'params':{'part':'era5'},
+        'code':code_processing
+    },
+    {
+        'name':'06-bands_stats_winter',
+        'script':Path('analysis/06-data_processing.py'),
+        'inputs':inputs_processing + [my_env.OPENEODIR / 'winter'],
+        'outputs':[my_env.OPENEOMOSAICDIR / 'winter.tif',
+                   my_env.BANDSSTATSDIR / 'winter.pkl'],
+        'params':{'part':'winter', **params_processing},
+        'code':code_processing
+    },
+    {
+        'name':'06-bands_stats_summer',
+        'script':Path('analysis/06-data_processing.py'),
+        'inputs':inputs_processing + [my_env.OPENEODIR / 'summer'],
+        'outputs':[my_env.OPENEOMOSAICDIR / 'summer.tif',
+                   my_env.BANDSSTATSDIR / 'summer.pkl'],
+        'params':{'part':'summer', **params_processing},
+        'code':code_processing
+    },
+    {
+        'name':'06-data_processing',
+        'script':Path('analysis/06-data_processing.py'),
+        'inputs':inputs_processing + [my_env.ERA5TEMPERATURE,
+                                      my_env.BANDSSTATSDIR / 'winter.pkl',
+                                      my_env.BANDSSTATSDIR / 'summer.pkl'],
+        'outputs':[my_env.DATAANALYSIS],
+        'params':{'part':'finalize', **params_processing, **params_filters},
+        'code':code_processing
+    },
+    {
+        'name':'07-models_application',
+        'script':Path('analysis/07-models_application.py'),
+        'inputs':[my_env.DATAANALYSIS],
+        'outputs':[],
+        'code':code_models
+    }
+]
+
+print('Pipeline levels (stages in the same level run in parallel):')
+for i, level in enumerate(pipeline_utils.get_stages_levels(stages)):
+    print('{}: {}'.format(i, level))
+
+
+# %%
+#----    Run Pipeline    ----
+
+timings = pipeline_utils.run_pipeline(
+    stages = stages,
+    root = my_env.SRCDIR,
+    cache_file = my_env.PIPELINECACHE,
+    max_workers = MAX_WORKERS,
+    force = FORCE
+)
+
+print(timings)
+
+
+#==================
@@ -87,6 +87,18 @@ my_env.ERA5TEMPERATURE = my_env.INTERIMDIR / 'era5-temperature.geojson'
 
 #--  06-data_processing.py
 
+my_env.OPENEOMOSAICDIR = my_env.OPENEODIR / 'mosaic'
+my_env.BANDSSTATSDIR = my_env.INTERIMDIR / 'bands-stats'
 my_env.DATAANALYSIS = my_env.PROCESSEDDIR / 'data_analysis.csv'
 
+
+#--  run_pipeline.py
+
+my_env.PIPELINECACHE = my_env.INTERIMDIR / 'pipeline-cache.json'
+
+
+#--  benchmark_openeo_utils.py
+
+my_env.BENCHMARKDIR = my_env.INTERIMDIR / 'benchmarks'
+
 #====
@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+
+#----    settings    ----
+
+import pandas as pd
+import geopandas as gpd
+import shapely as shp
+import numpy as np
+from pathlib import Path
+import io
+import json
+import platform
+import tempfile
+import subprocess
+import contextlib
+import tracemalloc
+import timeit
+import rasterio
+from rasterio.transform import from_origin
+
+# Custom modules
+from src.utils import my_utils
+from src.utils import openeo_utils
+
+# Projected crs used to define synthetic data (distances in meters)
+CRS_PROJECTED = 'EPSG:32632'
+CRS_GEOGRAPHIC = 'EPSG:4326'
+
+# Bottom west corner of the synthetic region (close to Milan) in CRS_PROJECTED
+ORIGIN = (500000, 5020000)
+
+# Sentinel-2 bands names and resolution (in meters) of the synthetic rasters
+BANDS = ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B08', 'B8A', 'B09',
+         'B11', 'B12', 'AOT']
+RESOLUTION = 10
+
+# Default scales. Each scale defines:
+# - region_km: side of the square region
+# - tail_side_km: side of the tails
+# - n_buildings: number of buildings (footprints and points)
+# - raster_px: side of the square raster in pixels
+# - n_dates: number of acquisition dates in the cloud mask time series
+SCALES = {
+    'small':{'region_km':20, 'tail_side_km':5, 'n_buildings':500,
+             'raster_px':256, 'n_dates':20},
+    'medium':{'region_km':50, 'tail_side_km':5, 'n_buildings':2000,
+              'raster_px':1024, 'n_dates':50},
+    'large':{'region_km':100, 'tail_side_km':5, 'n_buildings':8000,
+             'raster_px':2048, 'n_dates':100}
+}
+
+#----    get_synthetic_region    ----
+
+def get_synthetic_region(region_km:float) -> gpd.GeoDataFrame:
+    """
+    Get a square region with the bottom west corner in ORIGIN.
+
+    Parameters
+    ----------
+    region_km:float
+        Side of the region in km
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        GeoDataFrame (CRS_GEOGRAPHIC) with columns 'id_name' and 'geometry'
+    """
+    side_m = region_km * 1000
+    geom = shp.geometry.box(
+        ORIGIN[0], ORIGIN[1], ORIGIN[0] + side_m, ORIGIN[1] + side_m)
+
+    res = gpd.GeoDataFrame(
+        {'id_name':['synthetic']}, geometry = [geom], crs = CRS_PROJECTED)
+    res = res.to_crs(CRS_GEOGRAPHIC)
+
+    return res
+
+#----    get_synthetic_buildings    ----
+
+def get_synthetic_buildings(
+    bounds:tuple,
+    n_buildings:int,
+    seed:int = 2023) -> gpd.GeoDataFrame:
+    """
+    Get square building footprints randomly placed within the bounds and the
+    corresponding geocoded points (footprint centroid with a random shift of a
+    few meters).
+
+    Parameters
+    ----------
+    bounds:tuple
+        (minx, miny, maxx, maxy) in CRS_PROJECTED
+    n_buildings:int
+        Number of buildings
+    seed:int
+        Seed of the random number generator
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        GeoDataFrame (CRS_PROJECTED) with columns 'COD_APE', 'point', and
+        'geometry' (the footprint)
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+
+    # Keep footprints within the bounds
+    half_side = rng.uniform(4, 15, n_buildings)
+    x = rng.uniform(minx + 20, maxx - 20, n_buildings)
+    y = rng.uniform(miny + 20, maxy - 20, n_buildings)
+
+    footprints = shp.box(x - half_side, y - half_side, x + half_side, y + half_side)
+    points = shp.points(
+        x + rng.uniform(-3, 3, n_buildings), y + rng.uniform(-3, 3, n_buildings))
+
+    res = gpd.GeoDataFrame({
+        'COD_APE':['APE_{}'.format(i) for i in range(n_buildings)],
+        'point':gpd.GeoSeries(points, crs = CRS_PROJECTED)
+        }, geometry = footprints, crs = CRS_PROJECTED)
+
+    return res
+
+#----    write_synthetic_raster    ----
+
+def write_synthetic_raster(
+    path:Path,
+    raster_px:int,
+    seed:int = 2023) -> Path:
+    """
+    Write a synthetic Sentinel-2 raster (int16, BANDS with their descriptions)
+    with the top west corner at the top of a raster_px square starting from
+    ORIGIN. The raster is saved as 'result.tiff' as the openeo downloads.
+
+    Parameters
+    ----------
+    path:Path
+        Path to the directory where the raster is saved
+    raster_px:int
+        Side of the square raster in pixels
+    seed:int
+        Seed of the random number generator
+
+    Returns
+    -------
+    Path
+        Path to the directory with the raster
+    """
+    rng = np.random.default_rng(seed)
+    path = Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+
+    transform = from_origin(
+        ORIGIN[0], ORIGIN[1] + raster_px * RESOLUTION, RESOLUTION, RESOLUTION)
+
+    with rasterio.open(
+        path / 'result.tiff', 'w', driver = 'GTiff',
+        height = raster_px, width = raster_px, count = len(BANDS),
+        dtype = 'int16', crs = CRS_PROJECTED, transform = transform,
+        nodata = -999, tiled = True) as dst:
+        for i, name_band in enumerate(BANDS, start = 1):
+            dst.write(
+                rng.integers(0, 5000, (raster_px, raster_px), dtype = 'int16'), i)
+            dst.set_band_description(i, name_band)
+
+    return path
+
+#----    write_synthetic_cloud_mask    ----
+
+def write_synthetic_cloud_mask(
+    path:Path,
+    tails:gpd.GeoDataFrame,
+    n_dates:int,
+    seed:int = 2023) -> Path:
+    """
+    Write the synthetic cloud mask time series of each tail as the openeo
+    downloads, i.e., a 'tail_{id_parent}_{row}x{col}_openeo/result.json' file
+    for each tail.
+
+    Parameters
+    ----------
+    path:Path
+        Path to the directory where the cloud mask data are saved
+    tails:gpd.GeoDataFrame
+        GeoDataFrame with tails 'id_parent' and 'id_name'
+    n_dates:int
+        Number of acquisition dates
+    seed:int
+        Seed of the random number generator
+
+    Returns
+    -------
+    Path
+        Path to the directory with the cloud mask data
+    """
+    rng = np.random.default_rng(seed)
+    path = Path(path)
+    dates = pd.date_range('2021-01-01', periods = n_dates, freq = '5D')\
+        .strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    for _, tail in tails.iterrows():
+        row, col = tail['id_name'].strip('()').split(', ')
+        dir_tail = path / 'tail_{}_{}x{}_openeo'.format(tail['id_parent'], row, col)
+        dir_tail.mkdir(parents = True, exist_ok = True)
+
+        data = {date:{'CLOUD_MASK':[float(value)]}
+                for date, value in zip(dates, rng.uniform(0, 1, n_dates))}
+        with open(dir_tail / 'result.json', 'w') as f:
+            json.dump(data, f)
+
+    return path
+
+#----    measure    ----
+
+def measure(
+    fun,
+    n_repeat:int = 3,
+    quiet:bool = True) -> dict:
+    """
+    Measure the execution time and the peak memory of a function. Memory is
+    traced by tracemalloc in a separate first run (tracing slows down the
+    execution), so allocations by C libraries not using the Python allocator
+    (e.g., GEOS and GDAL) are not included.
+
+    Parameters
+    ----------
+    fun
+        Function without arguments to measure
+    n_repeat:int
+        Number of timed runs
+    quiet:bool
+        Whether to suppress printed output of the function
+
+    Returns
+    -------
+    dict
+        Dictionary with 'time_min', 'time_mean' (in seconds), and
+        'peak_memory_mb'
+    """
+    redirect = contextlib.redirect_stdout(io.StringIO()) if quiet \
+        else contextlib.nullcontext()
+
+    with redirect:
+        tracemalloc.start()
+        fun()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times = []
+        for _ in range(n_repeat):
+            start = timeit.default_timer()
+            fun()
+            times.append(timeit.default_timer() - start)
+
+    res = {
+        'time_min':min(times),
+        'time_mean':float(np.mean(times)),
+        'peak_memory_mb':peak / 2**20
+    }
+
+    return res
+
+#----    get_benchmark_cases    ----
+
+def get_benchmark_cases(
+    scale:dict,
+    path:Path,
+    seed:int = 2023) -> dict:
+    """
+    Create the synthetic data of a scale and define the benchmark case of each
+    function as used in the analysis scripts.
+
+    Parameters
+    ----------
+    scale:dict
+        Dictionary with the scale definition (see SCALES)
+    path:Path
+        Path to the directory where synthetic files are saved
+    seed:int
+        Seed of the random number generator
+
+    Returns
+    -------
+    dict
+        Dictionary with the function name as key and a tuple as value with the
+        function without arguments to measure and the number of items processed
+    """
+    region = get_synthetic_region(scale['region_km'])
+    side_m = scale['region_km'] * 1000
+    buildings = get_synthetic_buildings(
+        bounds = (ORIGIN[0], ORIGIN[1], ORIGIN[0] + side_m, ORIGIN[1] + side_m),
+        n_buildings = scale['n_buildings'],
+        seed = seed)
+    points = gpd.GeoDataFrame(
+        buildings[['COD_APE']], geometry = buildings['point'].values,
+        crs = CRS_PROJECTED).to_crs(CRS_GEOGRAPHIC)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tails = openeo_utils.get_tails(
+            data_geom = region,
+            tail_side_km = scale['tail_side_km'],
+            overlapping_km = 0,
+            crs = CRS_GEOGRAPHIC)
+
+    # Buildings within the raster extent
+    raster_m = scale['raster_px'] * RESOLUTION
+    dir_raster = write_synthetic_raster(
+        path / 'raster', raster_px = scale['raster_px'], seed = seed)
+    buildings_raster = get_synthetic_buildings(
+        bounds = (ORIGIN[0], ORIGIN[1], ORIGIN[0] + raster_m, ORIGIN[1] + raster_m),
+        n_buildings = scale['n_buildings'],
+        seed = seed)[['COD_APE', 'geometry']]
+
+    dir_cloud = write_synthetic_cloud_mask(
+        path / 'cloud-mask', tails = tails, n_dates = scale['n_dates'], seed = seed)
+
+    res = {
+        'get_tails':(
+            lambda: openeo_utils.get_tails(
+                data_geom = region,
+                tail_side_km = scale['tail_side_km'],
+                overlapping_km = .3,
+                crs = CRS_GEOGRAPHIC),
+            len(tails)),
+        'filter_tails':(
+            lambda: openeo_utils.filter_tails(
+                tails = tails,
+                intersection_with = region,
+                include_elements = points),
+            len(tails)),
+        'assign_tail':(
+            lambda: points['geometry'].apply(
+                lambda x: openeo_utils.assign_tail(geom = x, data_tail = tails)),
+            len(points)),
+        'get_closest_geom':(
+            lambda: buildings['point'].apply(
+                lambda x: openeo_utils.get_closest_geom(
+                    point = x,
+                    geoms = buildings.geometry,
+                    initial_buffer = 20,
+                    max_buffer = 100)),
+            len(buildings)),
+        'get_bands_stats':(
+            lambda: openeo_utils.get_bands_stats(
+                file = dir_raster,
+                geom_data = buildings_raster),
+            len(buildings_raster)),
+        'get_data_cloud_mask':(
+            lambda: openeo_utils.get_data_cloud_mask(dir_cloud),
+            len(tails) * scale['n_dates'])
+    }
+
+    return res
+
+#----    get_git_commit    ----
+
+def get_git_commit() -> str:
+    """
+    Get the current git commit hash ('unknown' if not available).
+    """
+    try:
+        process = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output = True, text = True)
+        res = process.stdout.strip() if process.returncode == 0 else 'unknown'
+    except OSError:
+        res = 'unknown'
+
+    return res
+
+#----    run_benchmarks    ----
+
+def run_benchmarks(
+    scales:dict = SCALES,
+    functions:list = None,
+    n_repeat:int = 3,
+    seed:int = 2023) -> dict:
+    """
+    Run the benchmark of each function at each scale on synthetic data (no
+    connection required). Synthetic files are saved in a temporary directory.
+
+    Parameters
+    ----------
+    scales:dict
+        Dictionary with the scale name as key and the scale definition as value
+        (see SCALES)
+    functions:list
+        List of the function names to benchmark. If None, all the functions in
+        get_benchmark_cases() are used
+    n_repeat:int
+        Number of timed runs of each benchmark
+    seed:int
+        Seed of the random number generator
+
+    Returns
+    -------
+    dict
+        Report with 'info' (date, git commit, python and packages versions),
+        'scales', and 'results' (list of records with 'function', 'scale',
+        'n_items', 'time_min', 'time_mean', and 'peak_memory_mb')
+    """
+    results = []
+    for name_scale, scale in scales.items():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            print('\nScale: {} {}'.format(name_scale, scale))
+            cases = get_benchmark_cases(scale, path = Path(tmp_dir), seed = seed)
+
+            for name_fun, (fun, n_items) in cases.items():
+                if functions is not None and name_fun not in functions:
+                    continue
+
+                record = {'function':name_fun, 'scale':name_scale, 'n_items':n_items}
+                record.update(measure(fun, n_repeat = n_repeat))
+                results.append(record)
+                print('{:<20} n = {:<7} time = {:.3f}s peak memory = {:.2f}MB'\
+                    .format(name_fun, n_items, record['time_min'],
+                            record['peak_memory_mb']))
+
+    res = {
+        'info':{
+            'date':my_utils.now_str(),
+            'commit':get_git_commit(),
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'packages':{module.__name__:module.__version__
+                        for module in [np, pd, gpd, shp, rasterio]},
+            'n_repeat':n_repeat,
+            'seed':seed
+        },
+        'scales':scales,
+        'results':results
+    }
+
+    return res
+
+#----    compare_reports    ----
+
+def compare_reports(
+    report_old:dict,
+    report_new:dict) -> pd.DataFrame:
+    """
+    Compare the results of two benchmark reports (see run_benchmarks()).
+    Ratios greater than 1 indicate the new report is slower or uses more
+    memory.
+
+    Parameters
+    ----------
+    report_old:dict
+        Reference benchmark report
+    report_new:dict
+        New benchmark report
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with columns 'function', 'scale', 'time_old', 'time_new',
+        'time_ratio', 'memory_old', 'memory_new', and 'memory_ratio'
+    """
+    cols = ['function', 'scale', 'time_min', 'peak_memory_mb']
+    res = pd.merge(
+        pd.DataFrame(report_old['results'])[cols],
+        pd.DataFrame(report_new['results'])[cols],
+        on = ['function', 'scale'],
+        suffixes = ('_old', '_new'))
+    res = res.rename(columns = {
+        'time_min_old':'time_old', 'time_min_new':'time_new',
+        'peak_memory_mb_old':'memory_old', 'peak_memory_mb_new':'memory_new'})
+
+    res['time_ratio'] = res['time_new'] / res['time_old']
+    res['memory_ratio'] = res['memory_new'] / res['memory_old']
+    res = res.reindex(columns = [
+        'function', 'scale', 'time_old', 'time_new', 'time_ratio',
+        'memory_old', 'memory_new', 'memory_ratio'])
+
+    return res
+
+#=================
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+
+#----    settings    ----
+
+import pandas as pd
+import numpy as np
+
+#----    test_shadow    ----
+
+def test_shadow(
+    data:pd.DataFrame,
+    col_bands:list,
+    val:int = 100) -> np.ndarray:
+    """
+    Test whether the buildings are covered by shadow, i.e., all the selected
+    bands are lower than the given value. Missing values are not considered
+    lower than the value.
+
+    Parameters
+    ----------
+    data:pd.DataFrame
+        Dataframe with the bands statistics
+    col_bands:list
+        List of the columns names of the bands to test
+    val:int
+        Threshold value
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array, True if the building is covered by shadow
+    """
+    values = data[col_bands].to_numpy(dtype = float)
+    res = (values < val).all(axis = 1)
+
+    return res
+
+#----    apply_filters    ----
+
+def apply_filters(
+    data:pd.DataFrame,
+    filters:dict
+    ) -> tuple:
+    """
+    Apply all the filters in one pass and report how many rows each filter
+    removed. Each filter is a boolean array-like (True indicates rows to keep)
+    with the same length of data.
+
+    Parameters
+    ----------
+    data:pd.DataFrame
+        Dataframe to filter
+    filters:dict
+        Dictionary with the filter name as key and the boolean array-like as
+        value. Filters are reported in the same order
+
+    Returns
+    -------
+    tuple:
+        tuple with two dataframes:
+        - the filtered data
+        - the report with columns 'filter', 'n_removed' (rows not satisfying
+          the filter), and 'n_removed_seq' (rows removed by the filter after
+          applying the previous ones)
+    """
+    names = list(filters.keys())
+    masks = np.vstack([np.asarray(filters[name], dtype = bool) for name in names])
+
+    if masks.shape[1] != len(data):
+        raise ValueError('Filters length {} differs from data length {}'\
+            .format(masks.shape[1], len(data)))
+
+    mask_seq = np.logical_and.accumulate(masks, axis = 0)
+    mask = np.logical_and.reduce(masks, axis = 0)
+
+    n_kept_seq = np.concatenate([[len(data)], mask_seq.sum(axis = 1)])
+    report = pd.DataFrame({
+        'filter':names,
+        'n_removed':(~ masks).sum(axis = 1),
+        'n_removed_seq':n_kept_seq[:-1] - n_kept_seq[1:]
+    })
+
+    print(report.to_string(index = False))
+    print('Rows: {} -> {}'.format(len(data), mask.sum()))
+
+    res = data[mask]
+
+    return (res, report)
+
+#=================
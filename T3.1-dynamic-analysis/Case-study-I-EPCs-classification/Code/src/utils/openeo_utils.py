@@ -17,7 +17,9 @@ import time
 import matplotlib.pyplot as plt
 import re
 import json
+import xml.etree.ElementTree as ET
 import rasterio
+import rasterio.shutil
 from rasterio.plot import show
 import rasterstats
 import pygrib
@@ -27,6 +29,7 @@ import timeit
 
 # Custom modules
 from src.utils import my_utils
+from src.utils import filter_utils
 
 # my_env object containing environmental variables is passed in the analysis scripts
 
@@ -847,6 +850,277 @@ def get_data_cloud_mask(path:Path) -> pd.DataFrame:
     res = res.reset_index(drop = True)
     return res
 
+#----    get_tails_n_build    ----
+
+def get_tails_n_build(
+    tails:gpd.GeoDataFrame,
+    building_data:gpd.GeoDataFrame
+    ) -> pd.Series:
+    """
+    Count the number of buildings within each tail. Buildings are assigned to
+    tails through a single spatial join instead of testing each tail separately.
+
+    Parameters
+    ----------
+    tails:gpd.GeoDataFrame
+        GeoDataFrame with 'id_name' and 'geometry' of each tail
+    building_data:gpd.GeoDataFrame
+        GeoDataFrame with the buildings point coordinates (geometry POINT)
+
+    Returns
+    -------
+    pd.Series
+        Number of buildings within each tail (same index of tails)
+    """
+    joined = gpd.sjoin(
+        building_data[['geometry']],
+        tails[['id_name', 'geometry']],
+        how = 'inner',
+        predicate = 'within')
+    n_build = joined.groupby('id_name').size()
+
+    res = tails['id_name'].map(n_build).fillna(0).astype(int)
+
+    return res
+
+#----    score_acquisition_dates    ----
+
+def score_acquisition_dates(
+    data_cloud:pd.DataFrame,
+    tails:pd.DataFrame
+    ) -> pd.DataFrame:
+    """
+    Given the cloud mask time series of each tail, compute the score of each
+    acquisition date for each tail. The score is the expected number of
+    buildings not covered by clouds, i.e., (1 - cloud_mask) * n_build (the
+    higher the better). Tails with multiple acquisitions on the same day are
+    summarized considering the worst acquisition (max cloud_mask).
+
+    Parameters
+    ----------
+    data_cloud:pd.DataFrame
+        Dataframe with columns: 'id_parent', 'id_name', 'date_time', and
+        'cloud_mask' (see get_data_cloud_mask())
+    tails:pd.DataFrame
+        Dataframe with 'id_name' and 'n_build' (number of buildings) of each
+        tail (see get_tails_n_build())
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with columns: 'id_parent', 'id_name', 'date', 'n_build',
+        'cloud_mask', and 'score'.
+    """
+    res = data_cloud.join(
+        tails.set_index('id_name')[['n_build']],
+        on = 'id_name',
+        how = 'inner')
+    res['date'] = res['date_time'].dt.date
+
+    res = res.groupby(['id_parent', 'id_name', 'date'], as_index = False)\
+        .agg(
+            n_build = ('n_build', 'first'),
+            cloud_mask = ('cloud_mask', 'max')
+        )
+    res['score'] = (1 - res['cloud_mask']) * res['n_build']
+
+    return res
+
+#----    select_acquisition_dates    ----
+
+def select_acquisition_dates(
+    scores:pd.DataFrame,
+    cloud_threshold:float = .2,
+    months:list = None,
+    by:str = 'global',
+    n_dates:int = 1
+    ) -> pd.DataFrame:
+    """
+    Select the acquisition date(s) maximizing the number of covered buildings,
+    i.e., buildings within tails with cloud_mask lower or equal to the cloud
+    threshold. Ties are resolved according to the score (see
+    score_acquisition_dates()).
+
+    Parameters
+    ----------
+    scores:pd.DataFrame
+        Dataframe with columns: 'id_parent', 'id_name', 'date', 'n_build',
+        'cloud_mask', and 'score' (see score_acquisition_dates())
+    cloud_threshold:float
+        Maximum cloud_mask value to consider the buildings of a tail as covered
+    months:list
+        List of months (as integers) to consider, e.g., [11, 12, 1, 2] for
+        winter images. If None, all dates are considered
+    by:str
+        String indicating how dates are selected. Currently available are
+        - 'global': the same date(s) is selected for all tails (all tails
+          available at the selected dates are returned)
+        - 'tail': the date(s) is selected independently for each tail
+    n_dates:int
+        Number of dates to select (globally or for each tail)
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with columns: 'id_parent', 'id_name', 'date', 'n_build',
+        'cloud_mask', 'score', and 'n_build_covered'.
+    """
+    if months is not None:
+        mask = pd.to_datetime(scores['date']).dt.month.isin(months)
+        scores = scores[mask]
+
+    scores = scores.assign(n_build_covered = np.where(
+        scores['cloud_mask'] <= cloud_threshold, scores['n_build'], 0))
+
+    if by == 'global':
+        info_dates = scores.groupby('date', as_index = False)\
+            .agg(
+                n_build_covered = ('n_build_covered', 'sum'),
+                score_sum = ('score', 'sum')
+            )
+        info_dates = info_dates\
+            .sort_values(by = ['n_build_covered', 'score_sum'], ascending = False)\
+            .head(n_dates)
+        res = scores[scores['date'].isin(info_dates['date'])]
+
+    elif by == 'tail':
+        res = scores\
+            .sort_values(by = ['n_build_covered', 'score'], ascending = False)\
+            .groupby(['id_parent', 'id_name'])\
+            .head(n_dates)
+
+    else:
+        raise ValueError('Supported selections are "global", "tail"')
+
+    res = res.sort_values(by = ['id_parent', 'id_name', 'date'])
+    res = res.reset_index(drop = True)
+
+    return res
+
+#----    get_download_plan    ----
+
+def get_download_plan(
+    tails:gpd.GeoDataFrame,
+    selected_dates:pd.DataFrame,
+    days_buffer:int = 1
+    ) -> gpd.GeoDataFrame:
+    """
+    Combine the tails with the selected acquisition dates to obtain the
+    download plan. The temporal extent of each download is defined as the
+    selected date +/- days_buffer days.
+
+    Parameters
+    ----------
+    tails:gpd.GeoDataFrame
+        GeoDataFrame with 'id_parent', 'id_name', and 'geometry' of each tail
+    selected_dates:pd.DataFrame
+        Dataframe with 'id_parent', 'id_name', and 'date' (see
+        select_acquisition_dates())
+    days_buffer:int
+        Number of days before and after the selected date defining the
+        temporal extent
+
+    Returns
+    -------
+    gpd.GeoDataFrame
+        The tails with the additional columns 'date', 'start_date', and
+        'end_date' (formatted as '%Y-%m-%d'). Tails with multiple selected
+        dates are repeated.
+    """
+    dates = pd.to_datetime(selected_dates['date'])
+    plan = pd.DataFrame({
+        'id_parent':selected_dates['id_parent'],
+        'id_name':selected_dates['id_name'],
+        'date':dates.dt.strftime('%Y-%m-%d'),
+        'start_date':(dates - pd.Timedelta(days = days_buffer)).dt.strftime('%Y-%m-%d'),
+        'end_date':(dates + pd.Timedelta(days = days_buffer)).dt.strftime('%Y-%m-%d')
+    })
+
+    res = tails.merge(plan, on = ['id_parent', 'id_name'], how = 'inner')
+    res = res.sort_values(by = ['start_date', 'id_name'])
+    res = res.reset_index(drop = True)
+
+    return res
+
+#----    download_plan_loop    ----
+
+def download_plan_loop(
+    plan:gpd.GeoDataFrame,
+    bands:list,
+    aggregate:str,
+    out_dir:Path,
+    connection,
+    collection:str,
+    backend_server:str,
+    client_id:str,
+    max_trials:int = 4) -> tuple:
+    """
+    Download all tails in the download plan (see get_download_plan()). Tails
+    are downloaded grouped by temporal extent through download_datacube_loop().
+    In case of failure, the download of missing tails is tried again up to
+    max_trials times in total.
+
+    Parameters
+    ----------
+    plan:gpd.GeoDataFrame
+        GeoDataFrame with 'id_parent', 'id_name', 'geometry', 'start_date',
+        and 'end_date' of each tail
+    bands:list
+        List indicating the bands to download
+    aggregate:str
+        String indicating the type of aggregation. Currently available are
+        'spatial' or 'temporal'
+    out_dir:Path
+        Path indicating the directory were to store the downloaded images
+    connection
+        The entry point to OpenEO
+    collection:str
+        String Id of the collection
+    backend_server:str
+        The server used to download the data
+    client_id:str
+        Client ID
+    max_trials:int
+        Maximum number of download attempts for each tail
+
+    Returns
+    -------
+    tuple:
+        tuple with two lists of (id_name, start_date, end_date):
+        - tails that were successful downloaded
+        - tails that failed at download
+    """
+    successes = []
+    fails = []
+
+    for (start_date, end_date), tails_date in plan.groupby(['start_date', 'end_date']):
+        print('\n\nDownloading tails from {} to {}...'.format(start_date, end_date))
+
+        n_trial = 0
+        fails_date = tails_date['id_name'].unique()
+        while ((len(fails_date) > 0) & (n_trial < max_trials)):
+            mask = tails_date['id_name'].isin(fails_date)
+
+            successes_date, fails_date = download_datacube_loop(
+                tails = tails_date[mask],
+                start_date = start_date,
+                end_date = end_date,
+                bands = bands,
+                aggregate = aggregate,
+                out_dir = out_dir,
+                connection = connection,
+                collection = collection,
+                backend_server = backend_server,
+                client_id = client_id
+                )
+            successes.extend([(id, start_date, end_date) for id in successes_date])
+
+            n_trial = n_trial + 1
+
+        fails.extend([(id, start_date, end_date) for id in fails_date])
+
+    return (successes, fails)
+
 #----    assign_tail    ----
 
 def assign_tail(
@@ -1101,6 +1375,217 @@ def loop_get_bands_stats(
 
     return res
 
+#----    build_tails_vrt    ----
+
+def build_tails_vrt(
+    files:list,
+    out_file:Path
+    ) -> Path:
+    """
+    Build a virtual mosaic (VRT) of the satellite images of the tails. Tails
+    are expected to share the same crs, resolution, and bands (as downloaded
+    from openeo). Overlapping areas are filled by the last tail in the list,
+    excluding nodata pixels.
+
+    Parameters
+    ----------
+    files:list
+        List of paths to the directories with the openeo satellite images
+    out_file:Path
+        Path of the resulting .vrt file
+
+    Return
+    ------
+    Path
+        Path of the resulting .vrt file
+    """
+    gdal_types = {
+        'uint8':'Byte', 'int8':'Int8', 'uint16':'UInt16', 'int16':'Int16',
+        'uint32':'UInt32', 'int32':'Int32', 'float32':'Float32',
+        'float64':'Float64'
+        }
+
+    # Get info of each tail
+    info = []
+    for file in files:
+        with rasterio.open(Path(file) / 'result.tiff') as src:
+            info.append({
+                'path':str((Path(file) / 'result.tiff').resolve()),
+                'crs':src.crs,
+                'res':src.res,
+                'bounds':src.bounds,
+                'width':src.width,
+                'height':src.height,
+                'dtypes':src.dtypes,
+                'nodata':src.nodata,
+                'descriptions':src.descriptions
+            })
+
+    ref = info[0]
+    for tail in info:
+        if (tail['crs'] != ref['crs']) | (tail['res'] != ref['res']) | \
+            (len(tail['dtypes']) != len(ref['dtypes'])):
+            raise ValueError(
+                'Issue building mosaic: {} has different crs, resolution, or bands'\
+                    .format(tail['path']))
+
+    # Mosaic extent
+    res_x, res_y = ref['res']
+    left = min([tail['bounds'].left for tail in info])
+    right = max([tail['bounds'].right for tail in info])
+    bottom = min([tail['bounds'].bottom for tail in info])
+    top = max([tail['bounds'].top for tail in info])
+    width = int(round((right - left) / res_x))
+    height = int(round((top - bottom) / res_y))
+
+    vrt = ET.Element('VRTDataset', rasterXSize = str(width), rasterYSize = str(height))
+    ET.SubElement(vrt, 'SRS').text = ref['crs'].to_wkt()
+    ET.SubElement(vrt, 'GeoTransform').text = ', '.join(
+        [repr(x) for x in [left, res_x, 0.0, top, 0.0, -res_y]])
+
+    for i, (dtype, description) in enumerate(zip(ref['dtypes'], ref['descriptions'])):
+        band = ET.SubElement(vrt, 'VRTRasterBand',
+                             dataType = gdal_types[dtype], band = str(i + 1))
+        if description is not None:
+            ET.SubElement(band, 'Description').text = description
+        if ref['nodata'] is not None:
+            ET.SubElement(band, 'NoDataValue').text = repr(ref['nodata'])
+
+        for tail in info:
+            x_off = int(round((tail['bounds'].left - left) / res_x))
+            y_off = int(round((top - tail['bounds'].top) / res_y))
+            size = {'xSize':str(tail['width']), 'ySize':str(tail['height'])}
+
+            source = ET.SubElement(band, 'ComplexSource')
+            ET.SubElement(source, 'SourceFilename', relativeToVRT = '0').text = tail['path']
+            ET.SubElement(source, 'SourceBand').text = str(i + 1)
+            ET.SubElement(source, 'SrcRect', xOff = '0', yOff = '0', **size)
+            ET.SubElement(source, 'DstRect', xOff = str(x_off), yOff = str(y_off), **size)
+            if tail['nodata'] is not None:
+                ET.SubElement(source, 'NODATA').text = repr(tail['nodata'])
+
+    Path(out_file).parent.mkdir(parents = True, exist_ok = True)
+    ET.ElementTree(vrt).write(out_file)
+
+    return Path(out_file)
+
+#----    mosaic_tails    ----
+
+def mosaic_tails(
+    files:list,
+    out_file:Path,
+    vrt_only:bool = False,
+    blocksize:int = 512,
+    compress:str = 'DEFLATE',
+    overview_resampling:str = 'AVERAGE'
+    ) -> Path:
+    """
+    Merge the satellite images of the tails into a single Cloud-Optimized
+    GeoTIFF (tiled, compressed, and with overviews). The virtual mosaic (VRT)
+    is created first (see build_tails_vrt()) and then it is copied block by
+    block into the COG, so the whole mosaic is never loaded in memory.
+
+    Parameters
+    ----------
+    files:list
+        List of paths to the directories with the openeo satellite images
+    out_file:Path
+        Path of the resulting .tif file. The VRT is saved in the same
+        directory with .vrt extension
+    vrt_only:bool
+        If True, only the VRT is created
+    blocksize:int
+        Size of the internal tiles of the COG
+    compress:str
+        Compression method of the COG
+    overview_resampling:str
+        Resampling method used to compute the overviews
+
+    Return
+    ------
+    Path
+        Path of the resulting mosaic (.tif or .vrt if vrt_only)
+    """
+    out_vrt = build_tails_vrt(
+        files = files,
+        out_file = Path(out_file).with_suffix('.vrt'))
+
+    if vrt_only:
+        return out_vrt
+
+    print('Writing mosaic {}...'.format(out_file))
+    start = timeit.default_timer()
+    rasterio.shutil.copy(
+        out_vrt,
+        out_file,
+        driver = 'COG',
+        BLOCKSIZE = blocksize,
+        COMPRESS = compress,
+        OVERVIEWS = 'AUTO',
+        OVERVIEW_RESAMPLING = overview_resampling,
+        BIGTIFF = 'IF_SAFER',
+        NUM_THREADS = 'ALL_CPUS')
+    stop = timeit.default_timer()
+    print('Time: {:.2f}'.format(stop - start))
+
+    return Path(out_file)
+
+#----    get_mosaic_bands_stats    ----
+
+def get_mosaic_bands_stats(
+    file:Path,
+    geom_data:gpd.GeoDataFrame
+    ) -> pd.DataFrame:
+    """
+    For each band in the mosaic, get summary statistics (count, min, mean, and
+    max) of the pixels delimited by the buildings geom. Only the window around
+    each building is read, so no information about tails is required (see
+    mosaic_tails()).
+
+    Parameters
+    ----------
+    file:Path
+        Path to the mosaic (.tif or .vrt)
+    geom_data:gpd.GeoDataFrame
+        Data defining the buildings geometries (in the mosaic crs). Required
+        columns are 'COD_APE' indicating the building id
+
+    Return
+    ------
+    pd.DataFrame
+        Summary statistics (min, mean, and max) of each band. Returned
+        columns are formatted as '{name_band}_{stats}'. Puls, 'COD_APE' is used
+        to identify the buildings and 'count' indicates the number of pixels.
+    """
+    with rasterio.open(file) as src:
+        bands_available = src.descriptions
+
+    res = pd.DataFrame()
+    start = timeit.default_timer()
+    for i, name_band in zip(range(1, len(bands_available) + 1), bands_available):
+        print('Evaluating band {}'.format(name_band))
+        res_iter = pd.DataFrame(
+            rasterstats.zonal_stats(
+                vectors = geom_data,
+                raster = str(file),
+                band = i,
+                nodata = -999,
+                all_touched = False))
+        res_iter = res_iter.add_prefix(name_band + "_")
+        res = pd.concat([res, res_iter], axis = 1)
+    stop = timeit.default_timer()
+    print('Total Time: {:.2f}'.format(stop - start))
+
+    res = res.set_index(geom_data.index)
+    res = res.replace(-999, np.nan)
+    res.insert(0, 'COD_APE', geom_data['COD_APE'])
+
+    res.insert(1, 'count', res['AOT_count'])
+    to_drop =list(res.filter(regex=r'.+_count'))
+    res = res.drop(to_drop, axis = 1)
+
+    return res
+
 #----    test_shadow    ----
 
 def test_shadow(
@@ -1108,12 +1593,18 @@ def test_shadow(
     col_bands,
     val:int = 100):
     """
+    Test whether the buildings are covered by shadow, i.e., all the selected
+    bands are lower than the given value (see filter_utils.test_shadow()).
+
+    Returns
+    -------
+    pd.Series
+        Boolean series, True if the building is covered by shadow
     """
+    res = pd.Series(
+        filter_utils.test_shadow(data = data, col_bands = col_bands, val = val),
+        index = data.index)
 
-    test = data[col_bands].copy()
-    test = test.applymap(lambda x: x < val)
-    res = test.apply(lambda x: all(x), axis = 1)
-    
     return res
 
 
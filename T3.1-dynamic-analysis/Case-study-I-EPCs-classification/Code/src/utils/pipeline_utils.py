@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+
+#----    settings    ----
+
+import pandas as pd
+from pathlib import Path
+import os
+import sys
+import json
+import hashlib
+import subprocess
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+# Custom modules
+from src.utils import my_utils
+
+# Environment variable used to pass the stage parameters to the scripts
+PARAMS_ENV_VAR = 'MODERATE_PIPELINE_PARAMS'
+
+#----    get_params    ----
+
+def get_params(defaults:dict) -> dict:
+    """
+    Get the parameters of the script. Default values are updated with the
+    parameters passed by the pipeline (see run_pipeline()), if any. Scripts
+    run manually use the default values.
+
+    Parameters
+    ----------
+    defaults:dict
+        Dictionary with the default value of each parameter
+
+    Returns
+    -------
+    dict
+        Dictionary with the value of each parameter
+    """
+    res = dict(defaults)
+
+    params = json.loads(os.environ.get(PARAMS_ENV_VAR, '{}'))
+    unknown = set(params) - set(defaults)
+    if len(unknown) > 0:
+        raise ValueError('Unknown parameters: {}'.format(sorted(unknown)))
+    res.update(params)
+
+    return res
+
+#----    hash_path    ----
+
+def hash_path(
+    path:Path,
+    chunk_size:int = 2**20) -> str:
+    """
+    Compute the sha256 hash of the content of a file or, recursively, of all
+    files in a directory (including their relative paths). Shapefiles include
+    their sidecar files (e.g., .dbf, .shx, .prj). Missing paths return
+    'missing'.
+
+    Parameters
+    ----------
+    path:Path
+        Path to the file or directory
+    chunk_size:int
+        Number of bytes read at a time
+
+    Returns
+    -------
+    str
+        The hexadecimal hash
+    """
+    path = Path(path)
+    if not path.exists():
+        return 'missing'
+
+    if path.is_dir():
+        files = sorted([file for file in path.rglob('*') if file.is_file()])
+    elif path.suffix == '.shp':
+        files = sorted(path.parent.glob(path.stem + '.*'))
+    else:
+        files = [path]
+
+    sha = hashlib.sha256()
+    for file in files:
+        sha.update(str(file.relative_to(path) if path.is_dir() else file.name).encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha.update(chunk)
+
+    return sha.hexdigest()
+
+#----    get_stage_key    ----
+
+def get_stage_key(stage:dict) -> str:
+    """
+    Compute the key of a stage combining the hash of the script, of the
+    modules it imports ('code'), of the inputs, and of the parameters. If the
+    key does not change, the stage outputs are up to date.
+
+    Parameters
+    ----------
+    stage:dict
+        Dictionary with the stage definition (see run_pipeline())
+
+    Returns
+    -------
+    str
+        The hexadecimal key
+    """
+    info = {
+        'script':hash_path(stage['script']),
+        'code':[hash_path(path) for path in stage.get('code', [])],
+        'inputs':[hash_path(path) for path in stage.get('inputs', [])],
+        'params':stage.get('params', {})
+    }
+    res = hashlib.sha256(json.dumps(info, sort_keys = True, default = str).encode())
+
+    return res.hexdigest()
+
+#----    get_stages_dependencies    ----
+
+def get_stages_dependencies(stages:list) -> dict:
+    """
+    Get the stages each stage directly depends on. A stage depends on another
+    stage if any of its inputs is (or is within) an output of the other stage.
+
+    Parameters
+    ----------
+    stages:list
+        List of dictionaries with the stage definitions (see run_pipeline())
+
+    Returns
+    -------
+    dict
+        Dictionary with the stage name as key and the set of stage names it
+        depends on as value
+    """
+    def is_within(path, other):
+        path, other = Path(path).resolve(), Path(other).resolve()
+        return path == other or other in path.parents
+
+    res = {}
+    for stage in stages:
+        res[stage['name']] = set([
+            other['name'] for other in stages if other['name'] != stage['name'] and
+            any([is_within(input, output) for input in stage.get('inputs', [])
+                 for output in other.get('outputs', [])])
+            ])
+
+    return res
+
+#----    get_stages_levels    ----
+
+def get_stages_levels(stages:list) -> list:
+    """
+    Sort the stages in levels according to their dependencies (see
+    get_stages_dependencies()). Stages in the same level are independent and
+    can run in parallel.
+
+    Parameters
+    ----------
+    stages:list
+        List of dictionaries with the stage definitions (see run_pipeline())
+
+    Returns
+    -------
+    list
+        List of levels, each one is a list of stage names
+    """
+    dependencies = get_stages_dependencies(stages)
+
+    res = []
+    done = set()
+    while len(done) < len(stages):
+        level = [name for name, deps in dependencies.items()
+                 if name not in done and deps <= done]
+        if len(level) == 0:
+            raise ValueError('Issue sorting stages: circular dependencies among {}'\
+                .format(sorted(set(dependencies) - done)))
+        res.append(level)
+        done.update(level)
+
+    return res
+
+#----    run_stage    ----
+
+def run_stage(
+    stage:dict,
+    root:Path) -> dict:
+    """
+    Run the script of the stage in a separate process from the root of the
+    project. The stage parameters are passed as json through the environment
+    variable PARAMS_ENV_VAR (see get_params()).
+
+    Parameters
+    ----------
+    stage:dict
+        Dictionary with the stage definition (see run_pipeline())
+    root:Path
+        Path to the root of the project
+
+    Returns
+    -------
+    dict
+        Dictionary with 'stage', 'status' ('done' or 'failed'), and 'time'
+        (in seconds)
+    """
+    env = dict(os.environ)
+    env[PARAMS_ENV_VAR] = json.dumps(stage.get('params', {}))
+
+    print('Running stage {}...'.format(stage['name']))
+    start = timeit.default_timer()
+    process = subprocess.run(
+        [sys.executable, str(stage['script'])],
+        cwd = root,
+        env = env)
+    stop = timeit.default_timer()
+
+    status = 'done' if process.returncode == 0 else 'failed'
+    print('Stage {} {} (Time: {:.2f})'.format(stage['name'], status, stop - start))
+
+    return {'stage':stage['name'], 'status':status, 'time':stop - start}
+
+#----    run_pipeline    ----
+
+def run_pipeline(
+    stages:list,
+    root:Path,
+    cache_file:Path,
+    max_workers:int = 2,
+    force:list = None) -> pd.DataFrame:
+    """
+    Run the stages of the pipeline according to their dependencies. Stages
+    whose script, imported code, inputs, and parameters are unchanged since the last
+    successful run (and whose outputs exist) are skipped. Independent stages
+    run in parallel. Stages depending on failed stages are not run.
+
+    Each stage is defined by a dictionary with:
+    - name: unique name of the stage
+    - script: path to the script
+    - inputs: list of paths (files or directories) read by the script
+    - outputs: list of paths (files or directories) written by the script
+    - params: dictionary with the parameters passed to the script (optional)
+    - code: list of paths to the modules imported by the script, directly or
+      through other modules (optional). Only these modules are hashed, so
+      editing an unrelated module does not rerun the stage
+
+    The whole script is hashed, so stages running different parts of the same
+    script (e.g., 06-data_processing.py) are all rerun when any part of it
+    changes. Only the parameters of each stage are specific to its part.
+
+    Parameters
+    ----------
+    stages:list
+        List of dictionaries with the stage definitions
+    root:Path
+        Path to the root of the project (scripts are run from here)
+    cache_file:Path
+        Path to the .json file storing the stage keys. Timings of each run are
+        appended to a .csv file with the same name
+    max_workers:int
+        Maximum number of stages running in parallel
+    force:list
+        List of stage names to run even if up to date (default none)
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with columns 'run', 'stage', 'status' ('done', 'skipped',
+        'failed', or 'not_run'), and 'time' (in seconds)
+    """
+    if force is None:
+        force = []
+
+    cache_file = Path(cache_file)
+    if cache_file.exists():
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    else:
+        cache = {}
+
+    stages_dict = {stage['name']:stage for stage in stages}
+    dependencies = get_stages_dependencies(stages)
+    levels = get_stages_levels(stages)
+    run_id = my_utils.now_str()
+
+    records = []
+    failed = set()
+    for level in levels:
+        # Stages depending on failed stages are not run
+        upstream_failed = [
+            name for name in level if len(dependencies[name] & failed) > 0]
+        for name in upstream_failed:
+            records.append({'stage':name, 'status':'not_run', 'time':0})
+            failed.add(name)
+
+        # Keys are computed once the upstream stages are completed
+        keys = {}
+        to_run = []
+        for name in [name for name in level if name not in upstream_failed]:
+            stage = stages_dict[name]
+            keys[name] = get_stage_key(stage)
+            outputs_exist = all([Path(path).exists() for path in stage.get('outputs', [])])
+
+            if name not in force and cache.get(name) == keys[name] and outputs_exist:
+                print('Stage {} up to date, skipped'.format(name))
+                records.append({'stage':name, 'status':'skipped', 'time':0})
+            else:
+                to_run.append(stage)
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            results = list(executor.map(lambda x: run_stage(x, root), to_run))
+
+        for result in results:
+            records.append(result)
+            if result['status'] == 'done':
+                cache[result['stage']] = keys[result['stage']]
+            else:
+                cache.pop(result['stage'], None)
+                failed.add(result['stage'])
+
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent = 2)
+
+    res = pd.DataFrame(records, columns = ['stage', 'status', 'time'])
+    res.insert(0, 'run', run_id)
+
+    # Record stage timings of each run
+    timings_file = cache_file.with_suffix('.csv')
+    res.to_csv(timings_file, mode = 'a', header = not timings_file.exists(), index = False)
+
+    return res
+
+#=================
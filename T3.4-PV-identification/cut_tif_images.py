@@ -1,5 +1,6 @@
 import rasterio
-from rasterio.mask import mask
+from rasterio.transform import rowcol
+from rasterio.windows import Window
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -8,60 +9,129 @@ import os
 import rasterio
 from PIL import Image
 from shapely.geometry import box
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import deque
 import json
+import sys
+import time
 import tqdm
 
+sys.path.append(str(Path(__file__).parent / "solar-panel-classifier"))
+from solarnet.datasets.chip_store import ChipStore
+
 
 max_cpu_count = int(os.cpu_count() * 0.75)  # leave room for other processes
 CPU_COUNT = max(1, max_cpu_count)  # ensure 1 core at least
-OSM_IDS = []  # global variable to save the IDs to not save them twice in case the tifs overlap
-OSM_IDS_BELOW_45 = []
-
-
-def add_building_coordinates_to_json(df_filtered: pd.DataFrame) -> None:
-    """This function creates and saves a json file which contains the coordinates of every uilding downloaded from OSM and used in the analysis."""
-    # calculate lan and long and save them together with the osm id:
-    d = df_filtered.set_index("osmid").geometry.to_crs(epsg=32630) # UTM Zone 30N
-    centroids_projected = d.centroid
-    centroids = centroids_projected.to_crs(epsg=4326)
-
-    d = d.reset_index().set_index("osmid")
-    d.loc[:, "lat,lon"] = (centroids.y.astype(str) + "," + centroids.x.astype(str))
-    d.drop(columns="geometry", inplace=True)
-
-    dictionary = d.to_dict()["lat,lon"]
-    # load existing dict:
-    path_2_dict = Path(__file__).parent / "results" / "OSM_IDs_lat_lon.json"
-    if path_2_dict.exists():
-        with open(path_2_dict, "r") as f:
-            file = json.load(f)
-    else:
-        file = {}
-        (Path(__file__).parent / "results").mkdir(exist_ok=True)
-    
-    len_0 = len(file)
-    len_dict = len(dictionary)
-    file.update(dictionary)
-    # check if keys have been overwritten
-    if len_0 + len_dict != len(file):
-        assert "Dict keys have been overwritten! OMS ID was not unique or a building appeared in 2 different tif files."
-    # save updated json
-    with open(path_2_dict, "w") as f:
-        json.dump(file, f)
-    print("updated json file")
-
-
-def download_osm_building_shapes(source: str) -> pd.DataFrame:
-    """ downloads all building shapes that are within the bounds of the source"""
-    print(f"downloading osm data for {Path(source.name).name}...")
+BLOCK_SIZE = 2048  # side in pixels of the blocks read from the tif, buildings within the same block share one read
+MAX_PENDING_BLOCKS = 2  # number of blocks kept in memory while their chips are being saved
+PROCESSED_FOLDER = Path(__file__).parent / "solar-panel-classifier" / "new_data" / "processed"
+CHIP_STORE_FOLDER = PROCESSED_FOLDER / "chips"  # all chips are saved in a single chip store (see solarnet.datasets.ChipStore)
+OSM_ID_INDEX_FILE = Path(__file__).parent / "results" / "OSM_IDs_index.csv"
+BLACK_VALUE = 0  # pixels with all bands <= BLACK_VALUE are considered black (nodata)
+MAX_BLACK_FRACTION = 1.0  # chips with at least this fraction of black pixels are not saved (1.0 = only completely black chips)
+BUILDING_COORDINATES_FILE = Path(__file__).parent / "results" / "OSM_IDs_lat_lon.jsonl"
+LEGACY_BUILDING_COORDINATES_FILE = Path(__file__).parent / "results" / "OSM_IDs_lat_lon.json"
+
+
+class OsmIdIndex:
+    """ records which tif every OSM ID has been assigned to, to not save the buildings twice in case the tifs overlap.
+    The index is kept in memory (dictionary, O(1) lookup per ID) and every new ID is appended to a csv file, so
+    the index persists between runs and reprocessing a subset of the tifs is incremental.
+    IDs are recorded per category (e.g. "used" or "below_45"), as the same ID can not be in two categories."""
+
+    def __init__(self, path: Path = OSM_ID_INDEX_FILE):
+        self.path = path
+        self.tifs = {}  # osmid -> tif
+        self.categories = {}  # osmid -> category
+        if self.path.exists():
+            index = pd.read_csv(self.path, sep=";")
+            self.tifs = dict(zip(index["osmid"], index["tif"]))
+            self.categories = dict(zip(index["osmid"], index["category"]))
+
+    def claim(self, osmids, tif: str, category: str = "used") -> np.ndarray:
+        """ assigns the IDs not yet in the index to the tif. Returns a boolean array, True for the IDs assigned
+        to this tif (new ones or assigned to the same tif in a previous run), False for the ones of other tifs."""
+        keep = np.zeros(len(osmids), dtype=bool)
+        new_ids = []
+        for i, osmid in enumerate(osmids):
+            owner = self.tifs.get(osmid)
+            if owner is None:
+                self.tifs[osmid] = tif
+                self.categories[osmid] = category
+                new_ids.append(osmid)
+            keep[i] = owner is None or owner == tif
+
+        if len(new_ids) > 0:
+            self.path.parent.mkdir(exist_ok=True)
+            pd.DataFrame({"osmid": new_ids, "tif": tif, "category": category}).to_csv(
+                self.path, sep=";", index=False, mode="a", header=not self.path.exists())
+        return keep
+
+    def count(self, category: str) -> int:
+        """ number of IDs of the category"""
+        return sum(1 for value in self.categories.values() if value == category)
+
+
+class BuildingCoordinates:
+    """ append-only store of the coordinates (lat, lon of the centroid) of every building downloaded from OSM and used
+    in the analysis, saved as a json-lines file (one building per line). Every batch of buildings is appended with a
+    single write, so the file is never rewritten and concurrent runs do not overwrite each other.
+    Coordinates saved by previous versions in a single json file (osmid -> "lat,lon") are read as well."""
+
+    def __init__(self, path: Path = BUILDING_COORDINATES_FILE, legacy_path: Path = LEGACY_BUILDING_COORDINATES_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+
+    def append(self, df_filtered: pd.DataFrame) -> None:
+        """ computes the centroid of the buildings (osmid and geometry columns) and appends their coordinates"""
+        if df_filtered.empty:
+            return None
+        # calculate lan and long and save them together with the osm id:
+        centroids_projected = df_filtered.geometry.to_crs(epsg=32630).centroid  # UTM Zone 30N
+        centroids = centroids_projected.to_crs(epsg=4326)
+
+        lines = pd.DataFrame({
+            "osmid": df_filtered["osmid"].values,
+            "lat": centroids.y.values,
+            "lon": centroids.x.values,
+        }).to_json(orient="records", lines=True, double_precision=15)
+        if not lines.endswith("\n"):
+            lines += "\n"
+
+        self.path.parent.mkdir(exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(lines)
+        print(f"saved coordinates of {len(df_filtered)} buildings")
+
+    def lookup(self, osmids) -> pd.DataFrame:
+        """ returns the coordinates of the buildings as a dataframe with index osmid and columns lat, lon (NaN if unknown).
+        If a building has been saved more than once, the last coordinates are used."""
+        coordinates = [pd.DataFrame(columns=["osmid", "lat", "lon"])]
+        if self.legacy_path.exists():
+            with open(self.legacy_path, "r") as f:
+                legacy = pd.Series(json.load(f))
+            lat_lon = legacy.str.split(",", expand=True).astype(float)
+            coordinates.append(pd.DataFrame({"osmid": legacy.index.astype("int64"), "lat": lat_lon[0].values, "lon": lat_lon[1].values}))
+        if self.path.exists():
+            coordinates.append(pd.read_json(self.path, lines=True, dtype={"osmid": "int64"}))
+
+        coordinates = pd.concat(coordinates, ignore_index=True).drop_duplicates("osmid", keep="last")
+        coordinates = coordinates.astype({"osmid": "int64", "lat": float, "lon": float})
+        return coordinates.set_index("osmid").reindex(pd.Index(osmids, dtype="int64", name="osmid"))
+
+
+def download_osm_building_shapes(source: str, osm_index: OsmIdIndex, coordinates: BuildingCoordinates) -> pd.DataFrame:
+    """ downloads all building shapes that are within the bounds of the source. Buildings already assigned to another
+    tif in the osm_index are skipped. The coordinates of the buildings are saved."""
+    tif_name = Path(source.name).name
+    print(f"downloading osm data for {tif_name}...")
     bounds = source.bounds
     polygon = box(bounds.left, bounds.bottom, bounds.right, bounds.top)
     polygon_wgs84 = ox.projection.project_geometry(polygon, crs=source.crs, to_crs='EPSG:4326')[0]
     try:
         buildings = ox.features_from_polygon(polygon=polygon_wgs84, tags={"building": True})
     except ox._errors.InsufficientResponseError:
-        print(f"no building data found for {Path(source.name).name}")
+        print(f"no building data found for {tif_name}")
         return pd.DataFrame()
     
     areas = buildings.to_crs(epsg=3857).area
@@ -70,136 +140,278 @@ def download_osm_building_shapes(source: str) -> pd.DataFrame:
     df["area"] = areas
     # save the IDs that are excluded because they are smaller than 45m^2 to know later how many were excluded in total
     df_below_45 = df.loc[df["area"] <= 45, :].copy().reset_index()
-    ids_not_used_below_45 = list(set(list(df_below_45["osmid"])) - set(OSM_IDS_BELOW_45))
-    OSM_IDS_BELOW_45.extend(ids_not_used_below_45)
+    osm_index.claim(df_below_45["osmid"].values, tif_name, category="below_45")
 
     df_filtered = df.loc[df["area"] > 45, :].copy().reset_index()
     # filter out the IDS that have already been saved because the tifs are overlapping:
-    ids_not_used = list(set(list(df_filtered["osmid"])) - set(OSM_IDS))
-    df_id_filtered = df_filtered[df_filtered["osmid"].isin(ids_not_used)].copy()
-    print(f"{len(df_filtered) - len(ids_not_used)} ids are already in the dataset and are skipped")
-    OSM_IDS.extend(ids_not_used)
+    keep = osm_index.claim(df_filtered["osmid"].values, tif_name, category="used")
+    df_id_filtered = df_filtered[keep].copy()
+    print(f"{(~keep).sum()} ids are already in the dataset and are skipped")
 
     # save the building coordinates:
-    add_building_coordinates_to_json(df_id_filtered)
+    coordinates.append(df_id_filtered)
 
     # df_filtered.to_file(Path(__file__).parent / "solar-panel-classifier" / "new_data" / f'{Path(source.name).name.replace(".tif", "")}.gpkg', driver="GPKG")
-    return df_filtered
-
-
-def cut_tif(processed_folder, building, src, orig_file, imsize, save_png):
-    """ cuts avery building polygon as image from the tif file, resizes it and saves it as numpy file"""
-    # Mask the image using the building polygon
-    image_path = processed_folder / f"building_{building.osmid}.npy"
-    if image_path.exists():
-        return None
-
-    try:
-        out_image, out_transform = mask(src, [building["geometry"]], crop=True)
-    except Exception as e:
-        print(f"building {building.osmid} out of bounds. {e}")
-        return None
-    
-    # Calculate bounds for a 224x224 window around the centroid
-    # centroid = building["geometry"].centroid
-    bounds = building['geometry'].bounds
-    min_px, min_py = src.index(bounds[0], bounds[1])  # minx, miny
-    max_px, max_py = src.index(bounds[2], bounds[3]) 
-    # if min and max are change - swap them
-    if min_px > max_px:
-        min_px, max_px = max_px, min_px
-
-    if min_py > max_py:
-        min_py, max_py = max_py, min_py
-
-    # Ensure the pixel coordinates are within image bounds
-    px_min = max(0, min_px)
-    px_max = min(orig_file.shape[1], max_px)
-    py_min = max(0, min_py)
-    py_max = min(orig_file.shape[2], max_py)
-    
-    clipped_orgfile = orig_file[:3, int(px_min):int(px_max), int(py_min):int(py_max)]  # CAREFUL, this is writte for RGBI images, cutting the infrared part
+    return df_id_filtered
+
+
+def get_building_windows(buildings: pd.DataFrame, src) -> pd.DataFrame:
+    """ computes the pixel window (row_min, row_max, col_min, col_max) of every building bounding box (minx, miny, maxx, maxy),
+    clipped to the tif bounds. Buildings outside of the tif get an empty window."""
+    bounds = buildings.geometry.bounds
+    rows_bottom, cols_west = rowcol(src.transform, bounds["minx"].values, bounds["miny"].values)
+    rows_top, cols_east = rowcol(src.transform, bounds["maxx"].values, bounds["maxy"].values)
+    rows_bottom, cols_west = np.asarray(rows_bottom), np.asarray(cols_west)
+    rows_top, cols_east = np.asarray(rows_top), np.asarray(cols_east)
+
+    windows = pd.DataFrame({
+        "osmid": buildings["osmid"].values,
+        "minx": bounds["minx"].values,
+        "miny": bounds["miny"].values,
+        "maxx": bounds["maxx"].values,
+        "maxy": bounds["maxy"].values,
+        "row_min": np.clip(np.minimum(rows_bottom, rows_top), 0, src.height),
+        "row_max": np.clip(np.maximum(rows_bottom, rows_top), 0, src.height),
+        "col_min": np.clip(np.minimum(cols_west, cols_east), 0, src.width),
+        "col_max": np.clip(np.maximum(cols_west, cols_east), 0, src.width),
+    }, index=buildings.index)
+    return windows
+
+
+def get_block_ids(windows: pd.DataFrame, width: int, block_size: int) -> pd.Series:
+    """ assigns every building window to a block of block_size x block_size pixels (by its top left corner).
+    Block ids are sorted row by row, so consecutive ids are spatially close."""
+    return (windows["row_min"] // block_size) * (width // block_size + 1) + windows["col_min"] // block_size
+
+
+def iter_building_blocks(windows: pd.DataFrame, src, block_size: int):
+    """ groups the building windows into blocks of block_size x block_size pixels and yields every block as
+    (windows of the block, array with the RGB bands of the block, row offset, col offset).
+    Only one window per block is read from the tif, so memory does not depend on the tif size."""
+    block_ids = get_block_ids(windows, src.width, block_size)
+    for _, block_windows in windows.groupby(block_ids, sort=True):
+        row_off, col_off = block_windows["row_min"].min(), block_windows["col_min"].min()
+        height = block_windows["row_max"].max() - row_off
+        width = block_windows["col_max"].max() - col_off
+        # CAREFUL, this is written for RGBI images, cutting the infrared part
+        block = src.read(indexes=[1, 2, 3], window=Window(col_off, row_off, width, height))
+        yield block_windows, block, row_off, col_off
+
+
+def cut_tif(building, block, row_off, col_off, imsize) -> np.ndarray:
+    """ cuts the building bounding box out of the block read from the tif file and returns it resized"""
+    clipped_orgfile = block[:, building.row_min - row_off:building.row_max - row_off, building.col_min - col_off:building.col_max - col_off]
 
     # Convert to PIL Image, resize, then convert back to NumPy array
     img = np.moveaxis(clipped_orgfile, 0, -1)  # Rearrange (bands, x, y) to (x, y, bands)
     img = Image.fromarray(img.astype('uint8'))  # Convert to unsigned 8-bit integer format
     img_resized = img.resize((imsize, imsize), Image.LANCZOS)
     clipped_orgfile = np.moveaxis(np.array(img_resized), -1, 0) 
-    
-    np.save(processed_folder / f'building_{building.osmid}.npy', clipped_orgfile)
+    return clipped_orgfile
 
-    # to check the images:
-    if save_png:
-        img_resized.save(processed_folder/ "unlabelled" / f"building_{building.osmid}.png")
+
+def is_black(chips: np.ndarray, black_value: int = BLACK_VALUE, max_black_fraction: float = MAX_BLACK_FRACTION) -> np.ndarray:
+    """ checks which chips (n, bands, height, width) are black: True if the fraction of pixels with all bands <= black_value
+    is at least max_black_fraction"""
+    black_pixels = (chips <= black_value).all(axis=1)
+    return black_pixels.mean(axis=(1, 2)) >= max_black_fraction
 
 
-def cut_tif_into_building_photos(buildings, src, imsize: int, save_png: bool):
+def save_chips(chip_store: ChipStore, block_windows: pd.DataFrame, chips: list, tif_name: str, save_png: bool = False,
+               black_value: int = BLACK_VALUE, max_black_fraction: float = MAX_BLACK_FRACTION) -> int:
+    """ appends the chips of a block to the chip store together with the building osmid and bounding box.
+    Black chips (see is_black) are not saved. Returns the number of black chips."""
+    chips = np.stack(chips)
+    keep = ~is_black(chips, black_value, max_black_fraction)
+    chip_store.append(
+        chips[keep],
+        osmids=block_windows["osmid"].values[keep],
+        tif=tif_name,
+        bboxes=block_windows[["minx", "miny", "maxx", "maxy"]].values[keep]
+    )
+
+    # to check the images:
+    if save_png:
+        png_folder = chip_store.folder.parent / "unlabelled"
+        png_folder.mkdir(exist_ok=True)
+        for osmid, chip in zip(block_windows["osmid"].values[keep], chips[keep]):
+            Image.fromarray(np.moveaxis(chip, 0, -1)).save(png_folder / f"building_{osmid}.png")
+    return int((~keep).sum())
+
+
+def split_into_shards(windows: pd.DataFrame, width: int, block_size: int, n_shards: int) -> list:
+    """ splits the building windows into spatial shards, each one made of consecutive blocks (see get_block_ids) with
+    about the same number of buildings. Buildings of the same block are always in the same shard."""
+    block_ids = get_block_ids(windows, width, block_size)
+    block_sizes = block_ids.value_counts().sort_index()
+    shard_of_block = pd.Series(
+        np.minimum(block_sizes.cumsum().values * n_shards // (len(windows) + 1), n_shards - 1),
+        index=block_sizes.index
+    )
+    shards = [shard for _, shard in windows.groupby(block_ids.map(shard_of_block).values)]
+    return shards
+
+
+def cut_shard(tif_path: Path, windows: pd.DataFrame, processed_folder: Path, imsize: int, save_png: bool, block_size: int,
+              black_value: int = BLACK_VALUE, max_black_fraction: float = MAX_BLACK_FRACTION) -> dict:
+    """ cuts the buildings of a shard in a worker process. Every worker opens its own handle to the tif and to the chip store.
+    Returns the worker timing and the number of black chips skipped."""
+    start = time.perf_counter()
+    time_read = 0
+    n_blocks = 0
+    n_black = 0
+    chip_store = ChipStore(processed_folder / CHIP_STORE_FOLDER.name, imsize=imsize)
+    with rasterio.open(tif_path) as src:
+        blocks = iter_building_blocks(windows, src, block_size)
+        while True:
+            start_read = time.perf_counter()
+            block_data = next(blocks, None)
+            time_read += time.perf_counter() - start_read
+            if block_data is None:
+                break
+            block_windows, block, row_off, col_off = block_data
+            n_blocks += 1
+            chips = [cut_tif(building, block, row_off, col_off, imsize) for building in block_windows.itertuples()]
+            n_black += save_chips(chip_store, block_windows, chips, Path(tif_path).name, save_png, black_value, max_black_fraction)
+
+    time_total = time.perf_counter() - start
+    return {"pid": os.getpid(), "n_buildings": len(windows), "n_blocks": n_blocks, "n_black": n_black,
+            "time_read": time_read, "time_cut": time_total - time_read, "time_total": time_total}
+
+
+def cut_tif_into_building_photos(buildings, src, imsize: int, save_png: bool, block_size: int = BLOCK_SIZE,
+                                 mode: str = "thread", n_workers: int = CPU_COUNT, black_value: int = BLACK_VALUE,
+                                 max_black_fraction: float = MAX_BLACK_FRACTION) -> dict:
+    """ cuts the buildings out of the tif and appends them to the chip store, skipping black chips (see is_black).
+    With mode "thread" the tif is read block by block in the main process while a thread pool resizes the chips.
+    With mode "process" the buildings are split into spatial shards cut by a pool of n_workers processes, each one with
+    its own handle to the tif. Returns a summary with the number of buildings cut and black chips skipped."""
     # create folders:
-    processed_folder = Path(__file__).parent / "solar-panel-classifier" / "new_data" / "processed" 
+    processed_folder = PROCESSED_FOLDER
     processed_folder.mkdir(parents=True, exist_ok=True)
-
-    # cut out the buildings from the photos:
-    orig_file = src.read()
+    chip_store = ChipStore(CHIP_STORE_FOLDER, imsize=imsize)
+    tif_name = Path(src.name).name
+
+    # skip the buildings that have already been cut and the ones outside of the tif:
+    windows = get_building_windows(buildings, src)
+    exists = chip_store.contains(windows["osmid"].values)
+    empty = ((windows["row_max"] <= windows["row_min"]) | (windows["col_max"] <= windows["col_min"])).values
+    if empty.any():
+        print(f"{empty.sum()} buildings out of bounds of {tif_name}")
+    windows = windows.loc[~exists & ~empty, :]
+    summary = {"tif": tif_name, "n_buildings": len(windows), "n_black": 0}
+    if windows.empty:
+        return summary
 
     print("cutting rooftop pics out of tif...")
-    with ThreadPoolExecutor(max_workers=CPU_COUNT) as executor:   
-        cut_tasks = [executor.submit(cut_tif, processed_folder, building, src, orig_file, imsize, save_png) for _, building in buildings.iterrows()]
-        for future in as_completed(cut_tasks):
-            future.result() 
-        
+    if mode == "process":
+        # more shards than workers to balance the load between workers
+        shards = split_into_shards(windows, src.width, block_size, n_shards=n_workers * 4)
+        timings = []
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            cut_tasks = [executor.submit(cut_shard, Path(src.name), shard, processed_folder, imsize, save_png, block_size, black_value, max_black_fraction) for shard in shards]
+            with tqdm.tqdm(total=len(windows), unit="building") as progress:
+                for future in as_completed(cut_tasks):
+                    timings.append(future.result())
+                    progress.update(timings[-1]["n_buildings"])
+
+        timings = pd.DataFrame(timings).groupby("pid").sum()
+        summary["n_black"] = int(timings["n_black"].sum())
+        timings["buildings_per_s"] = timings["n_buildings"] / timings["time_total"]
+        print(f"timing per worker:\n{timings.round(2)}")
+
+    elif mode == "thread":
+        # cut out the buildings reading the tif block by block, while the chips of the previous blocks are resized.
+        # The number of blocks in memory is limited to keep memory bounded:
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            for block_windows, block, row_off, col_off in iter_building_blocks(windows, src, block_size):
+                pending.append((block_windows, [executor.submit(cut_tif, building, block, row_off, col_off, imsize) for building in block_windows.itertuples()]))
+                while len(pending) > MAX_PENDING_BLOCKS:
+                    block_windows, cut_tasks = pending.popleft()
+                    summary["n_black"] += save_chips(chip_store, block_windows, [future.result() for future in cut_tasks], tif_name,
+                                                     save_png, black_value, max_black_fraction)
+            for block_windows, cut_tasks in pending:
+                summary["n_black"] += save_chips(chip_store, block_windows, [future.result() for future in cut_tasks], tif_name,
+                                                 save_png, black_value, max_black_fraction)
 
-def is_black(file_path: Path):
-    try:
-        img_array = np.load(file_path)
-        
-        # Check if all the pixels are black
-        if np.all(img_array == 0):
-            # If the image is black, delete it
-            os.remove(file_path)
-            png_path = file_path.parent / "unlabelled" / file_path.name.replace(".npy", ".png") # also delete corresponding png file if exists
-            if png_path.exists():
-                os.remove(png_path)
-                
-            print(f"Removed black image: {file_path.name}")
-
-    except Exception as e:
-        print(f"Error processing {file_path.name}: {e}")
+    else:
+        raise ValueError(f"mode {mode} not supported, use 'thread' or 'process'")
 
+    print(f"{summary['n_black']} black chips of {tif_name} skipped")
+    return summary
+        
 
-def remove_black_images(image_folder: Path):
+def remove_black_images(chip_store: ChipStore, osmids=None, batch_size: int = 1024, black_value: int = BLACK_VALUE,
+                        max_black_fraction: float = MAX_BLACK_FRACTION):
     """
-    This function checks each image in the folder and removes the black images.
+    This function checks the chips in the chip store and removes the black images from the store, together with their
+    png and .npy files. Chips cut by cut_tif_into_building_photos are checked before being saved, this is only needed
+    for chips imported from previous versions (see import_legacy_chips).
     
     Args:
-    image_folder (str): Path to the folder containing the images.
+    chip_store (ChipStore): The store containing the chips.
+    osmids (array-like, optional): The osmids of the chips to check, all the chips if None.
+    batch_size (int): The number of chips checked at a time.
     """
-    # Get all PNG files in the folder
-    files = [f for f in image_folder.iterdir() if f.name.endswith('.npy')]
-    with ThreadPoolExecutor(max_workers=CPU_COUNT) as executor:       
-        remove_tasks = [executor.submit(is_black, file_path) for file_path in files]
-        for future in as_completed(remove_tasks):
-            future.result()
-
-
-def main(save_png: bool=False):
+    index = chip_store.get_index()
+    if osmids is not None:
+        index = index[index["osmid"].isin(osmids)]
+    for i in range(0, len(index), batch_size):
+        batch = index.iloc[i:i + batch_size]
+        chips = chip_store.get_chips(batch["position"].values)
+        black_ids = batch["osmid"].values[is_black(chips, black_value, max_black_fraction)]
+        chip_store.remove(black_ids)
+        for osmid in black_ids:
+            # also delete corresponding png and numpy files if they exist, so they are not imported again
+            for path in [PROCESSED_FOLDER / "unlabelled" / f"building_{osmid}.png", PROCESSED_FOLDER / f"building_{osmid}.npy"]:
+                if path.exists():
+                    os.remove(path)
+            print(f"Removed black image: building_{osmid}")
+
+
+def import_legacy_chips(imsize: int = 224):
+    """ imports the chips saved as one building_<osmid>.npy file per building by previous versions into the chip store,
+    so these buildings are not cut again, and removes the black ones (previous versions only removed them at the end)."""
+    files = sorted(PROCESSED_FOLDER.glob("building_*.npy"))
+    if len(files) == 0:
+        return
+    chip_store = ChipStore(CHIP_STORE_FOLDER, imsize=imsize)
+    osmids = np.array([int(f.stem.replace("building_", "").split("_")[0]) for f in files], dtype=np.int64)
+    new_osmids = osmids[~chip_store.contains(osmids)]
+    chip_store.import_npy_files(files)
+    print(f"imported {len(new_osmids)} numpy files from {PROCESSED_FOLDER}")
+    remove_black_images(chip_store, osmids=new_osmids)
+
+
+def main(save_png: bool=False, mode: str="process"):
     tif_folder = Path(__file__).parent / "solar-panel-classifier" / "new_data" / "input_tifs"
     input_tifs =  [f for f in tif_folder.iterdir() if f.suffix == ".tif"]
 
+    # buildings cut by previous versions (one .npy file each) are not cut again:
+    import_legacy_chips(imsize=224)
+
+    osm_index = OsmIdIndex()
+    coordinates = BuildingCoordinates()
+    summaries = []
     for file in tqdm.tqdm(input_tifs):
         src = rasterio.open(file)
-        buildings = download_osm_building_shapes(src)
+        buildings = download_osm_building_shapes(src, osm_index, coordinates)
         if buildings.empty:
             continue
         buildings.reset_index(inplace=True)
 
         if src.crs != buildings.crs:
             buildings = buildings.to_crs(src.crs)
-        cut_tif_into_building_photos(buildings=buildings, src=src, imsize=224, save_png=save_png)
+        summaries.append(cut_tif_into_building_photos(buildings=buildings, src=src, imsize=224, save_png=save_png, mode=mode))
 
-    # some images are just black, remove them
-    remove_black_images(image_folder=Path(__file__).parent / "solar-panel-classifier" / "new_data" /"processed")
+    # some images are just black, they are not saved:
+    if len(summaries) > 0:
+        summaries = pd.DataFrame(summaries)
+        print(f"black chips skipped per tif:\n{summaries.to_string(index=False)}")
+        summaries.to_csv(Path(__file__).parent / "results" / "black_chips_skipped.csv", sep=";", index=False)
 
-    print(f"{len(OSM_IDS_BELOW_45)} building shapes excluded because their ground are is below 45m^2")  
+    print(f"{osm_index.count('below_45')} building shapes excluded because their ground are is below 45m^2")  
 
 
 if __name__ =="__main__":
@@ -0,0 +1,118 @@
+"""Benchmark of the metadata parsing of MaskMaker and ImageSplitter against the previous
+row by row (iterrows) implementations, checking that they give the same dictionaries.
+
+Uses data/metadata if it exists, else synthetic metadata of the same size (about 20,000
+polygons with up to 50 vertices over 600 images).
+
+Run from the solar-panel-classifier folder: python benchmarks/metadata.py [data folder]
+"""
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+from solarnet.preprocessing import MaskMaker, ImageSplitter  # noqa: E402
+
+N_POLYGONS = 20000
+MAX_VERTICES = 50
+N_IMAGES = 600
+
+
+def make_metadata(data_folder: Path) -> None:
+    """Synthetic metadata files, with the columns of the real ones"""
+    rng = np.random.default_rng(0)
+    n_vertices = rng.integers(3, MAX_VERTICES + 1, N_POLYGONS)
+    vertices = {'polygon_id': np.arange(N_POLYGONS), 'number_vertices': n_vertices}
+    for i in range(1, MAX_VERTICES + 1):
+        for name in ['lat', 'lon']:
+            vertices[f'{name}{i}'] = np.where(i <= n_vertices, rng.uniform(0, 5000, N_POLYGONS), np.nan)
+
+    images = rng.integers(0, N_IMAGES, N_POLYGONS)
+    data = pd.DataFrame({'polygon_id': np.arange(N_POLYGONS),
+                         'city': np.array(['Fresno', 'Modesto', 'Oxnard', 'Stockton'])[images % 4],
+                         'image_name': [f'image_{image}' for image in images],
+                         'jaccard_index': 0.9,
+                         'centroid_latitude_pixels': rng.uniform(0, 5000, N_POLYGONS),
+                         'centroid_longitude_pixels': rng.uniform(0, 5000, N_POLYGONS)})
+
+    (data_folder / 'metadata').mkdir(parents=True)
+    pd.DataFrame(vertices).to_csv(data_folder / 'metadata/polygonVertices_PixelCoordinates.csv', index=False)
+    data.to_csv(data_folder / 'metadata/polygonDataExceptVertices.csv', index=False)
+
+
+def previous_polygon_pixels(polygon_pixels: pd.DataFrame) -> dict:
+    output_dict = {}
+    for idx, row in polygon_pixels.iterrows():
+        vertices = []
+        for i in range(1, int(row.number_vertices) + 1):
+            vertices.append((row[f"lat{i}"], row[f"lon{i}"]))
+        output_dict[int(row.polygon_id)] = vertices
+    return output_dict
+
+
+def previous_image_names(polygon_images: pd.DataFrame) -> defaultdict:
+    output_dict: defaultdict = defaultdict(lambda: defaultdict(list))
+    for idx, row in polygon_images.iterrows():
+        output_dict[row.city][row.image_name].append(int(row.polygon_id))
+    return output_dict
+
+
+def previous_centroids(metadata: pd.DataFrame) -> defaultdict:
+    output_dict: defaultdict = defaultdict(lambda: defaultdict(set))
+    for idx, row in metadata.dropna().iterrows():
+        output_dict[row.city][row.image_name].add((
+            row.centroid_latitude_pixels, row.centroid_longitude_pixels
+        ))
+    return output_dict
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(data_folder: Path):
+    vertices = pd.read_csv(data_folder / 'metadata/polygonVertices_PixelCoordinates.csv')
+    data = pd.read_csv(data_folder / 'metadata/polygonDataExceptVertices.csv')
+    print(f'{len(vertices)} polygons, {data["image_name"].nunique()} images')
+
+    results = []
+    previous, previous_s = measure(previous_polygon_pixels, vertices)
+    new, new_s = measure(MaskMaker._csv_to_dict_polygon_pixels, vertices)
+    assert previous.keys() == new.keys()
+    assert all(np.array_equal(np.array(previous[key]).reshape(-1, 2), new[key], equal_nan=True)
+               for key in previous)
+    results.append({'parser': 'polygon pixels', 'previous_s': previous_s, 'new_s': new_s})
+
+    image_columns = data[['polygon_id', 'city', 'image_name', 'jaccard_index']]
+    previous, previous_s = measure(previous_image_names, image_columns)
+    new, new_s = measure(MaskMaker._csv_to_dict_image_names, image_columns)
+    assert {city: dict(images) for city, images in previous.items()} == \
+        {city: dict(images) for city, images in new.items()}
+    results.append({'parser': 'image names', 'previous_s': previous_s, 'new_s': new_s})
+
+    centroid_columns = data[['city', 'image_name', 'centroid_latitude_pixels', 'centroid_longitude_pixels']]
+    previous, previous_s = measure(previous_centroids, centroid_columns)
+    new, new_s = measure(ImageSplitter(data_folder).read_centroids)
+    assert {city: dict(images) for city, images in previous.items()} == \
+        {city: dict(images) for city, images in new.items()}
+    results.append({'parser': 'centroids (with reading the csv)', 'previous_s': previous_s, 'new_s': new_s})
+
+    results = pd.DataFrame(results)
+    results['speedup'] = results['previous_s'] / results['new_s']
+    print(results.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(Path(sys.argv[1]))
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            make_metadata(Path(folder))
+            main(Path(folder))
@@ -0,0 +1,48 @@
+"""Micro-benchmark of solarnet.datasets.utils.normalize against the previous
+float64 implementation, on single 224x224 images and batches of 64 images.
+
+Run from the solar-panel-classifier folder: python benchmarks/normalize.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+sys.path.append(str(Path(__file__).parent.parent))
+from solarnet.datasets.utils import normalize, MEAN, STD  # noqa: E402
+
+
+def normalize_float64(image: np.ndarray) -> np.ndarray:
+    """The previous implementation of normalize"""
+    image = image / 255
+    source, dest = 0 if len(image.shape) == 3 else 1, -1
+    return np.moveaxis((np.moveaxis(image, source, dest) - MEAN) / STD, dest, source)
+
+
+def measure(function, image, number: int = 20, repeat: int = 5) -> float:
+    """The best time per call, in milliseconds"""
+    return min(timeit.repeat(lambda: function(image), number=number, repeat=repeat)) / number * 1000
+
+
+def main():
+    results = []
+    for name, shape in [("image", (3, 224, 224)), ("batch", (64, 3, 224, 224))]:
+        image = np.random.randint(0, 255, size=shape, dtype=np.uint8)
+        functions = {
+            "float64 (previous)": lambda x: torch.as_tensor(normalize_float64(x)).float(),
+            "float32 numpy": lambda x: torch.as_tensor(normalize(x)),
+            "float32 torch": lambda x: normalize(torch.as_tensor(x)),
+        }
+        for function_name, function in functions.items():
+            results.append({"input": name, "function": function_name, "ms": measure(function, image)})
+
+    results = pd.DataFrame(results)
+    results["speedup"] = results.groupby("input")["ms"].transform("first") / results["ms"]
+    print(results.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark of the classifier training loop (solarnet.models.train_funcs) on a synthetic
+dataset, against the previous loop, which created a new Adam optimizer every epoch and
+kept a reference to the (still trained) weights instead of a copy of the best ones.
+
+Reports, for every loop, the number of epochs and the time to reach a validation AUC of
+`TARGET_AUC`, the best validation AUC and the validation AUC of the weights loaded at the end.
+
+Run from the solar-panel-classifier folder: python benchmarks/train.py
+"""
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from torch import nn
+from sklearn.metrics import roc_auc_score
+
+sys.path.append(str(Path(__file__).parent.parent))
+from solarnet.datasets import ChipStore, ClassifierDataset, DeviceDataLoader  # noqa: E402
+from solarnet.models import train_funcs  # noqa: E402
+
+IMSIZE = 32
+N_IMAGES = 2000
+MAX_EPOCHS = 20
+TARGET_AUC = 0.75
+
+
+class SmallClassifier(nn.Module):
+    """A small CNN with a `pretrained` base and a `classifier` head, like Classifier"""
+    def __init__(self):
+        super().__init__()
+        self.pretrained = nn.Sequential(nn.Conv2d(3, 16, 3, padding=1), nn.ReLU(), nn.MaxPool2d(2),
+                                        nn.Conv2d(16, 32, 3, padding=1), nn.ReLU(), nn.AdaptiveAvgPool2d(4))
+        self.classifier = nn.Sequential(nn.Flatten(), nn.Linear(32 * 16, 1), nn.Sigmoid())
+
+    def forward(self, x):
+        return self.classifier(self.pretrained(x))
+
+
+def make_chip_store(folder: Path) -> None:
+    """Random images, where the images labelled 1 have a faint bright square"""
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, N_IMAGES)
+    chips = rng.integers(0, 200, size=(N_IMAGES, 3, IMSIZE, IMSIZE), dtype=np.uint8)
+    chips[labels == 1, :, 8:14, 8:14] += 12
+    store = ChipStore(folder / 'chips', imsize=IMSIZE)
+    store.append(chips, osmids=range(N_IMAGES), labels=labels)
+    store.set_splits(range(N_IMAGES), np.where(np.arange(N_IMAGES) < 0.8 * N_IMAGES, 'train', 'val'))
+
+
+def previous_train_classifier(model, train_dataloader, val_dataloader, warmup=2, patience=5,
+                              max_epochs=100, **kwargs):
+    """The previous training loop"""
+    best_state_dict = model.state_dict()
+    best_val_auc_roc = 0.5
+    patience_counter = 0
+    for i in range(max_epochs):
+        if i <= warmup:
+            optimizer = torch.optim.Adam([pam for name, pam in
+                                          model.named_parameters() if 'classifier' in name])
+        else:
+            optimizer = torch.optim.Adam(model.parameters())
+        val_auc = train_funcs._train_classifier_epoch(model, optimizer, train_dataloader, val_dataloader)
+        if val_auc > best_val_auc_roc:
+            best_val_auc_roc = val_auc
+            patience_counter = 0
+            best_state_dict = model.state_dict()
+        else:
+            patience_counter += 1
+            if patience_counter == patience:
+                model.load_state_dict(best_state_dict)
+                return
+
+
+def evaluate(model, dataloader) -> float:
+    model.eval()
+    with torch.no_grad():
+        preds, true = zip(*[(model(x).squeeze(1).numpy(), y.numpy()) for x, y in dataloader])
+    return roc_auc_score(np.concatenate(true), np.concatenate(preds))
+
+
+def run(train_function, train_dataloader, val_dataloader, **kwargs) -> dict:
+    torch.manual_seed(0)
+    model = SmallClassifier()
+
+    # record the validation AUC of every epoch, by wrapping the epoch function
+    aucs, epoch_function = [], train_funcs._train_classifier_epoch
+
+    def recording_epoch(*args, **kwargs):
+        aucs.append((epoch_function(*args, **kwargs), time.perf_counter()))
+        return aucs[-1][0]
+
+    train_funcs._train_classifier_epoch = recording_epoch
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(StringIO()):
+            train_function(model, train_dataloader, val_dataloader, max_epochs=MAX_EPOCHS, **kwargs)
+    finally:
+        train_funcs._train_classifier_epoch = epoch_function
+
+    reached = [(i + 1, t - start) for i, (auc, t) in enumerate(aucs) if auc >= TARGET_AUC]
+    return {"epochs": len(aucs),
+            "epochs_to_target": reached[0][0] if reached else np.nan,
+            "s_to_target": reached[0][1] if reached else np.nan,
+            "s_per_epoch": (aucs[-1][1] - start) / len(aucs),
+            "best_val_auc": max(auc for auc, _ in aucs),
+            "final_val_auc": evaluate(model, val_dataloader)}
+
+
+def main():
+    torch.set_num_threads(4)
+    with tempfile.TemporaryDirectory() as folder:
+        make_chip_store(Path(folder))
+        kwargs = dict(batch_size=64, device=torch.device('cpu'), num_workers=0)
+        train_dataloader = DeviceDataLoader(ClassifierDataset(Path(folder), transform_images=True,
+                                                              cache_memory=2 ** 30),
+                                            shuffle=True, seed=0, **kwargs)
+        val_dataloader = DeviceDataLoader(ClassifierDataset(Path(folder), train=False), **kwargs)
+
+        loops = {
+            "previous": (previous_train_classifier, {}),
+            "float32": (train_funcs.train_classifier, {}),
+            "float32, 2 accumulation steps": (train_funcs.train_classifier, {"accumulation_steps": 2}),
+            "bfloat16 autocast": (train_funcs.train_classifier, {"autocast_dtype": torch.bfloat16}),
+        }
+        results = [{"loop": name, **run(function, train_dataloader, val_dataloader, **loop_kwargs)}
+                   for name, (function, loop_kwargs) in loops.items()]
+    print(pd.DataFrame(results).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
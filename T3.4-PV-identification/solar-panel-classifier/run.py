@@ -11,5 +11,11 @@ if __name__ == '__main__':
 
     RunTask().classify_new_data(retrained=True, labeled=True)
 
+    # INT8 classifier for faster inference on cpu, used with classify_new_data(quantized=True):
+    # RunTask().quantize_classifier(retrained=True)
+
+    # TorchScript and ONNX models, used with classify_new_data(runtime="torchscript" or "onnx") (onnx needs onnxruntime):
+    # RunTask().export_models(retrained=True)
+
     # RunTask().segment_new_data()
  
\ No newline at end of file
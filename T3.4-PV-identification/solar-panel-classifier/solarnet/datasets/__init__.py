@@ -1,3 +1,7 @@
+from .chip_store import ChipStore
+from .cache import ChipCache
 from .classifier import ClassifierDataset
 from .segmenter import SegmenterDataset
 from .utils import make_masks, denormalize
+from .splits import SplitTable
+from .loader import DeviceDataLoader
@@ -0,0 +1,70 @@
+import numpy as np
+import torch
+from collections import OrderedDict
+
+from typing import Callable, Tuple
+
+
+class ChipCache:
+    """A cache of the decoded images of a dataset, so they are only read from disk once
+    when training for several epochs.
+
+    The first images (as many as fit in `memory_budget` bytes) are cached in a single
+    contiguous block of shared memory, which is shared by the DataLoader worker processes
+    and kept between epochs: an image is loaded by the first worker asking for it and
+    then read from memory by all of them. If the dataset does not fit in the budget, the
+    remaining images are cached by every process in a least recently used cache of
+    `lru_images` images.
+
+    Parameters
+    ----------
+    n_images: int
+        The number of images of the dataset
+    image_shape: Tuple[int, ...]
+        The shape of every image
+    dtype: np.dtype, default: np.uint8
+        The type of the images
+    memory_budget: int, default: 4 GiB
+        The maximum size of the shared block, in bytes
+    lru_images: int, default: 256
+        The number of images (not fitting in the shared block) cached by each process
+    """
+
+    def __init__(self,
+                 n_images: int,
+                 image_shape: Tuple[int, ...],
+                 dtype: np.dtype = np.uint8,
+                 memory_budget: int = 4 * 2 ** 30,
+                 lru_images: int = 256) -> None:
+        image_bytes = int(np.prod(image_shape)) * np.dtype(dtype).itemsize
+        self.capacity = int(min(n_images, memory_budget // image_bytes))
+        self.images = torch.from_numpy(np.empty((self.capacity, *image_shape), dtype=dtype)).share_memory_()
+        self.loaded = torch.zeros(self.capacity, dtype=torch.bool).share_memory_()
+
+        self.lru_images = lru_images
+        self.lru: 'OrderedDict[int, np.ndarray]' = OrderedDict()
+
+    def __len__(self) -> int:
+        """The number of images in the shared block
+        """
+        return int(self.loaded.sum())
+
+    def get(self, index: int, load: Callable[[int], np.ndarray]) -> np.ndarray:
+        """The image `index`, from the cache if it is there, else loaded with `load(index)`
+        and added to the cache
+        """
+        if index < self.capacity:
+            if not self.loaded[index]:
+                # several workers may load the same image at once, they write the same values
+                self.images[index] = torch.from_numpy(np.ascontiguousarray(load(index)))
+                self.loaded[index] = True
+            return self.images[index].numpy()
+
+        if index in self.lru:
+            self.lru.move_to_end(index)
+            return self.lru[index]
+        image = np.asarray(load(index))
+        if self.lru_images > 0:
+            self.lru[index] = image
+            if len(self.lru) > self.lru_images: self.lru.popitem(last=False)
+        return image
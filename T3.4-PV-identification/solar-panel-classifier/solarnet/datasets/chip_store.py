@@ -0,0 +1,261 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from typing import Optional, Sequence, Tuple
+
+
+class ChipStore:
+    """A store of building image chips, made of a single preallocated uint8
+    memory-mapped array (N x channels x imsize x imsize) and a SQLite index with
+    the osmid, source tif, bounding box, label and split of every chip.
+
+    Chips are only appended: each one gets the next free position of the array,
+    which doubles its capacity when full. Several processes can append to the
+    same store, as positions are allocated (and chips written) while holding the
+    SQLite write lock. Reading a chip returns a view of the memory-mapped array,
+    without copying it.
+
+    Parameters
+    ----------
+    folder: pathlib.Path
+        The folder of the store. It is created if it does not exist
+    imsize: int, default: 224
+        The height and width of the chips. Ignored if the store already exists
+    channels: int, default: 3
+        The number of channels of the chips. Ignored if the store already exists
+    capacity: int, default: 1024
+        The number of chips initially allocated. Ignored if the store already exists
+    """
+    array_name = 'chips.u8'
+    index_name = 'index.sqlite'
+
+    def __init__(self,
+                 folder: Path,
+                 imsize: int = 224,
+                 channels: int = 3,
+                 capacity: int = 1024) -> None:
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+            connection.execute('CREATE TABLE IF NOT EXISTS chips ('
+                               'position INTEGER PRIMARY KEY, osmid INTEGER UNIQUE, tif TEXT, '
+                               'minx REAL, miny REAL, maxx REAL, maxy REAL, '
+                               'label INTEGER DEFAULT -1, split TEXT)')
+            for key, value in [('imsize', imsize), ('channels', channels),
+                               ('capacity', capacity), ('n_positions', 0)]:
+                connection.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)', (key, value))
+            meta = dict(connection.execute('SELECT key, value FROM meta').fetchall())
+
+        self.chip_shape = (meta['channels'], meta['imsize'], meta['imsize'])
+        self._allocate(meta['capacity'])
+        self._array: Optional[np.memmap] = None
+
+    @classmethod
+    def exists(cls, folder: Path) -> bool:
+        """Whether a store exists in the folder
+        """
+        return (Path(folder) / cls.index_name).exists()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.folder / self.index_name, timeout=600)
+
+    def _allocate(self, capacity: int) -> None:
+        """Extend the array file to the given capacity (files are never shrunk)
+        """
+        path = self.folder / self.array_name
+        size = capacity * int(np.prod(self.chip_shape))
+        with open(path, 'ab') as f:
+            if f.tell() < size: f.truncate(size)
+
+    def _get_array(self, min_capacity: int = 0) -> np.memmap:
+        """Memory-map the array file, re-mapping it if it has been extended by
+        another writer
+        """
+        if self._array is None or self._array.shape[0] < min_capacity:
+            chip_size = int(np.prod(self.chip_shape))
+            capacity = (self.folder / self.array_name).stat().st_size // chip_size
+            self._array = np.memmap(self.folder / self.array_name, dtype=np.uint8,
+                                    mode='r+', shape=(capacity, *self.chip_shape))
+        return self._array
+
+    def __getstate__(self) -> dict:
+        # the memory-mapped array is re-mapped by each process (e.g. DataLoader
+        # workers), instead of being pickled as a copy
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM chips').fetchone()[0]
+
+    def __getitem__(self, position: int) -> np.ndarray:
+        """The chip at the given position of the array, as a view
+        """
+        return self._get_array(position + 1)[position]
+
+    def get_chips(self, positions: Sequence[int]) -> np.ndarray:
+        """The chips at the given positions of the array, as a copy
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0: return np.empty((0, *self.chip_shape), dtype=np.uint8)
+        return self._get_array(positions.max() + 1)[positions]
+
+    def contains(self, osmids: Sequence[int]) -> np.ndarray:
+        """Boolean array indicating which osmids are already in the store
+        """
+        with self._connect() as connection:
+            stored = [row[0] for row in connection.execute('SELECT osmid FROM chips')]
+        return np.isin(np.asarray(osmids, dtype=np.int64), np.asarray(stored, dtype=np.int64))
+
+    def append(self,
+               chips: np.ndarray,
+               osmids: Sequence[int],
+               tif: str = '',
+               bboxes: Optional[np.ndarray] = None,
+               labels: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Append chips to the store. Chips of osmids already in the store are skipped.
+
+        Parameters
+        ----------
+        chips: np.ndarray
+            The chips to append, with shape (n, channels, imsize, imsize)
+        osmids: Sequence[int]
+            The OSM ids of the buildings
+        tif: str, default: ''
+            The name of the tif the chips have been cut from
+        bboxes: np.ndarray, optional
+            The bounding boxes (minx, miny, maxx, maxy) of the buildings, in the tif crs
+        labels: Sequence[int], optional
+            The labels of the chips (1 = solar panels, 0 = no solar panels, -1 = unlabeled)
+
+        Returns
+        -------
+        The positions of the appended chips, -1 for the skipped ones
+        """
+        chips = np.asarray(chips, dtype=np.uint8)
+        assert chips.shape[1:] == self.chip_shape, \
+            f"Chips have the wrong shape! Expected {self.chip_shape}, got {chips.shape[1:]}"
+        osmids = np.asarray(osmids, dtype=np.int64)
+        bboxes = np.full((len(osmids), 4), np.nan) if bboxes is None else np.asarray(bboxes, dtype=float)
+        labels = np.full(len(osmids), -1) if labels is None else np.asarray(labels)
+
+        positions = np.full(len(osmids), -1, dtype=np.int64)
+        connection = self._connect()
+        try:
+            # the write lock is held until the chips are written
+            connection.execute('BEGIN IMMEDIATE')
+            new = ~np.isin(osmids, [row[0] for row in connection.execute('SELECT osmid FROM chips')])
+            new &= ~pd.Series(osmids).duplicated().values
+            meta = dict(connection.execute('SELECT key, value FROM meta').fetchall())
+
+            n_positions = meta['n_positions'] + int(new.sum())
+            if n_positions > meta['capacity']:
+                capacity = max(n_positions, 2 * meta['capacity'])
+                self._allocate(capacity)
+                connection.execute('UPDATE meta SET value = ? WHERE key = ?', (capacity, 'capacity'))
+            positions[new] = np.arange(meta['n_positions'], n_positions)
+
+            connection.executemany(
+                'INSERT INTO chips (position, osmid, tif, minx, miny, maxx, maxy, label) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(int(position), int(osmid), tif, *map(float, bbox), int(label))
+                 for position, osmid, bbox, label in zip(positions[new], osmids[new], bboxes[new], labels[new])])
+            connection.execute('UPDATE meta SET value = ? WHERE key = ?', (n_positions, 'n_positions'))
+
+            if new.any():
+                array = self._get_array(n_positions)
+                array[positions[new]] = chips[new]
+                array.flush()
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        return positions
+
+    def get_index(self,
+                  labeled: Optional[bool] = None,
+                  split: Optional[str] = None,
+                  shard: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+        """The index of the store, sorted by position
+
+        Parameters
+        ----------
+        labeled: bool, optional
+            If True, only labeled chips (label 0 or 1) are returned. If False, only
+            unlabeled chips
+        split: str, optional
+            If given, only chips of this split (e.g. 'train' or 'val') are returned
+        shard: Tuple[int, int], optional
+            (shard id, number of shards). If given, only chips of this shard are returned.
+            Shards are disjoint and have about the same size
+        """
+        with self._connect() as connection:
+            index = pd.read_sql_query('SELECT * FROM chips ORDER BY position', connection)
+
+        if labeled is not None:
+            index = index[index['label'].isin([0, 1]) == labeled]
+        if split is not None:
+            index = index[index['split'] == split]
+        if shard is not None:
+            index = index[index['position'] % shard[1] == shard[0]]
+        return index.reset_index(drop=True)
+
+    def _update(self, column: str, osmids: Sequence[int], values: Sequence) -> None:
+        with self._connect() as connection:
+            connection.executemany(f'UPDATE chips SET {column} = ? WHERE osmid = ?',
+                                   [(value, int(osmid)) for osmid, value in zip(osmids, values)])
+
+    def set_labels(self, osmids: Sequence[int], labels: Sequence[int]) -> None:
+        """Set the labels (1 = solar panels, 0 = no solar panels, -1 = unlabeled) of the chips
+        """
+        self._update('label', osmids, [int(label) for label in labels])
+
+    def set_splits(self, osmids: Sequence[int], splits: Sequence[Optional[str]]) -> None:
+        """Set the splits (e.g. 'train' or 'val') of the chips
+        """
+        self._update('split', osmids, splits)
+
+    def remove(self, osmids: Sequence[int]) -> None:
+        """Remove chips from the index. Their positions in the array are not reused
+        """
+        with self._connect() as connection:
+            connection.executemany('DELETE FROM chips WHERE osmid = ?', [(int(osmid),) for osmid in osmids])
+
+    def import_npy_files(self,
+                         files: Sequence[Path],
+                         split: Optional[str] = None,
+                         batch_size: int = 1024) -> None:
+        """Append chips saved as one .npy file per building (`building_<osmid>.npy`,
+        or `building_<osmid>_<label>.npy` if labeled) to the store. Files of osmids
+        already in the store are not loaded again, but their label and split are updated
+
+        Parameters
+        ----------
+        files: Sequence[pathlib.Path]
+            The .npy files to import
+        split: str, optional
+            The split (e.g. 'train' or 'val') of the imported chips
+        batch_size: int, default: 1024
+            The number of files appended at a time
+        """
+        names = [Path(f).stem.replace('building_', '').split('_') for f in files]
+        osmids = np.array([int(name[0]) for name in names], dtype=np.int64)
+        labels = np.array([int(name[1]) if len(name) > 1 else -1 for name in names])
+
+        new = np.flatnonzero(~self.contains(osmids))
+        for i in range(0, len(new), batch_size):
+            batch = new[i:i + batch_size]
+            self.append(np.stack([np.load(files[j]) for j in batch]), osmids=osmids[batch],
+                        labels=labels[batch])
+
+        labeled = labels != -1
+        self.set_labels(osmids[labeled], labels[labeled])
+        if split is not None: self.set_splits(osmids, [split] * len(osmids))
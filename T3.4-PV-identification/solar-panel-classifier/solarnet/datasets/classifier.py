@@ -1,76 +1,144 @@
 import numpy as np
 import torch
 from pathlib import Path
-import random
 
 from typing import Optional, List, Tuple
 
-from .utils import normalize
-from .transforms import no_change, horizontal_flip, vertical_flip, colour_jitter
+from .chip_store import ChipStore
+from .cache import ChipCache
 
 
 class ClassifierDataset:
+    """Dataset of building images for the classifier. Images are read from the
+    chip store in `processed_folder / 'chips'` if it exists (see ChipStore), else from
+    one .npy file per building.
+
+    Images are returned as they are saved (uint8), as CPU tensors, so they can be loaded by
+    DataLoader worker processes. They are transformed (if `transform_images`) and
+    normalized (if `normalize`) by batch by the DeviceDataLoader.
+
+    If `shard` = (shard id, number of shards) is given, only that shard of the images is used.
+    `tifs` holds the source tif of every image (empty if unknown).
+
+    If `cache_memory` (bytes) is given, the images are cached in memory the first time they
+    are read, shared by the DataLoader workers (see ChipCache), so that later epochs do not
+    read them from disk again. To mask the dataset after creating it, pass `cache_memory` to
+    `build_cache` after `add_mask` instead, so the cache is only allocated once.
+    """
 
     def __init__(self,
                  processed_folder: Path,
                  normalize: bool = True, 
                  transform_images: bool = False,
-                 device: torch.device = torch.device('cuda:0' if
-                                                     torch.cuda.is_available() else 'cpu'),
                  mask: Optional[List[bool]] = None,
                  labeled: bool = True,
                  train: bool = True,
+                 shard: Optional[Tuple[int, int]] = None,
+                 cache_memory: Optional[int] = None,
                  ) -> None:
 
-        self.device = device
         self.normalize = normalize
         self.transform_images = transform_images
-        if labeled and train:
-            solar_files = list((processed_folder.parent / 'solar/org').glob("*.npy"))
-            empty_files = list((processed_folder.parent / 'empty/org').glob("*.npy"))
-            self.y = torch.as_tensor([1 for _ in solar_files] + [0 for _ in empty_files],
-                                 device=self.device).float()
-            self.x_files = solar_files + empty_files
-        elif labeled and not train:
-            solar_files = list((processed_folder.parent / 'solar/val').glob("*.npy"))
-            empty_files = list((processed_folder.parent / 'empty/val').glob("*.npy"))
-            self.y = torch.as_tensor([1 for _ in solar_files] + [0 for _ in empty_files],
-                                 device=self.device).float()
-            self.x_files = solar_files + empty_files
-        else:
-            files = list((processed_folder).glob("*.npy"))
-            self.x_files = files
-            self.y = torch.as_tensor([2 for _ in files], device=self.device).float()
+        self.chip_store: Optional[ChipStore] = None
+        self.x_files: List[Path] = []
+        self.positions = np.empty(0, dtype=np.int64)
+        self.cache_memory: Optional[int] = None
+        self.cache: Optional[ChipCache] = None
 
+        if ChipStore.exists(processed_folder / 'chips'):
+            self.chip_store = ChipStore(processed_folder / 'chips')
+            if labeled:
+                index = self.chip_store.get_index(labeled=True, split='train' if train else 'val',
+                                                  shard=shard)
+                labels = index['label'].tolist()
+            else:
+                index = self.chip_store.get_index(shard=shard)
+                labels = [2 for _ in range(len(index))]
+            self.positions = index['position'].values
+            self.osmids = index['osmid'].values
+            self.tifs = index['tif'].values
+            self.y = torch.as_tensor(labels).float()
+        else:
+            if labeled and train:
+                solar_files = list((processed_folder.parent / 'solar/org').glob("*.npy"))
+                empty_files = list((processed_folder.parent / 'empty/org').glob("*.npy"))
+                labels = [1 for _ in solar_files] + [0 for _ in empty_files]
+                files = solar_files + empty_files
+            elif labeled and not train:
+                solar_files = list((processed_folder.parent / 'solar/val').glob("*.npy"))
+                empty_files = list((processed_folder.parent / 'empty/val').glob("*.npy"))
+                labels = [1 for _ in solar_files] + [0 for _ in empty_files]
+                files = solar_files + empty_files
+            else:
+                files = list((processed_folder).glob("*.npy"))
+                labels = [2 for _ in files]
 
+            if shard is not None:
+                files, labels = files[shard[0]::shard[1]], labels[shard[0]::shard[1]]
+            self.x_files = files
+            self.tifs = np.full(len(files), '', dtype=object)
+            self.y = torch.as_tensor(labels).float()
 
         if mask is not None:
             self.add_mask(mask)
+        self.build_cache(cache_memory)
+
+    def build_cache(self, cache_memory: Optional[int]) -> None:
+        """Create an empty cache of `cache_memory` bytes for the images of the dataset,
+        replacing the previous one. None disables the cache
+        """
+        # the previous cache is freed first
+        self.cache = None
+        self.cache_memory = cache_memory
+        if cache_memory is None or len(self) == 0: return
+        image = self.load_image(0)
+        self.cache = ChipCache(len(self), image.shape, dtype=image.dtype, memory_budget=cache_memory)
 
     def add_mask(self, mask: List[bool]) -> None:
         """Add a mask to the data
         """
-        assert len(mask) == len(self.x_files), \
-            f"Mask is the wrong size! Expected {len(self.x_files)}, got {len(mask)}"
-        self.y = torch.as_tensor(self.y.cpu().numpy()[mask], device=self.device)
-        self.x_files = [x for include, x in zip(mask, self.x_files) if include]
+        assert len(mask) == len(self), \
+            f"Mask is the wrong size! Expected {len(self)}, got {len(mask)}"
+        self.y = self.y[torch.as_tensor(mask, dtype=torch.bool)]
+        self.tifs = self.tifs[mask]
+        if self.chip_store is not None:
+            self.positions = self.positions[mask]
+            self.osmids = self.osmids[mask]
+        else:
+            self.x_files = [x for include, x in zip(mask, self.x_files) if include]
+        # the indices of the images have changed
+        if self.cache is not None:
+            self.build_cache(self.cache_memory)
+
+    @property
+    def ids(self) -> List[str]:
+        """The name of every image, `building_<osmid>`
+        """
+        if self.chip_store is not None:
+            return [f'building_{osmid}' for osmid in self.osmids]
+        return [f.name.replace(".npy", "") for f in self.x_files]
+
+    @property
+    def groups(self) -> List[str]:
+        """The group of every image, used to split the dataset without spatial leakage
+        (see SplitTable): its source tif if known, else its city (files are named
+        `<city>_<idx>.npy`)
+        """
+        if self.chip_store is not None:
+            return [str(tif) for tif in self.tifs]
+        return [f.stem.rsplit('_', 1)[0] for f in self.x_files]
+
+    def load_image(self, index: int) -> np.ndarray:
+        """The image, as saved (channels, height, width)
+        """
+        if self.chip_store is not None:
+            return self.chip_store[self.positions[index]]
+        return np.load(self.x_files[index])
 
     def __len__(self) -> int:
         return self.y.shape[0]
 
-    def _transform_images(self, image: np.ndarray) -> np.ndarray:
-        transforms = [
-            no_change,
-            horizontal_flip,
-            vertical_flip,
-            colour_jitter,
-        ]
-        chosen_function = random.choice(transforms)
-        return chosen_function(image)
-
     def __getitem__(self, index: int) -> Tuple[torch.Tensor, torch.Tensor]:
         y = self.y[index]
-        x = np.load(self.x_files[index])
-        if self.transform_images: x = self._transform_images(x)
-        if self.normalize: x = normalize(x)
-        return torch.as_tensor(x.copy(), device=self.device).float(), y
+        x = self.load_image(index) if self.cache is None else self.cache.get(index, self.load_image)
+        return torch.from_numpy(np.ascontiguousarray(x)), y
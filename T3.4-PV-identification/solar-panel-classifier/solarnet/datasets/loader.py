@@ -0,0 +1,85 @@
+import os
+import torch
+from torch.utils.data import DataLoader
+
+from typing import Iterator, Optional, Tuple
+
+from .utils import normalize
+from .transforms import BatchTransform
+
+
+class DeviceDataLoader:
+    """Loads the images of a dataset (returning CPU tensors, uint8 where possible) in
+    worker processes, and prepares every batch on the device: the batch is copied
+    (from pinned memory if the device is a GPU), randomly transformed (see BatchTransform),
+    converted to float32 and normalized.
+
+    Workers are kept alive between epochs (persistent_workers) and load
+    `prefetch_factor` batches ahead, so the model does not wait for the images.
+
+    Parameters
+    ----------
+    dataset:
+        The dataset, e.g. a ClassifierDataset or a SegmenterDataset
+    batch_size: int, default: 64
+        The number of images per batch
+    shuffle: bool, default: False
+        Whether to shuffle the images every epoch
+    device: torch.device, default: cuda if available, else cpu
+        The device the batches are prepared on
+    num_workers: int, default: min(4, number of cpus)
+        The number of worker processes loading the images. 0 loads them in the main process
+    normalize: bool, optional
+        Whether to normalize the images. Defaults to the `normalize` attribute of the dataset,
+        or True if it has none
+    transform_images: bool, optional
+        Whether to randomly transform the images (and masks). Defaults to the `transform_images`
+        attribute of the dataset, or False if it has none
+    seed: int, optional
+        The seed of the random transforms
+    persistent_workers: bool, default: True
+        Whether to keep the workers alive between epochs
+    prefetch_factor: int, default: 2
+        The number of batches loaded in advance by each worker
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_size: int = 64,
+                 shuffle: bool = False,
+                 device: torch.device = torch.device('cuda:0' if
+                                                     torch.cuda.is_available() else 'cpu'),
+                 num_workers: int = min(4, os.cpu_count() or 1),
+                 normalize: Optional[bool] = None,
+                 transform_images: Optional[bool] = None,
+                 seed: Optional[int] = None,
+                 persistent_workers: bool = True,
+                 prefetch_factor: int = 2) -> None:
+        self.dataset = dataset
+        self.device = device
+        self.normalize = getattr(dataset, 'normalize', True) if normalize is None else normalize
+        if transform_images is None: transform_images = getattr(dataset, 'transform_images', False)
+        self.transform = BatchTransform(seed=seed) if transform_images else None
+        self.dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
+                                     num_workers=num_workers,
+                                     pin_memory=device.type == 'cuda',
+                                     persistent_workers=persistent_workers and num_workers > 0,
+                                     prefetch_factor=prefetch_factor if num_workers > 0 else None)
+
+    @property
+    def pin_memory(self) -> bool:
+        return self.dataloader.pin_memory
+
+    def __len__(self) -> int:
+        return len(self.dataloader)
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        for x, y in self.dataloader:
+            x = x.to(self.device, non_blocking=self.pin_memory)
+            y = y.to(self.device, non_blocking=self.pin_memory)
+            if self.transform is not None:
+                # masks (batch, height, width) are transformed with the images, labels are not
+                if y.dim() == 3: x, y = self.transform(x, y)
+                else: x = self.transform(x)
+            y = y.float()
+            yield (normalize(x) if self.normalize else x.float()), y
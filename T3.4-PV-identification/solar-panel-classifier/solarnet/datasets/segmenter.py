@@ -1,23 +1,26 @@
 import numpy as np
 import torch
 from pathlib import Path
-import random
 
 from typing import Optional, List, Tuple
 
-from .utils import normalize
-from .transforms import no_change, horizontal_flip, vertical_flip, colour_jitter
 
 
 class SegmenterDataset:
+    """Dataset of the images with solar panels, and their masks, for the segmentation model.
+    Images (uint8) and masks are returned as CPU tensors, so they can be loaded by DataLoader
+    worker processes. Images are transformed (if `transform_images`) and normalized (if
+    `normalize`) by batch by the DeviceDataLoader.
+
+    The colour jitter (+0 to 30) is therefore applied to the raw pixel values, before
+    normalization, as for the classifier. It used to be applied to the normalized images,
+    where it shifted pixels by up to 30 standard deviations instead of about 0.5.
+    """
     def __init__(self,
                  processed_folder: Path = Path('data/processed'),
                  normalize: bool = True, transform_images: bool = True,
-                 device: torch.device = torch.device('cuda:0' if
-                                                     torch.cuda.is_available() else 'cpu'),
                  mask: Optional[List[bool]] = None) -> None:
 
-        self.device = device
         self.normalize = normalize
         self.transform_images = transform_images
 
@@ -42,29 +45,27 @@ class SegmenterDataset:
         self.org_solar_files = [x for include, x in zip(mask, self.org_solar_files) if include]
         self.mask_solar_files = [x for include, x in zip(mask, self.mask_solar_files) if include]
 
+    @property
+    def ids(self) -> List[str]:
+        """The name of every image, `<city>_<idx>`
+        """
+        return [f.stem for f in self.org_solar_files]
+
+    @property
+    def groups(self) -> List[str]:
+        """The city of every image, used to split the dataset without spatial leakage
+        (see SplitTable)
+        """
+        return [f.stem.rsplit('_', 1)[0] for f in self.org_solar_files]
+
     def __len__(self) -> int:
         return len(self.org_solar_files)
 
-    def _transform_images(self, image: np.ndarray,
-                          mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        transforms = [
-            no_change,
-            horizontal_flip,
-            vertical_flip,
-            colour_jitter,
-        ]
-        chosen_function = random.choice(transforms)
-        return chosen_function(image, mask)
-
     def __getitem__(self, index: int) -> Tuple[torch.Tensor, torch.Tensor]:
         x = np.load(self.org_solar_files[index])
-        if self.normalize: x = normalize(x)
 
         if len(self.mask_solar_files) != 0:
-            y = np.load(self.mask_solar_files[index])
-            if self.transform_images: x, y = self._transform_images(x, y)
-            return torch.as_tensor(x.copy(), device=self.device).float(), \
-                torch.as_tensor(y.copy(), device=self.device).float()
+            y = np.load(self.mask_solar_files[index]).astype(np.uint8)
+            return torch.from_numpy(x), torch.from_numpy(y)
         else:  # if no masks area available, return only the original solar files:
-            if self.transform_images: x = self._transform_images(x)
-            return torch.as_tensor(x.copy(), device=self.device).float(), torch.tensor([])
+            return torch.from_numpy(x), torch.tensor([])
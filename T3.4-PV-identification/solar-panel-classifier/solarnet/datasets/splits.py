@@ -0,0 +1,126 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from typing import Optional, Sequence, Tuple
+
+SPLITS = ('train', 'val', 'test')
+
+
+def hash_fractions(keys: Sequence, salt: str = 'solarnet') -> np.ndarray:
+    """A stable pseudo-random number in [0, 1) for every key, derived from a hash of the key,
+    so it does not depend on the order of the keys, the random seed or the python process
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(f'{salt}:{key}'.encode(), digest_size=8).digest(),
+                                    'big') / 2 ** 64 for key in keys], dtype=np.float64)
+
+
+def hash_splits(keys: Sequence,
+                val_size: float = 0.1,
+                test_size: float = 0.1,
+                salt: str = 'solarnet') -> np.ndarray:
+    """The split ('train', 'val' or 'test') of every key, derived from a hash of the key.
+    Roughly `val_size` and `test_size` of the keys are put in the validation and test sets
+    """
+    fractions = hash_fractions(keys, salt=salt)
+    splits = np.full(len(fractions), 'train', dtype=object)
+    splits[fractions >= 1 - (val_size + test_size)] = 'val'
+    splits[fractions >= 1 - test_size] = 'test'
+    return splits
+
+
+def splits_to_masks(splits: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Three boolean arrays (train, validation and test), which can be passed to
+    `Dataset.add_mask`
+    """
+    splits = np.asarray(splits, dtype=object)
+    train_mask, val_mask, test_mask = (splits == split for split in SPLITS)
+    return train_mask, val_mask, test_mask
+
+
+class SplitTable:
+    """The train, validation and test splits of the images of a dataset, persisted in a
+    csv file (id;group;split) next to the data, so every model and every run uses the same
+    splits.
+
+    The split of a new image is derived from a hash of its id or, if it has a group (e.g.
+    its source tif or city), of its group, so that all the images of a group end up in the
+    same split and neighbouring buildings are not both trained on and tested on. Images
+    of a group which is already in the table go to the split of that group. The splits of
+    images already in the table are never changed, so new images can be added without
+    reshuffling the existing ones.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        The csv file of the table. It is created when splits are first assigned
+    salt: str, default: 'solarnet'
+        Salt of the hash; changing it gives other splits
+    """
+    columns = ['id', 'group', 'split']
+
+    def __init__(self, path: Path, salt: str = 'solarnet') -> None:
+        self.path = Path(path)
+        self.salt = salt
+
+    def read(self) -> pd.DataFrame:
+        """The table, empty if the file does not exist
+        """
+        if not self.path.exists():
+            return pd.DataFrame(columns=self.columns, dtype=str)
+        return pd.read_csv(self.path, sep=';', dtype=str, keep_default_na=False)
+
+    def get_splits(self,
+                   ids: Sequence[str],
+                   groups: Optional[Sequence[str]] = None,
+                   val_size: float = 0.1,
+                   test_size: float = 0.1) -> np.ndarray:
+        """The split of every id, assigning (and saving) the splits of the ids which are
+        not in the table yet
+
+        Parameters
+        ----------
+        ids: Sequence[str]
+            The ids of the images, e.g. `dataset.ids`
+        groups: Sequence[str], optional
+            The group of every image, e.g. `dataset.groups`. Images with an empty group
+            are split by id
+        val_size: float < 1, default: 0.1
+            The ratio of the new images (or groups) to put in the validation set
+        test_size: float < 1, default: 0.1
+            The ratio of the new images (or groups) to put in the test set
+        """
+        ids = pd.Index(np.asarray(ids).astype(str))
+        assert ids.is_unique, 'The ids of the images must be unique'
+        groups = np.full(len(ids), '', dtype=object) if groups is None else np.asarray(groups).astype(str)
+
+        table = self.read()
+        new = ~ids.isin(table['id'])
+        if new.any():
+            new_ids, new_groups = ids[new], groups[new]
+            # images are split by group if they have one, else by id
+            keys = np.where(new_groups != '', 'group:' + new_groups.astype(object),
+                            'id:' + new_ids.values.astype(object))
+            new_splits = hash_splits(keys, val_size, test_size, salt=self.salt)
+
+            known_groups = table[table['group'] != ''].drop_duplicates('group').set_index('group')['split']
+            in_known_group = pd.Index(new_groups).isin(known_groups.index) & (new_groups != '')
+            new_splits[in_known_group] = known_groups.loc[new_groups[in_known_group]].values
+
+            added = pd.DataFrame({'id': new_ids, 'group': new_groups, 'split': new_splits})
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            added.to_csv(self.path, sep=';', index=False, mode='a', header=not self.path.exists())
+            table = pd.concat([table, added], ignore_index=True)
+
+        return table.set_index('id')['split'].loc[ids].values.astype(object)
+
+    def masks(self,
+              ids: Sequence[str],
+              groups: Optional[Sequence[str]] = None,
+              val_size: float = 0.1,
+              test_size: float = 0.1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The train, validation and test masks of the images (see get_splits), which can be
+        passed to `Dataset.add_mask`
+        """
+        return splits_to_masks(self.get_splits(ids, groups, val_size, test_size))
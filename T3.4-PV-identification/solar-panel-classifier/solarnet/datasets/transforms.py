@@ -1,9 +1,13 @@
 """
 Image transformations, along with their corresponding
 mask transformations (if applicable)
+
+The numpy functions transform a single image; BatchTransform applies
+them to a whole batch of tensors at once
 """
 
 import numpy as np
+import torch
 from typing import Tuple, Optional
 
 
@@ -49,3 +53,53 @@ def colour_jitter(image: np.ndarray,
     image = image + zitter
     if mask is None: return image
     return image, mask
+
+
+class BatchTransform:
+    """Applies one of no_change, horizontal_flip, vertical_flip and colour_jitter,
+    chosen at random for every image, to a batch of images (batch, channels, height, width)
+    and, if given, their masks (batch, height, width), as tensors on their device.
+
+    Unlike colour_jitter on uint8 images, the jittered values are clipped to 255
+    instead of overflowing.
+
+    Attributes:
+        seed: int, optional
+            The seed of the random generator, for reproducible transforms
+    """
+    n_transforms = 4
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.seed = seed
+        self.generator: Optional[torch.Generator] = None
+
+    def _get_generator(self, device: torch.device) -> torch.Generator:
+        if self.generator is None or self.generator.device != device:
+            self.generator = torch.Generator(device=device)
+            if self.seed is None: self.generator.seed()
+            else: self.generator.manual_seed(self.seed)
+        return self.generator
+
+    def __call__(self, images: torch.Tensor,
+                 masks: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor,
+                                                                Optional[torch.Tensor]]:
+        generator = self._get_generator(images.device)
+        chosen = torch.randint(0, self.n_transforms, (images.shape[0],), generator=generator,
+                               device=images.device)
+        images = images.clone()
+
+        flip_h, flip_v, jitter = chosen == 1, chosen == 2, chosen == 3
+        images[flip_h] = images[flip_h].flip(-1)
+        images[flip_v] = images[flip_v].flip(-2)
+
+        noise = torch.randint(0, 30, images[jitter].shape, generator=generator, device=images.device)
+        if images.dtype == torch.uint8:
+            images[jitter] = (images[jitter].short() + noise).clamp(max=255).to(torch.uint8)
+        else:
+            images[jitter] = images[jitter] + noise.to(images.dtype)
+
+        if masks is None: return images
+        masks = masks.clone()
+        masks[flip_h] = masks[flip_h].flip(-1)
+        masks[flip_v] = masks[flip_v].flip(-2)
+        return images, masks
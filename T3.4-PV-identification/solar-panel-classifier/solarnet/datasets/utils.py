@@ -1,25 +1,41 @@
 import numpy as np
+import torch
 
-from typing import List, Tuple
+from typing import List, Tuple, Union
+
+from .splits import hash_splits, splits_to_masks
 
 MEAN, STD = [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
 
+# normalize is fused into a single multiply-add per channel: (image / 255 - MEAN) / STD
+SCALE = (1 / (255 * np.array(STD))).astype(np.float32)
+OFFSET = (-np.array(MEAN) / np.array(STD)).astype(np.float32)
+
 
-def normalize(image: np.ndarray) -> np.ndarray:
+def normalize(image: Union[np.ndarray, torch.Tensor]) -> Union[np.ndarray, torch.Tensor]:
     """Normalized an image (or a set of images), as per
     https://pytorch.org/docs/1.0.0/torchvision/models.html
 
     Specifically, images are normalized to range [0, 1], and
     then normalized according to ImageNet stats.
-    """
-    image = image / 255
 
+    The result is float32. Tensors are normalized with torch ops, on their device.
+    """
     # determine if we are dealing with a single image, or a
     # stack of images. If a stack, expected in (batch, channels, height, width)
-    source, dest = 0 if len(image.shape) == 3 else 1, -1
+    shape = (-1, 1, 1) if len(image.shape) == 3 else (1, -1, 1, 1)
+
+    if isinstance(image, torch.Tensor):
+        scale = torch.as_tensor(SCALE, device=image.device).view(shape)
+        offset = torch.as_tensor(OFFSET, device=image.device).view(shape)
+        # .float() always copies uint8 images, so the copy can be modified in place
+        normalized = image.float() if image.dtype != torch.float32 else image.clone()
+        return normalized.mul_(scale).add_(offset)
 
-    # moveaxis for array broadcasting, and then back so its how pytorch expects it
-    return np.moveaxis((np.moveaxis(image, source, dest) - MEAN) / STD, dest, source)
+    normalized = image.astype(np.float32)
+    normalized *= SCALE.reshape(shape)
+    normalized += OFFSET.reshape(shape)
+    return normalized
 
 
 def denormalize(image: np.ndarray) -> np.ndarray:
@@ -37,15 +53,13 @@ def make_masks(
     dataset_length: int,
     val_size: float = 0.1,
     test_size: float = 0.1
-    ) -> Tuple[List[bool], List[bool], List[bool]]:
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Returns three boolean arrays of length `dataset_length`,
     representing the train set, validation set and test set. These
     arrays can be passed to `Dataset.add_mask` to yield the appropriate
     datasets.
-    """
-    mask = np.random.rand(dataset_length)
-    train_mask = mask < (1 - (val_size + test_size))
-    val_mask = (mask >= (1 - (val_size + test_size))) & (mask < 1 - test_size)
-    test_mask = mask >= (1 - test_size)
 
-    return train_mask, val_mask, test_mask
+    The splits are derived from a hash of the position of each item, so they are the same
+    every time. Use a SplitTable to split by id and persist the splits.
+    """
+    return splits_to_masks(hash_splits(range(dataset_length), val_size, test_size))
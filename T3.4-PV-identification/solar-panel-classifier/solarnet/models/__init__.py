@@ -1,3 +1,6 @@
 from .classifier import Classifier
 from .segmenter import Segmenter
-from .train_funcs import train_classifier, train_segmenter
+from .train_funcs import train_classifier, train_segmenter, save_checkpoint, load_checkpoint
+from .predict_funcs import make_inference_dataloader, predict_classifier, PredictionWriter, get_model_version
+from .quantization import quantize_classifier, save_quantized_classifier, load_quantized_classifier, compare_classifiers
+from .export import export_torchscript, export_onnx, load_exported_model, OnnxModel
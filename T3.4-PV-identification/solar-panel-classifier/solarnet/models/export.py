@@ -0,0 +1,64 @@
+import os
+import torch
+from torch import nn
+from pathlib import Path
+
+
+def export_torchscript(model: nn.Module, path: Path, imsize: int = 224) -> None:
+    """Trace the model and save it as TorchScript, so it can be loaded with
+    torch.jit.load without the solarnet code
+    """
+    model = model.cpu().eval()
+    example_x = torch.zeros(1, 3, imsize, imsize)
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, example_x)
+    torch.jit.save(traced, str(path))
+
+
+def export_onnx(model: nn.Module, path: Path, imsize: int = 224, opset_version: int = 17) -> None:
+    """Export the model to ONNX, with a dynamic batch size. The input is named
+    `image` and the output `prediction`
+    """
+    model = model.cpu().eval()
+    example_x = torch.zeros(1, 3, imsize, imsize)
+    torch.onnx.export(model, (example_x,), str(path), input_names=['image'], output_names=['prediction'],
+                      dynamic_axes={'image': {0: 'batch'}, 'prediction': {0: 'batch'}},
+                      opset_version=opset_version, dynamo=False)
+
+
+class OnnxModel(nn.Module):
+    """A model exported by export_onnx, run with ONNX Runtime on the cpu with all
+    graph optimizations enabled. It is called like the torch model, so it can be used
+    in place of it (e.g. by predict_classifier)
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        The .onnx file
+    num_threads: int, default: number of cpus
+        The number of threads used to run an operator
+    """
+
+    def __init__(self, path: Path, num_threads: int = os.cpu_count() or 1) -> None:
+        super().__init__()
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(path), sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.detach().cpu().float().contiguous().numpy()
+        return torch.from_numpy(self.session.run(None, {self.input_name: x})[0])
+
+
+def load_exported_model(path: Path) -> nn.Module:
+    """Load a model exported by export_torchscript (.pt) or export_onnx (.onnx), on the cpu
+    """
+    path = Path(path)
+    if path.suffix == '.onnx':
+        return OnnxModel(path)
+    return torch.jit.load(str(path), map_location='cpu').eval()
@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from typing import Optional, Sequence, Tuple
+
+from ..datasets import DeviceDataLoader
+
+
+def get_model_version(model_path: Path) -> str:
+    """The version of a saved model, `<file name>-<first 12 characters of its sha256>`
+    """
+    sha = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return f'{Path(model_path).name}-{sha.hexdigest()[:12]}'
+
+
+class PredictionWriter:
+    """Appends the predictions of every batch to a csv file (osmid, tif, probability,
+    label, model_version), so that long runs can be resumed and thresholds tuned
+    afterwards from the raw probabilities.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        The csv file. Rows already in the file are kept
+    model_version: str
+        The version of the model making the predictions (see get_model_version)
+    osmids: Sequence, optional
+        The osmid of every image of the dataset being predicted on, in order
+    tifs: Sequence[str], optional
+        The source tif of every image of the dataset being predicted on, in order
+    """
+    columns = ['osmid', 'tif', 'probability', 'label', 'model_version']
+
+    def __init__(self,
+                 path: Path,
+                 model_version: str,
+                 osmids: Optional[Sequence] = None,
+                 tifs: Optional[Sequence[str]] = None) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_version = model_version
+        self.osmids = np.asarray([] if osmids is None else osmids).astype(str)
+        self.tifs = np.full(len(self.osmids), '', dtype=object) if tifs is None else np.asarray(tifs)
+
+    def read(self) -> pd.DataFrame:
+        """The predictions of the model version written so far, one row per osmid
+        """
+        if not self.path.exists():
+            return pd.DataFrame(columns=self.columns)
+        # a run interrupted while writing may leave an incomplete last row
+        results = pd.read_csv(self.path, sep=';', dtype={'osmid': str, 'tif': str},
+                              keep_default_na=False, on_bad_lines='skip')
+        results['probability'] = pd.to_numeric(results['probability'], errors='coerce')
+        results = results[(results['model_version'] == self.model_version) & results['probability'].notna()]
+        return results.drop_duplicates('osmid', keep='last').reset_index(drop=True)
+
+    def contains(self, osmids: Sequence) -> np.ndarray:
+        """Boolean array indicating which osmids already have a prediction of the model version
+        """
+        return np.isin(np.asarray(osmids).astype(str), self.read()['osmid'].values)
+
+    def write(self, start: int, probabilities: np.ndarray, labels: np.ndarray) -> None:
+        """Append the predictions of the images `start` to `start + len(probabilities)` of the dataset
+        """
+        end = start + len(probabilities)
+        batch = pd.DataFrame({
+            'osmid': self.osmids[start:end],
+            'tif': self.tifs[start:end],
+            'probability': probabilities,
+            'label': labels.astype(int),
+            'model_version': self.model_version,
+        }, columns=self.columns)
+        # the rows are written at once and flushed, so a batch is either written or not
+        with open(self.path, 'a') as f:
+            f.write(batch.to_csv(sep=';', index=False, header=f.tell() == 0))
+            f.flush()
+
+
+def make_inference_dataloader(dataset,
+                              batch_size: int = 64,
+                              num_workers: int = min(4, os.cpu_count() or 1),
+                              device: torch.device = torch.device('cpu')) -> DeviceDataLoader:
+    """A DeviceDataLoader for inference, loading the images in `num_workers` worker
+    processes, without shuffling them. Batches are collated in pinned memory if they
+    are copied to a GPU, and normalized on the device
+
+    Parameters
+    ----------
+    dataset:
+        The dataset to predict on, e.g. a ClassifierDataset
+    batch_size: int, default: 64
+        The number of images per batch
+    num_workers: int, default: min(4, number of cpus)
+        The number of worker processes loading the images. 0 loads them in the main process
+    device: torch.device, default: cpu
+        The device the batches are copied to
+    """
+    return DeviceDataLoader(dataset, batch_size=batch_size, shuffle=False, device=device,
+                            num_workers=num_workers, persistent_workers=False)
+
+
+def predict_classifier(model: torch.nn.Module,
+                       dataloader: DataLoader,
+                       device: torch.device = torch.device('cpu'),
+                       writer: Optional[PredictionWriter] = None
+                       ) -> Tuple[np.ndarray, np.ndarray]:
+    """Predict the probability of solar panels for every image of the dataloader,
+    in inference mode (no autograd tracking), and print the throughput in images/s.
+
+    Parameters
+    ----------
+    model
+        The trained classifier, already on `device`
+    dataloader:
+        An iterator which returns batches of images and labels, without shuffling
+    device: torch.device, default: cpu
+        The device to perform predictions on
+    writer: PredictionWriter, optional
+        If given, the predictions of every batch are appended to its file as soon as
+        they are made
+
+    Returns
+    -------
+    The predictions and the labels of the images, in the order of the dataset
+    """
+    model.eval()
+    # the outputs are preallocated instead of concatenating a list of batches
+    n_images = len(dataloader.dataset)
+    preds = np.empty(n_images, dtype=np.float32)
+    true = np.empty(n_images, dtype=np.float32)
+
+    i = 0
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for x, y in tqdm(dataloader):
+            x = x.to(device, non_blocking=dataloader.pin_memory)
+            preds[i:i + len(x)] = model(x).squeeze(1).float().cpu().numpy()
+            true[i:i + len(x)] = y.cpu().numpy()
+            if writer is not None: writer.write(i, preds[i:i + len(x)], true[i:i + len(x)])
+            i += len(x)
+    elapsed = time.perf_counter() - start
+
+    print(f'Classified {i} images in {elapsed:.1f}s ({i / max(elapsed, 1e-9):.1f} images/s)')
+    return preds[:i], true[:i]
@@ -0,0 +1,97 @@
+import time
+import torch
+from torch.utils.data import DataLoader
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import numpy as np
+from pathlib import Path
+from sklearn.metrics import roc_auc_score
+
+from typing import Dict
+
+from .predict_funcs import predict_classifier
+from .export import export_torchscript
+
+
+def quantize_classifier(model: torch.nn.Module,
+                        calibration_dataloader: DataLoader,
+                        n_batches: int = 10,
+                        backend: str = 'x86') -> torch.nn.Module:
+    """Statically quantize the classifier to INT8 for CPU inference (FX graph mode).
+    The activation ranges are calibrated on the first `n_batches` batches of the dataloader
+
+    Parameters
+    ----------
+    model
+        The trained float classifier
+    calibration_dataloader:
+        An iterator which returns batches of normalized images and labels, e.g. of the
+        chips in new_data/processed
+    n_batches: int, default: 10
+        The number of batches used for the calibration
+    backend: str, default: 'x86'
+        The quantized engine, 'x86' (or 'fbgemm') for x86 servers and 'qnnpack' for ARM
+    """
+    torch.backends.quantized.engine = backend
+    model = model.cpu().eval()
+    example_x, _ = next(iter(calibration_dataloader))
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend), (example_x,))
+
+    with torch.inference_mode():
+        for i, (x, _) in enumerate(calibration_dataloader):
+            if i == n_batches: break
+            prepared(x)
+    return convert_fx(prepared)
+
+
+def save_quantized_classifier(model: torch.nn.Module, path: Path, imsize: int = 224) -> None:
+    """Save the quantized classifier as TorchScript, so it can be loaded without
+    quantizing it again
+    """
+    export_torchscript(model, path, imsize=imsize)
+
+
+def load_quantized_classifier(path: Path, backend: str = 'x86') -> torch.nn.Module:
+    """Load a quantized classifier saved by save_quantized_classifier, on the cpu
+    """
+    torch.backends.quantized.engine = backend
+    model = torch.jit.load(str(path), map_location='cpu')
+    return model.eval()
+
+
+def compare_classifiers(float_model: torch.nn.Module,
+                        quantized_model: torch.nn.Module,
+                        dataloader: DataLoader,
+                        threshold: float = 0.5) -> Dict[str, float]:
+    """Compare the predictions and the cpu throughput of the float and quantized classifiers
+
+    Parameters
+    ----------
+    float_model
+        The float classifier
+    quantized_model
+        The quantized classifier
+    dataloader:
+        An iterator which returns batches of images and labels, without shuffling.
+        The AUC ROC is only computed if the labels are 0 or 1
+    threshold: float, default: 0.5
+        The probability above which an image is predicted to have solar panels
+
+    Returns
+    -------
+    A dictionary with the images/s and AUC ROC of each model, the maximum absolute
+    difference of the probabilities and the share of images with the same prediction
+    """
+    report: Dict[str, float] = {'n_images': len(dataloader.dataset)}
+    preds = {}
+    for name, model in [('float', float_model.cpu()), ('quantized', quantized_model)]:
+        start = time.perf_counter()
+        preds[name], true = predict_classifier(model, dataloader)
+        report[f'{name}_images_per_s'] = len(true) / (time.perf_counter() - start)
+        if np.isin(true, [0, 1]).all() and len(np.unique(true)) == 2:
+            report[f'{name}_auc_roc'] = roc_auc_score(true, preds[name])
+
+    report['speedup'] = report['quantized_images_per_s'] / report['float_images_per_s']
+    report['max_abs_difference'] = float(np.abs(preds['float'] - preds['quantized']).max())
+    report['agreement'] = float(((preds['float'] >= threshold) == (preds['quantized'] >= threshold)).mean())
+    return report
@@ -1,8 +1,6 @@
 import torch
 from torch import nn
 
-from typing import List
-
 from .base import ResnetBase
 
 
@@ -18,8 +16,8 @@ class Segmenter(ResnetBase):
     def __init__(self, imagenet_base: bool = False) -> None:
         super().__init__(imagenet_base=imagenet_base)
 
+        # the outputs of these modules of the base are passed across to the upsampling blocks
         self.target_modules = [str(x) for x in [2, 4, 5, 6]]
-        self.hooks = self.add_hooks()
 
         self.relu = nn.ReLU()
         self.upsamples = nn.ModuleList([
@@ -32,37 +30,6 @@ class Segmenter(ResnetBase):
         self.conv_transpose = nn.ConvTranspose2d(16, 1, 1)
         self.sigmoid = nn.Sigmoid()
 
-    def add_hooks(self) -> List[torch.utils.hooks.RemovableHandle]:
-        hooks = []
-        for name, child in self.pretrained.named_children():
-            if name in self.target_modules:
-                hooks.append(child.register_forward_hook(self.save_output))
-        return hooks
-
-    def retrieve_hooked_outputs(self) -> List[torch.Tensor]:
-        # to be called in the forward pass, this method returns the tensors
-        # which were saved by the forward hooks
-        outputs = []
-        for name, child in self.pretrained.named_children():
-            if name in self.target_modules:
-                outputs.append(child.output)
-        return outputs
-
-    def cleanup(self) -> None:
-        # removes the hooks, and the tensors which were added
-        for name, child in self.pretrained.named_children():
-            if name in self.target_modules:
-                # allows the method to be safely called even if
-                # the hooks aren't there
-                try: del child.output
-                except AttributeError: continue
-        for hook in self.hooks: hook.remove()
-
-    @staticmethod
-    def save_output(module, input, output):
-        # the hook to add to the target modules
-        module.output = output
-
     def load_base(self, state_dict: dict) -> None:
         # This allows a model trained on the classifier to be loaded
         # into the model used for segmentation, even though their state_dicts
@@ -71,10 +38,17 @@ class Segmenter(ResnetBase):
 
     def forward(self, x):
         org_input = x
-        x = self.relu(self.pretrained(x))
+        # the base is run module by module (instead of with forward hooks) to keep
+        # the outputs of the target modules, so the model can be traced and exported
+        interim = []
+        for name, child in self.pretrained.named_children():
+            x = child(x)
+            if name in self.target_modules:
+                interim.append(x)
+        x = self.relu(x)
         # we reverse the outputs so that the smallest output
         # is the first one we get, and the largest the last
-        interim = self.retrieve_hooked_outputs()[::-1]
+        interim = interim[::-1]
 
         for upsampler, interim_output in zip(self.upsamples[:-1], interim):
             x = upsampler(x, interim_output)
@@ -1,3 +1,5 @@
+import os
+import random
 import torch
 import torch.nn.functional as F
 from torch.utils.data import DataLoader
@@ -5,8 +7,9 @@ from torch.optim.optimizer import Optimizer
 from tqdm import tqdm
 import numpy as np
 from sklearn.metrics import roc_auc_score
+from pathlib import Path
 
-from typing import Any, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 def train_classifier(model: torch.nn.Module,
@@ -14,7 +17,14 @@ def train_classifier(model: torch.nn.Module,
                      val_dataloader: DataLoader,
                      warmup: int = 2,
                      patience: int = 5,
-                     max_epochs: int = 100) -> None:
+                     max_epochs: int = 100,
+                     lr: float = 1e-3,
+                     lr_patience: Optional[int] = None,
+                     accumulation_steps: int = 1,
+                     autocast_dtype: Optional[torch.dtype] = None,
+                     checkpoint_path: Optional[Path] = None,
+                     resume: bool = False,
+                     checkpoint_data: Optional[Dict[str, Any]] = None) -> None:
     """Train the classifier
 
     Parameters
@@ -35,32 +45,31 @@ def train_classifier(model: torch.nn.Module,
         validation set before early stopping
     max_epochs: int, default: 100
         The maximum number of epochs to train for
+    lr: float, default: 1e-3
+        The learning rate of the Adam optimizer
+    lr_patience: int, optional
+        If given, the number of epochs (after the warmup) without an improvement on the
+        validation set after which the learning rate is divided by 10. By default, the
+        learning rate is constant
+    accumulation_steps: int, default: 1
+        The number of batches over which the gradients are accumulated before each
+        optimizer step
+    autocast_dtype: torch.dtype, optional
+        If given (e.g. torch.bfloat16 on cpu), the forward pass runs with mixed precision
+    checkpoint_path: pathlib.Path, optional
+        If given, a checkpoint of the training (see save_checkpoint) is saved there after every
+        epoch
+    resume: bool, default: False
+        Whether to resume the training from the checkpoint in checkpoint_path, if it exists
+    checkpoint_data: dict, optional
+        Additional data saved in the checkpoint (under 'data'), e.g. the masks of the splits
     """
-
-    best_state_dict = model.state_dict()
-    best_val_auc_roc = 0.5
-    patience_counter = 0
-    for i in range(max_epochs):
-        if i <= warmup:
-            # we start by finetuning the model
-            optimizer = torch.optim.Adam([pam for name, pam in
-                                          model.named_parameters() if 'classifier' in name])
-        else:
-            # then, we train the whole thing
-            optimizer = torch.optim.Adam(model.parameters())
-
-        train_data, val_data = _train_classifier_epoch(model, optimizer, train_dataloader,
-                                                       val_dataloader)
-        if val_data[1] > best_val_auc_roc:
-            best_val_auc_roc = val_data[1]
-            patience_counter = 0
-            best_state_dict = model.state_dict()
-        else:
-            patience_counter += 1
-            if patience_counter == patience:
-                print("Early stopping!")
-                model.load_state_dict(best_state_dict)
-                return None
+    _train(model, train_dataloader, val_dataloader, _train_classifier_epoch,
+           is_head=lambda name: 'classifier' in name, maximize=True,
+           warmup=warmup, patience=patience, max_epochs=max_epochs, lr=lr,
+           lr_patience=lr_patience, accumulation_steps=accumulation_steps,
+           autocast_dtype=autocast_dtype, checkpoint_path=checkpoint_path, resume=resume,
+           checkpoint_data=checkpoint_data)
 
 
 def train_segmenter(model: torch.nn.Module,
@@ -68,7 +77,14 @@ def train_segmenter(model: torch.nn.Module,
                     val_dataloader: DataLoader,
                     warmup: int = 2,
                     patience: int = 5,
-                    max_epochs: int = 100) -> None:
+                    max_epochs: int = 100,
+                    lr: float = 1e-3,
+                    lr_patience: Optional[int] = None,
+                    accumulation_steps: int = 1,
+                    autocast_dtype: Optional[torch.dtype] = None,
+                    checkpoint_path: Optional[Path] = None,
+                    resume: bool = False,
+                    checkpoint_data: Optional[Dict[str, Any]] = None) -> None:
     """Train the segmentation model
 
     Parameters
@@ -89,54 +105,212 @@ def train_segmenter(model: torch.nn.Module,
         validation set before early stopping
     max_epochs: int, default: 100
         The maximum number of epochs to train for
+    lr: float, default: 1e-3
+        The learning rate of the Adam optimizer
+    lr_patience: int, optional
+        If given, the number of epochs (after the warmup) without an improvement on the
+        validation set after which the learning rate is divided by 10. By default, the
+        learning rate is constant
+    accumulation_steps: int, default: 1
+        The number of batches over which the gradients are accumulated before each
+        optimizer step
+    autocast_dtype: torch.dtype, optional
+        If given (e.g. torch.bfloat16 on cpu), the forward pass runs with mixed precision
+    checkpoint_path: pathlib.Path, optional
+        If given, a checkpoint of the training (see save_checkpoint) is saved there after every
+        epoch
+    resume: bool, default: False
+        Whether to resume the training from the checkpoint in checkpoint_path, if it exists
+    checkpoint_data: dict, optional
+        Additional data saved in the checkpoint (under 'data'), e.g. the masks of the splits
     """
-    best_state_dict = model.state_dict()
-    best_loss = 1
+    _train(model, train_dataloader, val_dataloader, _train_segmenter_epoch,
+           is_head=lambda name: 'pretrained' not in name, maximize=False,
+           warmup=warmup, patience=patience, max_epochs=max_epochs, lr=lr,
+           lr_patience=lr_patience, accumulation_steps=accumulation_steps,
+           autocast_dtype=autocast_dtype, checkpoint_path=checkpoint_path, resume=resume,
+           checkpoint_data=checkpoint_data)
+
+
+def _train(model: torch.nn.Module,
+           train_dataloader: DataLoader,
+           val_dataloader: DataLoader,
+           train_epoch: Callable,
+           is_head: Callable[[str], bool],
+           maximize: bool,
+           warmup: int,
+           patience: int,
+           max_epochs: int,
+           lr: float,
+           lr_patience: Optional[int],
+           accumulation_steps: int,
+           autocast_dtype: Optional[torch.dtype],
+           checkpoint_path: Optional[Path] = None,
+           resume: bool = False,
+           checkpoint_data: Optional[Dict[str, Any]] = None) -> None:
+    """The training loop shared by the classifier and the segmentation model.
+
+    A single optimizer is used for all epochs, so its moment estimates are kept: during
+    the warmup epochs only the parameters of the head (is_head(name) is True) require
+    gradients, and the other ones are then unfrozen. The best weights (according to the
+    validation metric returned by train_epoch) are copied, and loaded at the end.
+
+    If checkpoint_path is given, the state of the training is saved there after every epoch,
+    and, if resume, training restarts from it.
+    """
+    head = [pam for name, pam in model.named_parameters() if is_head(name)]
+    base = [pam for name, pam in model.named_parameters() if not is_head(name)]
+    optimizer = torch.optim.Adam([{'params': head}, {'params': base}], lr=lr)
+    scheduler = None
+    if lr_patience is not None:
+        scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='max' if maximize else 'min',
+                                                               factor=0.1, patience=lr_patience)
+
+    best_state_dict = _copy_state_dict(model)
+    best_metric = -np.inf if maximize else np.inf
     patience_counter = 0
-    for i in range(max_epochs):
-        if i <= warmup:
-            # we start by 'warming up' the final layers of the model
-            optimizer = torch.optim.Adam([pam for name, pam in
-                                          model.named_parameters() if 'pretrained' not in name])
-        else:
-            optimizer = torch.optim.Adam(model.parameters())
+    start_epoch, finished = 0, False
+    if checkpoint_path is not None and resume and Path(checkpoint_path).exists():
+        checkpoint = load_checkpoint(checkpoint_path)
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        if scheduler is not None and checkpoint['scheduler'] is not None:
+            scheduler.load_state_dict(checkpoint['scheduler'])
+        best_state_dict = checkpoint['best_model']
+        best_metric = checkpoint['best_metric']
+        patience_counter = checkpoint['patience_counter']
+        start_epoch, finished = checkpoint['epoch'] + 1, checkpoint['finished']
+        _set_rng_states(checkpoint['rng_states'], train_dataloader)
+        print(f"Resuming training from epoch {start_epoch} of {checkpoint_path}")
+
+    def checkpoint(epoch: int) -> None:
+        if checkpoint_path is None: return
+        save_checkpoint(checkpoint_path, {
+            'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'epoch': epoch, 'finished': finished, 'best_model': best_state_dict,
+            'best_metric': best_metric, 'patience_counter': patience_counter,
+            'rng_states': _get_rng_states(train_dataloader), 'data': checkpoint_data or {}})
+
+    for i in range(start_epoch, max_epochs):
+        if finished: break
+        # we start by finetuning the head of the model, then, we train the whole thing
+        for pam in base: pam.requires_grad_(i > warmup)
 
-        train_data, val_data = _train_segmenter_epoch(model, optimizer, train_dataloader,
-                                                      val_dataloader)
-        if np.mean(val_data) < best_loss:
-            best_loss = np.mean(val_data)
+        metric = train_epoch(model, optimizer, train_dataloader, val_dataloader,
+                             accumulation_steps=accumulation_steps, autocast_dtype=autocast_dtype)
+        # the learning rate is only reduced once the whole model is trained
+        if scheduler is not None and i > warmup: scheduler.step(metric)
+
+        if (metric > best_metric) if maximize else (metric < best_metric):
+            best_metric = metric
             patience_counter = 0
-            best_state_dict = model.state_dict()
+            best_state_dict = _copy_state_dict(model)
         else:
             patience_counter += 1
             if patience_counter == patience:
                 print("Early stopping!")
-                model.load_state_dict(best_state_dict)
-                return None
+                finished = True
+        checkpoint(i)
 
+    for pam in base: pam.requires_grad_(True)
+    model.load_state_dict(best_state_dict)
 
-def _train_classifier_epoch(model: torch.nn.Module,
-                            optimizer: Optimizer,
-                            train_dataloader: DataLoader,
-                            val_dataloader: DataLoader
-                            ) -> Tuple[Tuple[List[Any], float],
-                                       Tuple[List[Any], float]]:
 
-    t_losses, t_true, t_pred = [], [], []
-    v_losses, v_true, v_pred = [], [], []
+def save_checkpoint(path: Path, checkpoint: Dict[str, Any]) -> None:
+    """Save a training checkpoint: the weights of the model ('model'), the state of the
+    optimizer and learning rate scheduler, the last epoch, the best weights and metric, the
+    early stopping counter, the random number generator states, and additional data ('data').
+
+    The checkpoint is written to a temporary file which then replaces `path`, so an
+    interrupted save does not corrupt the previous checkpoint.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    """Load a checkpoint saved by save_checkpoint. Tensors are loaded on the cpu
+    """
+    # the checkpoint also holds numpy and python objects (random states, split masks)
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+
+def _get_rng_states(dataloader: DataLoader) -> Dict[str, Any]:
+    """The states of the random number generators: python, numpy, torch (which shuffles the
+    DataLoader) and the generator of the batch transforms of a DeviceDataLoader, if any
+    """
+    generator = getattr(getattr(dataloader, 'transform', None), 'generator', None)
+    return {'python': random.getstate(), 'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+            'transform': generator.get_state() if generator is not None else None}
+
+
+def _set_rng_states(states: Dict[str, Any], dataloader: DataLoader) -> None:
+    random.setstate(states['python'])
+    np.random.set_state(states['numpy'])
+    torch.set_rng_state(states['torch'])
+    if torch.cuda.is_available() and len(states['cuda']) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(states['cuda'])
+    transform = getattr(dataloader, 'transform', None)
+    if transform is not None and states['transform'] is not None:
+        transform._get_generator(dataloader.device).set_state(states['transform'])
+
+
+def _copy_state_dict(model: torch.nn.Module) -> Dict[str, torch.Tensor]:
+    # model.state_dict() returns references to the weights, which keep being trained
+    return {name: tensor.detach().clone() for name, tensor in model.state_dict().items()}
+
+
+def _train_steps(model: torch.nn.Module,
+                 optimizer: Optimizer,
+                 train_dataloader: DataLoader,
+                 loss_fn: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+                 accumulation_steps: int,
+                 autocast_dtype: Optional[torch.dtype],
+                 keep_predictions: bool = True) -> Tuple[List[float], List[Any], List[Any]]:
+    """Train the model for an epoch, with gradient accumulation and, if autocast_dtype
+    is given, mixed precision. Returns the losses, and the labels and predictions if
+    keep_predictions
+    """
+    losses, true, pred = [], [], []
+    device_type = next(model.parameters()).device.type
     model.train()
-    for x, y in tqdm(train_dataloader):
-        optimizer.zero_grad()
-        preds = model(x)
+    optimizer.zero_grad()
+    for step, (x, y) in enumerate(tqdm(train_dataloader)):
+        with torch.autocast(device_type=device_type, dtype=autocast_dtype or torch.bfloat16,
+                            enabled=autocast_dtype is not None):
+            preds = model(x)
+        # the loss is computed in float32
+        loss = loss_fn(preds.float(), y)
+        (loss / accumulation_steps).backward()
+        if (step + 1) % accumulation_steps == 0 or step + 1 == len(train_dataloader):
+            optimizer.step()
+            optimizer.zero_grad()
+        losses.append(loss.item())
 
-        loss = F.binary_cross_entropy(preds.squeeze(1), y)
-        loss.backward()
-        optimizer.step()
-        t_losses.append(loss.item())
+        if keep_predictions:
+            true.append(y.cpu().detach().numpy())
+            pred.append(preds.float().cpu().detach().numpy())
+    return losses, true, pred
 
-        t_true.append(y.cpu().detach().numpy())
-        t_pred.append(preds.squeeze(1).cpu().detach().numpy())
 
+def _train_classifier_epoch(model: torch.nn.Module,
+                            optimizer: Optimizer,
+                            train_dataloader: DataLoader,
+                            val_dataloader: DataLoader,
+                            accumulation_steps: int = 1,
+                            autocast_dtype: Optional[torch.dtype] = None
+                            ) -> float:
+
+    def loss_fn(preds, y): return F.binary_cross_entropy(preds.squeeze(1), y)
+
+    t_losses, t_true, t_pred = _train_steps(model, optimizer, train_dataloader, loss_fn,
+                                            accumulation_steps, autocast_dtype)
+    v_losses, v_true, v_pred = [], [], []
     with torch.no_grad():
         model.eval()
         for val_x, val_y in tqdm(val_dataloader):
@@ -147,31 +321,27 @@ def _train_classifier_epoch(model: torch.nn.Module,
             v_true.append(val_y.cpu().detach().numpy())
             v_pred.append(val_preds.squeeze(1).cpu().detach().numpy())
 
-    train_auc = roc_auc_score(np.concatenate(t_true), np.concatenate(t_pred))
+    train_auc = roc_auc_score(np.concatenate(t_true), np.concatenate(t_pred).squeeze(1))
     val_auc = roc_auc_score(np.concatenate(v_true), np.concatenate(v_pred))
 
     print(f'Train loss: {np.mean(t_losses)}, Train AUC ROC: {train_auc}, '
           f'Val loss: {np.mean(v_losses)}, Val AUC ROC: {val_auc}')
-    return (t_losses, train_auc), (v_losses, val_auc)
+    return val_auc
 
 
 def _train_segmenter_epoch(model: torch.nn.Module,
                            optimizer: Optimizer,
                            train_dataloader: DataLoader,
-                           val_dataloader: DataLoader
-                           ) -> Tuple[List[Any], List[Any]]:
-    t_losses, v_losses = [], []
-    model.train()
-    for x, y in tqdm(train_dataloader):
-        optimizer.zero_grad()
-        preds = model(x)
-
-        loss = F.binary_cross_entropy(preds, y.unsqueeze(1))
-        loss.backward()
-        optimizer.step()
+                           val_dataloader: DataLoader,
+                           accumulation_steps: int = 1,
+                           autocast_dtype: Optional[torch.dtype] = None
+                           ) -> float:
 
-        t_losses.append(loss.item())
+    def loss_fn(preds, y): return F.binary_cross_entropy(preds, y.unsqueeze(1))
 
+    t_losses, _, _ = _train_steps(model, optimizer, train_dataloader, loss_fn,
+                                  accumulation_steps, autocast_dtype, keep_predictions=False)
+    v_losses = []
     with torch.no_grad():
         model.eval()
         for val_x, val_y in tqdm(val_dataloader):
@@ -180,4 +350,4 @@ def _train_segmenter_epoch(model: torch.nn.Module,
             v_losses.append(val_loss.item())
     print(f'Train loss: {np.mean(t_losses)}, Val loss: {np.mean(v_losses)}')
 
-    return t_losses, v_losses
+    return np.mean(v_losses)
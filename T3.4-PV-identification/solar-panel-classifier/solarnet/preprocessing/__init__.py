@@ -1,2 +1,2 @@
-from .masks import MaskMaker
+from .masks import MaskMaker, save_mask, load_mask
 from .splits import ImageSplitter
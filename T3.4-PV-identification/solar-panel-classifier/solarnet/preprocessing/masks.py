@@ -1,8 +1,10 @@
+import os
 import pandas as pd
 import numpy as np
 from matplotlib.path import Path as PolygonPath
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 from typing import List, Tuple
@@ -18,7 +20,9 @@ IMAGE_SIZES = {
 class MaskMaker:
     """This class looks for all files defined in the metadata, and
     produces masks for all of the .tif files saved there.
-    These files will be saved in <org_folder>_mask/<org_filename>.npy
+    These files will be saved in <org_folder>_mask/<org_filename>.npz, bit-packed
+    (see save_mask), with 1 where there is a solar panel and 0 elsewhere. They are read
+    with load_mask.
 
     Attributes:
         data_folder: pathlib.Path
@@ -42,53 +46,114 @@ class MaskMaker:
         )
         return polygon_images, polygon_pixels
 
-    def process(self) -> None:
-
+    def process(self, num_workers: int = os.cpu_count() or 1) -> None:
+        """Make the masks of all the images, in `num_workers` processes (1 makes them in
+        this process)
+        """
         polygon_images, polygon_pixels = self._read_data()
 
-        for city, files in polygon_images.items():
-            print(f'Processing {city}')
-            # first, we make sure the mask file exists; if not,
-            # we make it
-            masked_city = self.data_folder / f"{city}_masks"
-            x_size, y_size = IMAGE_SIZES[city]
-            if not masked_city.exists(): masked_city.mkdir()
-
-            for image, polygons in tqdm(files.items()):
-                mask = np.zeros((x_size, y_size))
-                for polygon in polygons:
-                    mask += self.make_mask(polygon_pixels[polygon], (x_size, y_size))
-
-                np.save(masked_city / f"{image}.npy", mask)
+        executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+        try:
+            for city, files in polygon_images.items():
+                print(f'Processing {city}')
+                # first, we make sure the mask file exists; if not,
+                # we make it
+                masked_city = self.data_folder / f"{city}_masks"
+                if not masked_city.exists(): masked_city.mkdir()
+
+                images = list(files)
+                args = ([[polygon_pixels[polygon] for polygon in files[image]] for image in images],
+                        [IMAGE_SIZES[city]] * len(images),
+                        [masked_city / f"{image}.npz" for image in images])
+                results = executor.map(_make_and_save_mask, *args) if executor is not None \
+                    else map(_make_and_save_mask, *args)
+                for _ in tqdm(results, total=len(images)): pass
+        finally:
+            if executor is not None: executor.shutdown()
 
     @staticmethod
     def _csv_to_dict_polygon_pixels(polygon_pixels: pd.DataFrame) -> dict:
-        output_dict = {}
+        """The vertices (number_vertices x 2 arrays of (lat, lon) pixel coordinates) of every
+        polygon. They are views of a single array of all the vertices, read column by column
+        """
+        if len(polygon_pixels) == 0: return {}
+        n_vertices = polygon_pixels['number_vertices'].to_numpy().astype(int)
+        columns = range(1, n_vertices.max() + 1)
+        lat = polygon_pixels[[f"lat{i}" for i in columns]].to_numpy(dtype=float)
+        lon = polygon_pixels[[f"lon{i}" for i in columns]].to_numpy(dtype=float)
 
-        for idx, row in polygon_pixels.iterrows():
-            vertices = []
-            for i in range(1, int(row.number_vertices) + 1):
-                vertices.append((row[f"lat{i}"], row[f"lon{i}"]))
-            output_dict[int(row.polygon_id)] = vertices
-        return output_dict
+        # the first number_vertices vertices of every row, flattened row by row
+        is_vertex = np.arange(len(columns)) < n_vertices[:, np.newaxis]
+        vertices = np.stack([lat[is_vertex], lon[is_vertex]], axis=1)
+        offsets = np.concatenate([[0], np.cumsum(n_vertices)])
+
+        polygon_ids = polygon_pixels['polygon_id'].to_numpy().astype(int)
+        return {polygon_id: vertices[start:end] for polygon_id, start, end
+                in zip(polygon_ids.tolist(), offsets[:-1], offsets[1:])}
 
     @staticmethod
     def _csv_to_dict_image_names(polygon_images: pd.DataFrame) -> defaultdict:
         output_dict: defaultdict = defaultdict(lambda: defaultdict(list))
 
-        for idx, row in polygon_images.iterrows():
-                output_dict[row.city][row.image_name].append(int(row.polygon_id))
+        groups = polygon_images.groupby(['city', 'image_name'], sort=False, dropna=False)['polygon_id']
+        for (city, image_name), polygon_ids in groups:
+            output_dict[city][image_name] = polygon_ids.astype(int).tolist()
         return output_dict
 
     @staticmethod
     def make_mask(coords: List, imsizes: Tuple[int, int]) -> np.array:
-        """https://stackoverflow.com/questions/3654289/scipy-create-2d-polygon-mask
+        """The (uint8) mask of a single polygon: 1 inside the polygon, 0 outside
+        """
+        mask = np.zeros(imsizes, dtype=np.uint8)
+        MaskMaker.draw_polygon(coords, mask)
+        return mask
+
+    @staticmethod
+    def draw_polygon(coords: List, mask: np.ndarray) -> None:
+        """Set the pixels of the mask inside the polygon to 1, in place.
+
+        Only the pixels in the bounding box of the polygon are tested, instead of the whole
+        image: https://stackoverflow.com/questions/3654289/scipy-create-2d-polygon-mask
         """
-        poly_path = PolygonPath(coords)
+        vertices = np.asarray(coords, dtype=float).reshape(-1, 2)
+        vertices = vertices[np.isfinite(vertices).all(axis=1)]
+        if len(vertices) == 0: return
+
+        x_size, y_size = mask.shape
+        x_min, y_min = np.maximum(np.floor(vertices.min(axis=0)).astype(int), 0)
+        x_max, y_max = np.minimum(np.ceil(vertices.max(axis=0)).astype(int), (x_size - 1, y_size - 1))
+        if x_min > x_max or y_min > y_max: return
 
-        x_size, y_size = imsizes
-        x, y = np.mgrid[:x_size, :y_size]
+        x, y = np.mgrid[x_min:x_max + 1, y_min:y_max + 1]
         coors = np.hstack((x.reshape(-1, 1), y.reshape(-1, 1)))
-        mask = poly_path.contains_points(coors)
+        inside = PolygonPath(coords).contains_points(coors).reshape(x.shape)
+        mask[x_min:x_max + 1, y_min:y_max + 1] |= inside.astype(np.uint8)
+
+
+def _make_and_save_mask(polygons: List[List], imsizes: Tuple[int, int], path: Path) -> None:
+    """Make the mask of an image from its polygons, and save it
+    """
+    mask = np.zeros(imsizes, dtype=np.uint8)
+    for coords in polygons:
+        MaskMaker.draw_polygon(coords, mask)
+    save_mask(path, mask)
 
-        return mask.reshape(x_size, y_size).astype(float)
+
+def save_mask(path: Path, mask: np.ndarray) -> None:
+    """Save a binary mask in a compressed .npz file, with its pixels packed into bits
+    (8 per byte)
+    """
+    np.savez_compressed(path, packed=np.packbits(mask.astype(bool), axis=None),
+                        shape=np.array(mask.shape))
+
+
+def load_mask(folder: Path, image_name: str) -> np.ndarray:
+    """Load the mask of an image (as uint8) from `folder / <image_name>.npz`, as saved by
+    save_mask, or from `folder / <image_name>.npy` for masks saved unpacked
+    """
+    path = Path(folder) / f"{image_name}.npz"
+    if not path.exists():
+        return np.load(Path(folder) / f"{image_name}.npy").astype(np.uint8)
+    with np.load(path) as saved:
+        shape = tuple(saved['shape'])
+        return np.unpackbits(saved['packed'], count=int(np.prod(shape))).reshape(shape)
@@ -8,7 +8,7 @@ from tqdm import tqdm
 
 from typing import Tuple
 
-from .masks import IMAGE_SIZES
+from .masks import IMAGE_SIZES, load_mask
 
 
 class ImageSplitter:
@@ -57,10 +57,10 @@ class ImageSplitter:
         # for each image, we want to know where the solar panel centroids are
         output_dict: defaultdict = defaultdict(lambda: defaultdict(set))
 
-        for idx, row in metadata.iterrows():
-            output_dict[row.city][row.image_name].add((
-                row.centroid_latitude_pixels, row.centroid_longitude_pixels
-            ))
+        groups = metadata.groupby(['city', 'image_name'], sort=False)
+        for (city, image_name), centroids in groups:
+            output_dict[city][image_name] = set(zip(centroids['centroid_latitude_pixels'].tolist(),
+                                                    centroids['centroid_longitude_pixels'].tolist()))
         return output_dict
 
     @staticmethod
@@ -114,7 +114,7 @@ class ImageSplitter:
                     print(f'{city}/{image_name}.tif is malformed with shape {org_file.shape}. '
                           f'Skipping!')
                     continue
-                mask_file = np.load(self.data_folder / f"{city}_masks/{image_name}.npy")
+                mask_file = load_mask(self.data_folder / f"{city}_masks", image_name)
 
                 # first, lets collect the positive examples
                 for centroid in centroids:
@@ -1,5 +1,7 @@
+import os
+import json
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import Subset
 
 import numpy as np
 from pathlib import Path
@@ -7,13 +9,27 @@ from tqdm import tqdm
 from PIL import Image
 import pandas as pd
 
+from typing import Optional
+
 from solarnet.preprocessing import MaskMaker, ImageSplitter
-from solarnet.datasets import ClassifierDataset, SegmenterDataset, make_masks
-from solarnet.models import Classifier, Segmenter, train_classifier, train_segmenter
+from solarnet.datasets import ClassifierDataset, SegmenterDataset, DeviceDataLoader, SplitTable
+from solarnet.models import Classifier, Segmenter, train_classifier, train_segmenter, load_checkpoint
+from solarnet.models import make_inference_dataloader, predict_classifier, PredictionWriter, get_model_version
+from solarnet.models import quantize_classifier, save_quantized_classifier, load_quantized_classifier, compare_classifiers
+from solarnet.models import export_torchscript, export_onnx, load_exported_model
 import matplotlib.pyplot as plt
 from sklearn.metrics import roc_curve, auc, confusion_matrix
 import seaborn as sns
 
+# the runtimes of classify_new_data and segment_new_data
+RUNTIMES = ("torch", "torchscript", "onnx")
+
+
+def check_runtime(runtime: str) -> None:
+    """Raise a ValueError if the runtime is not one of RUNTIMES"""
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime {runtime!r}, expected one of {RUNTIMES}")
+
 
 def plot_roc_curve(y_true, y_scores):
     """
@@ -67,18 +83,21 @@ def plot_confusion_matrix(y_true, y_pred):
 class RunTask:
 
     @staticmethod
-    def make_masks(data_folder=Path(__file__).parent.parent / "data"):
+    def make_masks(data_folder=Path(__file__).parent.parent / "data",
+                   num_workers: int = os.cpu_count() or 1):
         """Saves masks for each .tif image in the raw dataset. Masks are saved
-        in  <org_folder>_mask/<org_filename>.npy where <org_folder> should be the
+        (bit-packed) in  <org_folder>_mask/<org_filename>.npz where <org_folder> should be the
         city name, as defined in `data/README.md`.
 
         Parameters
         ----------
         data_folder: pathlib.Path
             Path of the data folder, which should be set up as described in `data/README.md`
+        num_workers: int, default: number of cpus
+            The number of processes making the masks
         """
         mask_maker = MaskMaker(data_folder=data_folder)
-        mask_maker.process()
+        mask_maker.process(num_workers=num_workers)
 
     @staticmethod
     def split_images(data_folder=Path(__file__).parent.parent / "data", imsize=224, empty_ratio=2):
@@ -103,11 +122,18 @@ class RunTask:
     def train_classifier(max_epochs=100, 
                          warmup=2, 
                          patience=5, 
+                         lr_patience: Optional[int] = None,
                          val_size=0.1,
                          test_size=0.1, 
                          data_folder=Path(__file__).parent.parent / "data",
                          device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu',),
-                         retrain: bool = False
+                         retrain: bool = False,
+                         num_workers: int = min(4, os.cpu_count() or 1),
+                         cache_memory: Optional[int] = None,
+                         accumulation_steps: int = 1,
+                         mixed_precision: bool = False,
+                         resume: bool = False,
+                         grouped_splits: bool = False,
                          ):
         """Train the classifier
 
@@ -121,14 +147,36 @@ class RunTask:
         patience: int, default: 5
             The number of epochs to keep training without an improvement in performance on the
             validation set before early stopping
+        lr_patience: int, optional
+            If given, the number of epochs (after the warmup) without an improvement on the
+            validation set after which the learning rate is divided by 10. By default, the
+            learning rate is constant
         val_size: float < 1, default: 0.1
             The ratio of the entire dataset to use for the validation set
         test_size: float < 1, default: 0.1
-            The ratio of the entire dataset to use for the test set
+            The ratio of the entire dataset to use for the test set. The splits are saved in
+            processed/splits.csv (see SplitTable) and kept for later trainings: the sizes only apply
+            to the images which are not in it yet
+        grouped_splits: bool, default: False
+            Whether to split the images by source tif (or city) rather than one by one, so that
+            neighbouring buildings are not in both the train and test sets. Needs many groups
         data_folder: pathlib.Path
             Path of the data folder, which should be set up as described in `data/README.md`
         device: torch.device, default: cuda if available, else cpu
             The device to train the models on
+        num_workers: int, default: min(4, number of cpus)
+            The number of worker processes loading the images of each dataloader
+        cache_memory: int, optional
+            The memory (in bytes) used to cache the training and validation images each in the first epoch
+            (see ChipCache). The cache is in /dev/shm, so it must have enough free space (e.g. docker run
+            --shm-size). By default, the images are not cached
+        accumulation_steps: int, default: 1
+            The number of batches over which the gradients are accumulated before each optimizer step
+        mixed_precision: bool, default: False
+            Whether to run the forward passes in bfloat16 (autocast)
+        resume: bool, default: False
+            Whether to resume an interrupted training from its checkpoint (saved after every epoch
+            in data/models/classifier.checkpoint), with the same train, validation and test sets
         """
 
         model_dir = data_folder / 'models'
@@ -140,6 +188,7 @@ class RunTask:
             model_name = "classifier_retrained.model"
         else:
             model_name = "classifier.model"
+        checkpoint_path = model_dir / model_name.replace(".model", ".checkpoint")
         
         if device.type != 'cpu': model = model.cuda()
 
@@ -149,25 +198,36 @@ class RunTask:
             processed_folder = data_folder / 'processed'
         dataset = ClassifierDataset(processed_folder=processed_folder, transform_images=True)
 
-        # make a train and val set
-        train_mask, val_mask, test_mask = make_masks(len(dataset), val_size, test_size)
+        # make a train and val set, or use the ones of the checkpoint
+        if resume and checkpoint_path.exists():
+            train_mask, val_mask, test_mask = load_checkpoint(checkpoint_path)['data']['masks']
+        else:
+            train_mask, val_mask, test_mask = SplitTable(processed_folder / 'splits.csv').masks(
+                dataset.ids, dataset.groups if grouped_splits else None, val_size, test_size)
 
         dataset.add_mask(train_mask)
-        train_dataloader = DataLoader(dataset, batch_size=64, shuffle=True)
-        val_dataloader = DataLoader(ClassifierDataset(mask=val_mask,
-                                                      processed_folder=processed_folder,
-                                                      transform_images=False),
-                                    batch_size=64, shuffle=True)
-        test_dataloader = DataLoader(ClassifierDataset(mask=test_mask,
-                                                       processed_folder=processed_folder,
-                                                       transform_images=False),
-                                     batch_size=64)
-
+        dataset.build_cache(cache_memory)
+        train_dataloader = DeviceDataLoader(dataset, batch_size=64, shuffle=True, device=device,
+                                            num_workers=num_workers)
+        val_dataloader = DeviceDataLoader(ClassifierDataset(mask=val_mask,
+                                                            processed_folder=processed_folder,
+                                                            transform_images=False,
+                                                            cache_memory=cache_memory),
+                                          batch_size=64, shuffle=True, device=device, num_workers=num_workers)
+        test_dataloader = DeviceDataLoader(ClassifierDataset(mask=test_mask,
+                                                             processed_folder=processed_folder,
+                                                             transform_images=False),
+                                           batch_size=64, device=device, num_workers=num_workers,
+                                           persistent_workers=False)
+
+        model_dir.mkdir(exist_ok=True)
         train_classifier(model, train_dataloader, val_dataloader, max_epochs=max_epochs,
-                         warmup=warmup, patience=patience)
+                         warmup=warmup, patience=patience, lr_patience=lr_patience,
+                         accumulation_steps=accumulation_steps,
+                         autocast_dtype=torch.bfloat16 if mixed_precision else None,
+                         checkpoint_path=checkpoint_path, resume=resume,
+                         checkpoint_data={'masks': (train_mask, val_mask, test_mask)})
 
-
-        if not model_dir.exists(): model_dir.mkdir()
         torch.save(model.state_dict(), model_dir / model_name)
 
         # save predictions for analysis
@@ -184,8 +244,12 @@ class RunTask:
 
     @staticmethod
     def train_segmenter(max_epochs=100, val_size=0.1, test_size=0.1, warmup=2,
-                        patience=5, data_folder=Path(__file__).parent.parent / "data", use_classifier=True,
-                        device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')):
+                        patience=5, lr_patience: Optional[int] = None,
+                        data_folder=Path(__file__).parent.parent / "data", use_classifier=True,
+                        device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu'),
+                        num_workers: int = min(4, os.cpu_count() or 1),
+                        accumulation_steps: int = 1, mixed_precision: bool = False,
+                        resume: bool = False, grouped_splits: bool = False):
         """Train the segmentation model
 
         Parameters
@@ -198,10 +262,19 @@ class RunTask:
         patience: int, default: 5
             The number of epochs to keep training without an improvement in performance on the
             validation set before early stopping
+        lr_patience: int, optional
+            If given, the number of epochs (after the warmup) without an improvement on the
+            validation set after which the learning rate is divided by 10. By default, the
+            learning rate is constant
         val_size: float < 1, default: 0.1
             The ratio of the entire dataset to use for the validation set
         test_size: float < 1, default: 0.1
-            The ratio of the entire dataset to use for the test set
+            The ratio of the entire dataset to use for the test set. The splits are saved in
+            processed/splits.csv (see SplitTable) and kept for later trainings: the sizes only apply
+            to the images which are not in it yet
+        grouped_splits: bool, default: False
+            Whether to split the images by source tif (or city) rather than one by one, so that
+            neighbouring buildings are not in both the train and test sets. Needs many groups
         data_folder: pathlib.Path
             Path of the data folder, which should be set up as described in `data/README.md`
         use_classifier: boolean, default: True
@@ -210,6 +283,15 @@ class RunTask:
             model
         device: torch.device, default: cuda if available, else cpu
             The device to train the models on
+        num_workers: int, default: min(4, number of cpus)
+            The number of worker processes loading the images of each dataloader
+        accumulation_steps: int, default: 1
+            The number of batches over which the gradients are accumulated before each optimizer step
+        mixed_precision: bool, default: False
+            Whether to run the forward passes in bfloat16 (autocast)
+        resume: bool, default: False
+            Whether to resume an interrupted training from its checkpoint (saved after every epoch
+            in data/models/segmenter.checkpoint), with the same train, validation and test sets
         """
         model = Segmenter()
         if device.type != 'cpu': model = model.cuda()
@@ -220,23 +302,35 @@ class RunTask:
             model.load_base(classifier_sd)
         processed_folder = data_folder / 'processed'
         dataset = SegmenterDataset(processed_folder=processed_folder)
-        train_mask, val_mask, test_mask = make_masks(len(dataset), val_size, test_size)
+        checkpoint_path = model_dir / 'segmenter.checkpoint'
+        if resume and checkpoint_path.exists():
+            train_mask, val_mask, test_mask = load_checkpoint(checkpoint_path)['data']['masks']
+        else:
+            train_mask, val_mask, test_mask = SplitTable(processed_folder / 'splits.csv').masks(
+                dataset.ids, dataset.groups if grouped_splits else None, val_size, test_size)
 
         dataset.add_mask(train_mask)
-        train_dataloader = DataLoader(dataset, batch_size=64, shuffle=True)
-        val_dataloader = DataLoader(SegmenterDataset(mask=val_mask,
-                                                     processed_folder=processed_folder,
-                                                     transform_images=False),
-                                    batch_size=64, shuffle=True)
-        test_dataloader = DataLoader(SegmenterDataset(mask=test_mask,
-                                                      processed_folder=processed_folder,
-                                                      transform_images=False),
-                                     batch_size=64)
-
+        dataset.build_cache(cache_memory)
+        train_dataloader = DeviceDataLoader(dataset, batch_size=64, shuffle=True, device=device,
+                                            num_workers=num_workers)
+        val_dataloader = DeviceDataLoader(SegmenterDataset(mask=val_mask,
+                                                           processed_folder=processed_folder,
+                                                           transform_images=False),
+                                          batch_size=64, shuffle=True, device=device, num_workers=num_workers)
+        test_dataloader = DeviceDataLoader(SegmenterDataset(mask=test_mask,
+                                                            processed_folder=processed_folder,
+                                                            transform_images=False),
+                                           batch_size=64, device=device, num_workers=num_workers,
+                                           persistent_workers=False)
+
+        model_dir.mkdir(exist_ok=True)
         train_segmenter(model, train_dataloader, val_dataloader, max_epochs=max_epochs,
-                        warmup=warmup, patience=patience)
+                        warmup=warmup, patience=patience, lr_patience=lr_patience,
+                        accumulation_steps=accumulation_steps,
+                        autocast_dtype=torch.bfloat16 if mixed_precision else None,
+                        checkpoint_path=checkpoint_path, resume=resume,
+                        checkpoint_data={'masks': (train_mask, val_mask, test_mask)})
 
-        if not model_dir.exists(): model_dir.mkdir()
         torch.save(model.state_dict(), model_dir / 'segmenter.model')
 
         print("Generating test results")
@@ -266,11 +360,106 @@ class RunTask:
                              data_folder=data_folder, device=device)
 
 
+    @staticmethod
+    def export_models(data_folder=Path(__file__).parent.parent / "data",
+                      retrained: bool = False,
+                      formats=("torchscript", "onnx"),
+                      imsize: int = 224):
+        """Export the trained classifier and segmenter to TorchScript (<model name>.pt) and
+        ONNX (<model name>.onnx), next to the saved models. Exported models can be used for
+        inference without the solarnet code, see the runtime argument of classify_new_data
+        and segment_new_data
+
+        Parameters
+        ----------
+        data_folder: pathlib.Path
+            Path of the data folder, which should be set up as described in `data/README.md`
+        retrained: bool, default False, If the retrained classifier should be exported
+        formats: tuple, default: ("torchscript", "onnx")
+            The formats to export the models to
+        imsize: int, default: 224
+            The size of the images the models are traced with
+        """
+        model_dir = data_folder / 'models'
+        models = [(Classifier(imagenet_base=False), 'classifier_retrained.model' if retrained else 'classifier.model'),
+                  (Segmenter(), 'segmenter.model')]
+        for model, model_name in models:
+            if not (model_dir / model_name).exists():
+                print(f"{model_dir / model_name} does not exist, skipping it")
+                continue
+            model.load_state_dict(torch.load(model_dir / model_name, map_location='cpu'))
+            if "torchscript" in formats:
+                export_torchscript(model, model_dir / f'{model_name.split(".")[0]}.pt', imsize=imsize)
+            if "onnx" in formats:
+                export_onnx(model, model_dir / f'{model_name.split(".")[0]}.onnx', imsize=imsize)
+            print(f"Exported {model_name} to {', '.join(formats)}")
+
+    @staticmethod
+    def quantize_classifier(data_folder=Path(__file__).parent.parent / "new_data",
+                            retrained: bool = False,
+                            n_calibration_batches: int = 10,
+                            batch_size: int = 64,
+                            num_workers: int = min(4, os.cpu_count() or 1),
+                            backend: str = 'x86'):
+        """Quantize the trained classifier to INT8 for CPU inference, calibrating it on the
+        new data, and compare it to the float classifier. The quantized model is saved
+        next to the float one as <model name>_int8.pt, and the comparison in
+        results/Quantization_Report.json
+
+        Parameters
+        ----------
+        data_folder: pathlib.Path
+            Path of the folder containing the new images (in processed) used for calibration
+        retrained: bool, default False, If the retrained model should be quantized
+        n_calibration_batches: int, default: 10
+            The number of batches of new images used to calibrate the quantized model
+        batch_size: int, default: 64
+            The number of images per batch
+        num_workers: int, default: min(4, number of cpus)
+            The number of worker processes loading the images
+        backend: str, default: 'x86'
+            The quantized engine, 'x86' for x86 servers and 'qnnpack' for ARM
+        """
+        model_dir = Path(__file__).parent.parent / "data" / 'models'
+        model_path = model_dir / ('classifier_retrained.model' if retrained else 'classifier.model')
+        model = Classifier(imagenet_base=False)
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        model.eval()
+
+        # calibrate on all new images, compare on the labeled validation images if there are any
+        calibration_dataset = ClassifierDataset(processed_folder=data_folder / "processed", labeled=False)
+        calibration_dataloader = DeviceDataLoader(calibration_dataset, batch_size=batch_size, shuffle=True,
+                                                  device=torch.device('cpu'), num_workers=num_workers,
+                                                  persistent_workers=False)
+        quantized_model = quantize_classifier(model, calibration_dataloader, n_batches=n_calibration_batches,
+                                              backend=backend)
+        quantized_path = model_dir / f'{model_path.name.split(".")[0]}_int8.pt'
+        save_quantized_classifier(quantized_model, quantized_path)
+        print(f"Quantized classifier saved in {quantized_path}")
+
+        val_dataset = ClassifierDataset(processed_folder=data_folder / "processed", labeled=True, train=False)
+        compare_dataset = val_dataset if len(val_dataset) > 0 else calibration_dataset
+        report = compare_classifiers(model, load_quantized_classifier(quantized_path, backend=backend),
+                                     make_inference_dataloader(compare_dataset, batch_size=batch_size,
+                                                               num_workers=num_workers))
+        report['model'] = model_path.name
+        print(pd.Series(report).to_string())
+
+        (data_folder.parent.parent / "results").mkdir(exist_ok=True)
+        with open(data_folder.parent.parent / "results" / "Quantization_Report.json", 'w') as f:
+            json.dump(report, f, indent=2)
+
     @staticmethod
     def classify_new_data(data_folder=Path(__file__).parent.parent / "new_data", 
                         device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu'),
                         retrained: bool=False,
                         labeled: bool = True,
+                        batch_size: int = 64,
+                        num_workers: int = min(4, os.cpu_count() or 1),
+                        threshold: float = 0.5,
+                        resume: bool = True,
+                        quantized: bool = False,
+                        runtime: str = "torch",
                         ):
         """Predict on new data using the trained classifier model
 
@@ -286,50 +475,92 @@ class RunTask:
         labeled: bool, default True, If the data was labelled the labels will be used to check model accuracy
         train: bool, default False, The validation for accuracy is done based on data in different val folders, data that the model hasnt seen yet. If train=True 
         the same data which it was retrained on will be used in the ClassifierDataset. If the model has not been retrained, it doesnt matter
+        batch_size: int, default: 64
+            The number of images classified at a time
+        num_workers: int, default: min(4, number of cpus)
+            The number of worker processes loading and normalizing the images. 0 loads them in the main process
+        threshold: float, default: 0.5
+            The probability above which a building is predicted to have PV
+        resume: bool, default: True
+            The probabilities are saved batch by batch in results/Classifier_Probabilities.csv, together with the
+            osmid, source tif and model version. If True, images already classified by the same model version are
+            not classified again, so an interrupted run continues where it stopped
+        quantized: bool, default False
+            If True, the INT8 classifier saved by quantize_classifier is used, on the cpu. Only
+            with the "torch" runtime
+        runtime: str, default "torch"
+            "torch" runs the Classifier model. "torchscript" or "onnx" run the classifier exported by
+            export_models on the cpu, with TorchScript or ONNX Runtime
         """
-        def save_as_png(target_folder: Path, file_path: Path):
-            """saves the file under 'file_path' in the target folder as png """
-            np_array = np.load(file_path)
+        def save_as_png(target_folder: Path, index: int):
+            """saves the image 'index' of the dataset in the target folder as png """
+            np_array = classifier_dataset.load_image(index)
             img = np.moveaxis(np_array, 0, -1) 
             img = Image.fromarray(img.astype('uint8'))
-            img.save(target_folder / file_path.name.replace(".npy", ".png"))
+            img.save(target_folder / f"{classifier_dataset.ids[index]}.png")
         
 
-        new_data_folder = data_folder / "processed"
+        check_runtime(runtime)
+        if quantized and runtime != "torch":
+            raise ValueError(f"The quantized classifier only runs with the torch runtime, not {runtime!r}")
 
-        # Load the new data 
-        classifier_dataset = ClassifierDataset(processed_folder=new_data_folder, labeled=labeled, train=False)
+        new_data_folder = data_folder / "processed"
 
-        new_dataloader = DataLoader(classifier_dataset, batch_size=64, shuffle=False)
-        
         # Load the appropriate model based on the model_type parameter
         model_dir = Path(__file__).parent.parent / "data" / 'models'
-        model = Classifier()
         if retrained:
             model_path = model_dir / 'classifier_retrained.model'
         else:
             model_path = model_dir / 'classifier.model'
 
-        # Load the model's state_dict
-        model.load_state_dict(torch.load(model_path, map_location=device))
-        model.eval()  # Set model to evaluation mode
-        
-        if device.type != 'cpu': model = model.cuda()
-        
-        print("Generating test results")
-        preds, true = [], []
-        with torch.no_grad():
-            for test_x, test_y in tqdm(new_dataloader):
-                test_preds = model(test_x)
-                preds.append(test_preds.squeeze(1).cpu().numpy().round())
-                true.append(test_y.cpu().numpy())
+        if quantized:
+            # quantized models only run on the cpu
+            model_path = model_dir / f'{model_path.name.split(".")[0]}_int8.pt'
+            model = load_quantized_classifier(model_path)
+            device = torch.device('cpu')
+        elif runtime in ["torchscript", "onnx"]:
+            # exported models are run on the cpu
+            model_path = model_dir / f'{model_path.name.split(".")[0]}.{"pt" if runtime == "torchscript" else "onnx"}'
+            model = load_exported_model(model_path)
+            device = torch.device('cpu')
+        else:
+            # the ResNet is only built for the torch runtime, without downloading the imagenet
+            # weights, which are replaced by the saved ones
+            model = Classifier(imagenet_base=False)
+            # Load the model's state_dict
+            model.load_state_dict(torch.load(model_path, map_location=device))
+            model.eval()  # Set model to evaluation mode
+
+            if device.type != 'cpu': model = model.cuda()
 
-        # real_labels = classifier_dataset.y.cpu().numpy()
-        predicted = np.concatenate(preds)
+        # Load the new data, images are loaded on the cpu by the dataloader workers and copied to the device by batch
+        classifier_dataset = ClassifierDataset(processed_folder=new_data_folder, labeled=labeled, train=False)
+        building_ids = classifier_dataset.ids
+        osmids = [building_id.replace("building_", "") for building_id in building_ids]
+
+        # the probabilities are written batch by batch: images already classified by this model are skipped
+        probabilities_file = data_folder.parent.parent / "results" / "Classifier_Probabilities.csv"
+        model_version = get_model_version(model_path)
+        if resume:
+            remaining = np.flatnonzero(~PredictionWriter(probabilities_file, model_version).contains(osmids))
+        else:
+            remaining = np.arange(len(classifier_dataset))
+        writer = PredictionWriter(probabilities_file, model_version, osmids=np.asarray(osmids)[remaining],
+                                  tifs=classifier_dataset.tifs[remaining])
+        print(f"{len(classifier_dataset) - len(remaining)} images already classified by {writer.model_version}")
+
+        new_dataloader = make_inference_dataloader(Subset(classifier_dataset, remaining), batch_size=batch_size,
+                                                   num_workers=num_workers, device=device)
+
+        print("Generating test results")
+        predict_classifier(model, new_dataloader, device=device, writer=writer)
+        results = writer.read().set_index("osmid").loc[osmids]
+        probabilities = results["probability"].values
+        true_labels = results["label"].values.astype(float)
+        predicted = (probabilities >= threshold).astype(float)
         
         # Save predictions for analysis
         np.save(model_dir / f'{model_path.name.split(".")[0]}_new_preds.npy', predicted)
-        building_ids = [f'{f.name.replace(".npy", "")}' for f in classifier_dataset.x_files]
         # save the predictions to a csv file:
         df = pd.DataFrame({
             'OSM_ID': building_ids,    
@@ -349,7 +580,6 @@ class RunTask:
             [f.unlink() for f in not_identified_folder.iterdir()]
             [f.unlink() for f in wrongly_identified_folder.iterdir()]
 
-            true_labels = np.concatenate(true)  # true labels and real label
             comparison = true_labels == predicted
             print(f"identified {np.round(np.sum(comparison) / len(true_labels) * 100, 2)}% of roofs correctly")
 
@@ -358,16 +588,16 @@ class RunTask:
             for i, label in enumerate(true_labels):
                 if label == 1 and predicted[i] == 0:
                     not_identified += 1
-                    save_as_png(not_identified_folder, classifier_dataset.x_files[i])
+                    save_as_png(not_identified_folder, i)
                 if label == 0 and predicted[i] == 1:
                     wrong_indentified += 1
-                    save_as_png(wrongly_identified_folder, classifier_dataset.x_files[i])
+                    save_as_png(wrongly_identified_folder, i)
 
             print(f"False negative: {np.round(not_identified / true_labels.sum() * 100, 2)} % ({not_identified}) of all PVs ({true_labels.sum()}) were not identified")
             print(f"False positive: {np.round(wrong_indentified / (len(predicted)-true_labels.sum()) * 100, 2)}%  ({wrong_indentified}) of all buildings without PV ({len(predicted)-true_labels.sum()}) were identified wrongly of having PV")
-            np.save(model_dir / f'{model_path.name.split(".")[0]}_new_true.npy', np.concatenate(true))
+            np.save(model_dir / f'{model_path.name.split(".")[0]}_new_true.npy', true_labels)
 
-            plot_roc_curve(y_true=true_labels, y_scores=predicted)
+            plot_roc_curve(y_true=true_labels, y_scores=probabilities)
             plot_confusion_matrix(y_true=true_labels, y_pred=predicted)
 
 
@@ -375,7 +605,8 @@ class RunTask:
 
     @staticmethod
     def segment_new_data(data_folder=Path(__file__).parent.parent / "new_data",
-                         device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')):
+                         device=torch.device('cuda:0' if torch.cuda.is_available() else 'cpu'),
+                         runtime: str = "torch"):
               
         """Predict on new data using the trained segmenter model
 
@@ -387,24 +618,34 @@ class RunTask:
             Path of the folder containing the new images to predict on
         device: torch.device, default: cuda if available, else cpu
             The device to perform predictions on
+        runtime: str, default "torch"
+            "torch" runs the Segmenter model. "torchscript" or "onnx" run the segmenter exported by
+            export_models on the cpu, with TorchScript or ONNX Runtime
         """
+        check_runtime(runtime)
 
         new_data_folder = data_folder / "processed"
 
         segmenter_dataset = SegmenterDataset(processed_folder=new_data_folder, transform_images=False)
-        new_dataloader = DataLoader(segmenter_dataset, batch_size=64)
         
         # Load the appropriate model based on the model_type parameter
         model_dir = Path("data") / 'models'
         model_type = "Segmenter"
-        model = Segmenter()
-        model_path = model_dir / 'segmenter.model'
+        if runtime in ["torchscript", "onnx"]:
+            # exported models are run on the cpu
+            model = load_exported_model(model_dir / f'segmenter.{"pt" if runtime == "torchscript" else "onnx"}')
+            device = torch.device('cpu')
+        else:
+            model = Segmenter()
+            model_path = model_dir / 'segmenter.model'
 
-        # Load the model's state_dict
-        model.load_state_dict(torch.load(model_path, map_location=device))
-        model.eval()  # Set model to evaluation mode
-        
-        if device.type != 'cpu': model = model.cuda()
+            # Load the model's state_dict
+            model.load_state_dict(torch.load(model_path, map_location=device))
+            model.eval()  # Set model to evaluation mode
+
+            if device.type != 'cpu': model = model.cuda()
+
+        new_dataloader = DeviceDataLoader(segmenter_dataset, batch_size=64, device=device, persistent_workers=False)
             
         print("Generating test results")
         images, preds, true = [], [], []
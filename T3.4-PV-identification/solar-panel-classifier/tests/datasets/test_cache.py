@@ -0,0 +1,45 @@
+import numpy as np
+import torch
+
+from solarnet.datasets import ChipCache, ChipStore, ClassifierDataset, DeviceDataLoader
+
+
+class TestChipCache:
+
+    def test_lru_fallback(self):
+        images = np.random.randint(0, 255, size=(6, 3, 4, 4), dtype=np.uint8)
+        loads = []
+
+        def load(index):
+            loads.append(index)
+            return images[index]
+
+        # 2 images fit in the shared block, 2 more in the lru cache
+        cache = ChipCache(6, (3, 4, 4), memory_budget=2 * images[0].nbytes, lru_images=2)
+        for index in [0, 1, 2, 3, 0, 1, 2, 3, 4, 2]:
+            assert (cache.get(index, load) == images[index]).all()
+
+        assert cache.capacity == 2 and len(cache) == 2
+        assert loads == [0, 1, 2, 3, 4, 2], f'Got loads {loads}'
+
+    def test_shared_by_workers(self, tmp_path):
+        chips = np.random.randint(1, 255, size=(8, 3, 8, 8), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(chips, osmids=range(8), labels=[0, 1] * 4)
+        store.set_splits(range(8), ['train'] * 8)
+
+        dataset = ClassifierDataset(processed_folder=tmp_path, normalize=False)
+        dataset.add_mask([True] * 6 + [False] * 2)
+        assert dataset.cache is None
+        dataset.build_cache(2 ** 20)
+        assert dataset.cache.capacity == 6
+        dataloader = DeviceDataLoader(dataset, batch_size=4, device=torch.device('cpu'), num_workers=2)
+        list(dataloader)
+        assert len(dataset.cache) == 6, 'Images loaded by the workers should be cached for all processes'
+
+        # the second epoch reads the images from the cache, not from the store
+        array = store._get_array()
+        array[:] = 0
+        array.flush()
+        x = torch.cat([x for x, _ in dataloader])
+        assert np.array_equal(x.numpy(), chips[:6])
@@ -0,0 +1,57 @@
+import numpy as np
+import torch
+
+from solarnet.datasets import ChipStore, ClassifierDataset
+
+
+class TestChipStore:
+
+    def test_append_and_read(self, tmp_path):
+        store = ChipStore(tmp_path / 'chips', imsize=8, capacity=2)
+        chips = np.random.randint(0, 255, size=(5, 3, 8, 8), dtype=np.uint8)
+
+        positions = store.append(chips[:3], osmids=[10, 11, 12], tif='a.tif')
+        # the array grows beyond the initial capacity, and existing osmids are skipped
+        positions_2 = store.append(chips[2:], osmids=[12, 13, 14], tif='b.tif')
+
+        assert (positions == [0, 1, 2]).all(), f'Got positions {positions}'
+        assert (positions_2 == [-1, 3, 4]).all(), f'Got positions {positions_2}'
+        assert len(store) == 5
+
+        # a new store on the same folder reads the same chips
+        store = ChipStore(tmp_path / 'chips')
+        index = store.get_index()
+        assert (index['osmid'] == [10, 11, 12, 13, 14]).all()
+        assert (index['tif'] == ['a.tif'] * 3 + ['b.tif'] * 2).all()
+        assert np.array_equal(store.get_chips(index['position']), chips)
+        assert isinstance(store[0], np.memmap), 'Chips should be read without copies'
+        assert store.contains([11, 15]).tolist() == [True, False]
+
+    def test_labels_splits_and_shards(self, tmp_path):
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(np.zeros((6, 3, 8, 8), dtype=np.uint8), osmids=range(6))
+        store.set_labels([0, 1, 2, 3], [1, 0, 1, 0])
+        store.set_splits([0, 1, 2], ['train', 'train', 'val'])
+
+        assert len(store.get_index(labeled=True)) == 4
+        assert len(store.get_index(labeled=False)) == 2
+        assert store.get_index(split='train')['osmid'].tolist() == [0, 1]
+
+        shards = [store.get_index(shard=(i, 3))['osmid'].tolist() for i in range(3)]
+        assert sorted(sum(shards, [])) == list(range(6)), 'Shards should cover all chips'
+        assert all(len(shard) == 2 for shard in shards)
+
+    def test_classifier_dataset(self, tmp_path):
+        chips = np.random.randint(0, 255, size=(4, 3, 8, 8), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(chips, osmids=[1, 2, 3, 4], labels=[1, 0, 1, -1])
+        store.set_splits([1, 2, 3], ['train', 'train', 'val'])
+
+        dataset = ClassifierDataset(processed_folder=tmp_path, normalize=False)
+        assert len(dataset) == 2
+        assert dataset.ids == ['building_1', 'building_2']
+        x, y = dataset[1]
+        assert x.dtype == torch.uint8 and torch.equal(x, torch.as_tensor(chips[1])) and y == 0
+
+        unlabeled = ClassifierDataset(processed_folder=tmp_path, labeled=False)
+        assert len(unlabeled) == 4
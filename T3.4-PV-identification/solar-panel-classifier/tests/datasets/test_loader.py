@@ -0,0 +1,25 @@
+import numpy as np
+import torch
+
+from solarnet.datasets import ChipStore, ClassifierDataset, DeviceDataLoader
+from solarnet.datasets.utils import normalize
+
+
+class TestLoader:
+
+    def test_device_dataloader(self, tmp_path):
+        chips = np.random.randint(0, 255, size=(10, 3, 8, 8), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(chips, osmids=range(10), labels=[0, 1] * 5)
+        store.set_splits(range(10), ['train'] * 10)
+        dataset = ClassifierDataset(processed_folder=tmp_path)
+
+        # the images are loaded by worker processes, and normalized by batch
+        dataloader = DeviceDataLoader(dataset, batch_size=4, device=torch.device('cpu'), num_workers=2)
+        for _ in range(2):
+            batches = list(dataloader)
+            x = torch.cat([x for x, _ in batches])
+            y = torch.cat([y for _, y in batches])
+            assert len(batches) == len(dataloader) == 3
+            assert x.dtype == torch.float32 and np.allclose(x.numpy(), normalize(chips), atol=1e-5)
+            assert y.tolist() == [0, 1] * 5
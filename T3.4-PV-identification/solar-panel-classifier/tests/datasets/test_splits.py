@@ -0,0 +1,49 @@
+import numpy as np
+
+from solarnet.datasets import SplitTable
+from solarnet.datasets.splits import hash_splits
+
+
+class TestSplits:
+
+    def test_hash_splits(self):
+        ids = [f'building_{i}' for i in range(10000)]
+        splits = hash_splits(ids, val_size=0.1, test_size=0.2)
+
+        assert np.isclose((splits == 'val').sum(), 1000, rtol=0.1)
+        assert np.isclose((splits == 'test').sum(), 2000, rtol=0.1)
+        # the split of an id does not depend on the other ids
+        assert (hash_splits(ids[::-1][:500], 0.1, 0.2) == splits[::-1][:500]).all()
+
+    def test_split_table(self, tmp_path):
+        table = SplitTable(tmp_path / 'splits.csv')
+        ids = [f'building_{i}' for i in range(1000)]
+        splits = table.get_splits(ids)
+        assert (tmp_path / 'splits.csv').exists()
+
+        # new images are added without changing the splits of the existing ones,
+        # even with other sizes
+        new_ids = [f'building_{i}' for i in range(1000, 1100)]
+        all_splits = SplitTable(tmp_path / 'splits.csv').get_splits(ids[::-1] + new_ids, test_size=0.5)
+        assert (all_splits[:1000] == splits[::-1]).all()
+        assert len(table.read()) == 1100
+
+        train_mask, val_mask, test_mask = table.masks(ids)
+        assert (train_mask.astype(int) + val_mask + test_mask == 1).all()
+        assert (test_mask == (splits == 'test')).all()
+
+    def test_grouped_splits(self, tmp_path):
+        table = SplitTable(tmp_path / 'splits.csv')
+        ids = [f'{i}' for i in range(2000)]
+        groups = [f'tif_{i % 100}' for i in range(2000)]
+        splits = table.get_splits(ids, groups)
+
+        # all the images of a group are in the same split
+        by_group = {}
+        for group, split in zip(groups, splits): by_group.setdefault(group, set()).add(split)
+        assert all(len(group_splits) == 1 for group_splits in by_group.values())
+        assert {'train', 'val', 'test'} == set(splits)
+
+        # new images of a known group go to its split
+        new_splits = table.get_splits(['new'], ['tif_3'], test_size=0.9)
+        assert new_splits[0] == by_group['tif_3'].pop()
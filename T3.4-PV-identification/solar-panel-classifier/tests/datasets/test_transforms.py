@@ -1,6 +1,7 @@
 import numpy as np
+import torch
 
-from solarnet.datasets.transforms import no_change, horizontal_flip, vertical_flip
+from solarnet.datasets.transforms import no_change, horizontal_flip, vertical_flip, BatchTransform
 
 
 class TestTransforms:
@@ -27,3 +28,35 @@ class TestTransforms:
             for t_channel in transformed_im:
                 assert (t_channel == transformed_m).all(), \
                     'Mask not consistent with image after transform!'
+
+    def test_batch_transform(self):
+        """Tests that every image of the batch is transformed as by one of
+        the numpy transforms, consistently with its mask
+        """
+        images = np.random.randint(0, 255, size=(32, 3, 16, 16), dtype=np.uint8)
+        masks = np.random.randint(0, 2, size=(32, 16, 16), dtype=np.uint8)
+
+        t_images, t_masks = BatchTransform(seed=0)(torch.as_tensor(images), torch.as_tensor(masks))
+        t_images, t_masks = t_images.numpy(), t_masks.numpy()
+        assert t_images.dtype == np.uint8
+
+        n_jittered = 0
+        for image, mask, t_image, t_mask in zip(images, masks, t_images, t_masks):
+            references = [transform(image, mask) for transform in [no_change, horizontal_flip,
+                                                                     vertical_flip]]
+            if any((t_image == r_image).all() and (t_mask == r_mask).all()
+                   for r_image, r_mask in references):
+                continue
+            # colour jitter adds noise in [0, 30), clipped to 255
+            noise = t_image.astype(int) - image
+            assert (t_mask == mask).all() and (noise >= 0).all() and (noise < 30).all()
+            n_jittered += 1
+        assert 0 < n_jittered < 32
+
+    def test_batch_transform_seed(self):
+        images = torch.randint(0, 255, size=(8, 3, 16, 16), dtype=torch.uint8)
+
+        assert torch.equal(BatchTransform(seed=1)(images), BatchTransform(seed=1)(images))
+        transform = BatchTransform(seed=1)
+        assert not torch.equal(transform(images), transform(images)), \
+            'Transforms should change from batch to batch'
@@ -1,6 +1,7 @@
 import numpy as np
+import torch
 
-from solarnet.datasets.utils import normalize, denormalize, make_masks
+from solarnet.datasets.utils import normalize, denormalize, make_masks, MEAN, STD
 
 
 class TestUtils:
@@ -14,6 +15,17 @@ class TestUtils:
         assert np.allclose(input_image, reconstructed_image, atol=1), \
             f'Image not properly reconstructed'
 
+    def test_normalize_float32(self):
+        images = np.random.randint(low=0, high=255, size=(4, 3, 32, 32), dtype=np.uint8)
+        # the reference, in float64
+        expected = (images / 255 - np.array(MEAN).reshape(1, -1, 1, 1)) / np.array(STD).reshape(1, -1, 1, 1)
+
+        for normalized in [normalize(images), normalize(torch.as_tensor(images)).numpy()]:
+            assert normalized.dtype == np.float32
+            assert np.allclose(normalized, expected, atol=1e-5)
+        assert np.allclose(normalize(images[0]), expected[0], atol=1e-5), \
+            'Single images should be normalized as the batches'
+
     def test_make_mask(self):
 
         mask_length = 10000
@@ -0,0 +1,34 @@
+import pytest
+import torch
+
+from solarnet.models import Classifier, Segmenter, export_torchscript, export_onnx, load_exported_model
+
+
+class TestExport:
+
+    @pytest.mark.parametrize('model_class,imsize', [(Classifier, 224), (Segmenter, 64)])
+    def test_torchscript(self, tmp_path, model_class, imsize):
+        model = model_class(imagenet_base=False).eval()
+        export_torchscript(model, tmp_path / 'model.pt', imsize=imsize)
+
+        # the batch size of the exported model is not fixed
+        x = torch.rand(3, 3, imsize, imsize)
+        with torch.inference_mode():
+            assert torch.allclose(load_exported_model(tmp_path / 'model.pt')(x), model(x))
+
+    @pytest.mark.parametrize('model_class,imsize', [(Classifier, 224), (Segmenter, 64)])
+    def test_onnx(self, tmp_path, model_class, imsize):
+        pytest.importorskip('onnxruntime')
+        model = model_class(imagenet_base=False).eval()
+        export_onnx(model, tmp_path / 'model.onnx', imsize=imsize)
+
+        x = torch.rand(3, 3, imsize, imsize)
+        with torch.inference_mode():
+            assert torch.allclose(load_exported_model(tmp_path / 'model.onnx')(x), model(x), atol=1e-5)
+
+    def test_segmenter_without_hooks(self):
+        model = Segmenter(imagenet_base=False).eval()
+        with torch.inference_mode():
+            model(torch.rand(1, 3, 64, 64))
+        assert not any(hasattr(child, 'output') for child in model.pretrained.children()), \
+            'The segmenter should not store outputs on its modules'
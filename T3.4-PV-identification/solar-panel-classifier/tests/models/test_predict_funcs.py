@@ -0,0 +1,63 @@
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import Subset
+
+from solarnet.datasets import ChipStore, ClassifierDataset
+from solarnet.datasets.utils import normalize
+from solarnet.models import make_inference_dataloader, predict_classifier, PredictionWriter
+
+
+class MeanModel(nn.Module):
+    """Predicts the mean of the (normalized) image, squashed into [0, 1]
+    """
+    def forward(self, x):
+        return torch.sigmoid(x.mean(dim=(1, 2, 3))).unsqueeze(1)
+
+
+class TestPredictFuncs:
+
+    def test_predict_classifier(self, tmp_path):
+        chips = np.random.randint(0, 255, size=(10, 3, 8, 8), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(chips, osmids=range(10))
+
+        dataset = ClassifierDataset(processed_folder=tmp_path, labeled=False)
+        expected = MeanModel()(torch.as_tensor(normalize(chips)).float())
+
+        # the predictions of the worker processes are returned in the order of the dataset
+        dataloader = make_inference_dataloader(dataset, batch_size=3, num_workers=2)
+        preds, true = predict_classifier(MeanModel(), dataloader)
+
+        assert np.allclose(preds, expected.squeeze(1).numpy(), atol=1e-6)
+        assert (true == 2).all() and len(true) == 10
+
+    def test_prediction_writer(self, tmp_path):
+        chips = np.random.randint(0, 255, size=(10, 3, 8, 8), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips', imsize=8)
+        store.append(chips, osmids=range(10), tif='a.tif')
+        dataset = ClassifierDataset(processed_folder=tmp_path, labeled=False)
+
+        # a first run, interrupted after the first batches
+        writer = PredictionWriter(tmp_path / 'preds.csv', 'v1', osmids=dataset.osmids[:6],
+                                  tifs=dataset.tifs[:6])
+        predict_classifier(MeanModel(), make_inference_dataloader(Subset(dataset, range(6)),
+                                                                  batch_size=4, num_workers=0),
+                           writer=writer)
+        assert writer.contains(range(10)).tolist() == [True] * 6 + [False] * 4
+        assert not PredictionWriter(tmp_path / 'preds.csv', 'v2').contains([0]).any(), \
+            'Predictions of other model versions should not be used'
+
+        # the second run only classifies the remaining images
+        remaining = np.flatnonzero(~writer.contains(dataset.osmids))
+        writer = PredictionWriter(tmp_path / 'preds.csv', 'v1', osmids=dataset.osmids[remaining],
+                                  tifs=dataset.tifs[remaining])
+        predict_classifier(MeanModel(), make_inference_dataloader(Subset(dataset, remaining),
+                                                                  batch_size=4, num_workers=0),
+                           writer=writer)
+
+        results = writer.read()
+        expected, _ = predict_classifier(MeanModel(), make_inference_dataloader(dataset, num_workers=0))
+        assert results['osmid'].tolist() == [str(i) for i in range(10)]
+        assert (results['tif'] == 'a.tif').all()
+        assert np.allclose(results['probability'], expected, atol=1e-6)
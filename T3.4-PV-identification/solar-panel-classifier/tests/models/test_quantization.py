@@ -0,0 +1,36 @@
+import numpy as np
+import torch
+
+from solarnet.datasets import ChipStore, ClassifierDataset
+from solarnet.models import (Classifier, make_inference_dataloader, quantize_classifier,
+                             save_quantized_classifier, load_quantized_classifier,
+                             compare_classifiers)
+
+
+class TestQuantization:
+
+    def test_quantize_classifier(self, tmp_path):
+        # the quantization error of an untrained model on noise varies a lot with the weights
+        # and images: they are seeded (with predictions which are not saturated)
+        np.random.seed(3)
+        torch.manual_seed(3)
+        chips = np.random.randint(0, 255, size=(8, 3, 224, 224), dtype=np.uint8)
+        store = ChipStore(tmp_path / 'chips')
+        store.append(chips, osmids=range(8))
+        dataset = ClassifierDataset(processed_folder=tmp_path, labeled=False)
+        dataloader = make_inference_dataloader(dataset, batch_size=4, num_workers=0)
+
+        model = Classifier(imagenet_base=False).eval()
+        quantized_model = quantize_classifier(model, dataloader, n_batches=2)
+        save_quantized_classifier(quantized_model, tmp_path / 'classifier_int8.pt')
+        loaded_model = load_quantized_classifier(tmp_path / 'classifier_int8.pt')
+
+        x, _ = next(iter(dataloader))
+        with torch.inference_mode():
+            assert torch.allclose(quantized_model(x), loaded_model(x))
+            assert torch.allclose(model(x), loaded_model(x), atol=0.05), \
+                'Quantized predictions should be close to the float ones'
+
+        report = compare_classifiers(model, loaded_model, dataloader)
+        assert report['n_images'] == 8 and report['max_abs_difference'] < 0.05
+        assert 'float_auc_roc' not in report, 'AUC ROC should only be computed for labeled images'
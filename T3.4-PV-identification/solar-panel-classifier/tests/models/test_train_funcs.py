@@ -0,0 +1,95 @@
+import numpy as np
+import torch
+from torch import nn
+
+from solarnet.datasets import ChipStore, ClassifierDataset, DeviceDataLoader
+from solarnet.models import train_classifier, load_checkpoint
+import solarnet.models.train_funcs as train_funcs
+
+
+class TinyClassifier(nn.Module):
+    """A small model with a `pretrained` base and a `classifier` head, like Classifier
+    """
+    def __init__(self):
+        super().__init__()
+        self.pretrained = nn.Sequential(nn.Conv2d(3, 4, 3, padding=1), nn.ReLU())
+        self.classifier = nn.Sequential(nn.Flatten(), nn.Linear(4 * 8 * 8, 1), nn.Sigmoid())
+
+    def forward(self, x):
+        return self.classifier(self.pretrained(x))
+
+
+def make_chip_store(tmp_path):
+    labels = np.arange(40) % 2
+    chips = np.random.randint(0, 200, size=(40, 3, 8, 8), dtype=np.uint8)
+    chips[labels == 1, :, 2:6, 2:6] = 255
+    store = ChipStore(tmp_path / 'chips', imsize=8)
+    store.append(chips, osmids=range(40), labels=labels)
+    store.set_splits(range(40), ['train'] * 30 + ['val'] * 10)
+
+
+def make_dataloaders(tmp_path):
+    kwargs = dict(batch_size=8, device=torch.device('cpu'), num_workers=0)
+    return (DeviceDataLoader(ClassifierDataset(tmp_path, transform_images=True), shuffle=True,
+                             seed=0, **kwargs),
+            DeviceDataLoader(ClassifierDataset(tmp_path, train=False), **kwargs))
+
+
+class TestTrainFuncs:
+
+    def test_train_classifier(self, tmp_path, monkeypatch):
+        make_chip_store(tmp_path)
+        train_dataloader, val_dataloader = make_dataloaders(tmp_path)
+
+        # record the optimizers and the weights after every epoch
+        optimizers, states, aucs = [], [], iter([0.6, 0.9, 0.7, 0.8, 0.95])
+        train_epoch = train_funcs._train_classifier_epoch
+
+        def fake_epoch(model, optimizer, *args, **kwargs):
+            train_epoch(model, optimizer, *args, **kwargs)
+            optimizers.append(optimizer)
+            states.append({k: v.clone() for k, v in model.state_dict().items()})
+            return next(aucs)
+
+        monkeypatch.setattr(train_funcs, '_train_classifier_epoch', fake_epoch)
+        model = TinyClassifier()
+        train_classifier(model, train_dataloader, val_dataloader, warmup=1, patience=2,
+                         max_epochs=5, accumulation_steps=2, autocast_dtype=torch.bfloat16)
+
+        # a single optimizer, whose state is kept across epochs
+        assert len(optimizers) == 4 and all(o is optimizers[0] for o in optimizers)
+        assert all(p.requires_grad for p in model.parameters())
+        # the base was frozen during warmup, then trained
+        assert torch.equal(states[0]['pretrained.0.weight'], states[1]['pretrained.0.weight'])
+        assert not torch.equal(states[1]['pretrained.0.weight'], states[2]['pretrained.0.weight'])
+        # early stopping after 2 epochs without improvement, and the best weights are loaded
+        for name, tensor in model.state_dict().items():
+            assert torch.equal(tensor, states[1][name])
+
+    def test_resume(self, tmp_path):
+        make_chip_store(tmp_path)
+        checkpoint_path = tmp_path / 'classifier.checkpoint'
+        kwargs = dict(warmup=1, patience=10, lr_patience=1)
+
+        torch.manual_seed(0)
+        model = TinyClassifier()
+        train_classifier(model, *make_dataloaders(tmp_path), max_epochs=5, **kwargs)
+
+        # the same training, interrupted after 3 epochs
+        torch.manual_seed(0)
+        train_classifier(TinyClassifier(), *make_dataloaders(tmp_path), max_epochs=3,
+                         checkpoint_path=checkpoint_path, checkpoint_data={'masks': [True, False]},
+                         **kwargs)
+        checkpoint = load_checkpoint(checkpoint_path)
+        assert checkpoint['epoch'] == 2 and not checkpoint['finished']
+        # the learning rate scheduler does not step during the warmup
+        assert checkpoint['scheduler']['last_epoch'] == 1
+        assert checkpoint['data'] == {'masks': [True, False]}
+
+        torch.manual_seed(1)
+        resumed = TinyClassifier()
+        train_classifier(resumed, *make_dataloaders(tmp_path), max_epochs=5,
+                         checkpoint_path=checkpoint_path, resume=True, **kwargs)
+        assert load_checkpoint(checkpoint_path)['epoch'] == 4
+        for name, tensor in model.state_dict().items():
+            assert torch.allclose(tensor, resumed.state_dict()[name])
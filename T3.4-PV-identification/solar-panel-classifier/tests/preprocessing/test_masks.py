@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 
-from solarnet.preprocessing.masks import MaskMaker, IMAGE_SIZES
+from solarnet.preprocessing.masks import MaskMaker, IMAGE_SIZES, save_mask, load_mask
 
 
 class TestMasks:
@@ -60,6 +60,24 @@ class TestMasks:
         for zone in exclusion_zones:
             assert (zone == 0).all(), f'Got 1-valued pixels outside the masked area'
 
+    def test_draw_polygon(self):
+        """Only the bounding box of the polygon is rasterized, with the same result as
+        testing every pixel of the image
+        """
+        from matplotlib.path import Path as PolygonPath
+
+        coords = [(1.5, 3), (7.2, 0.5), (12, 9.5), (4, 14)]  # partly outside the image
+        x, y = np.mgrid[:10, :12]
+        expected = PolygonPath(coords).contains_points(np.stack([x.ravel(), y.ravel()], axis=1))
+
+        mask = np.zeros((10, 12), dtype=np.uint8)
+        MaskMaker.draw_polygon(coords, mask)
+        assert (mask.ravel() == expected).all()
+
+        # overlapping polygons are not summed
+        MaskMaker.draw_polygon([(2, 2), (2, 6), (6, 6), (6, 2)], mask)
+        assert mask.dtype == np.uint8 and mask.max() == 1
+
     def test_csv_to_polygon_pixels(self):
         """Test variable numbers of vertices are correctly handled
         """
@@ -74,6 +92,17 @@ class TestMasks:
                 f'Got {len(vertices)} for polygon {polygon_id}, ' \
                 f'expected {polygon_shapes[polygon_id]}'
 
+        # the fake data only has the last vertex of every polygon
+        assert np.array_equal(polygon_dict[1][-1], [6, 6]) and np.isnan(polygon_dict[1][:-1]).all()
+
+    def test_csv_to_image_names(self):
+        polygon_cities_filenames = {0: ['Fresno', '1a'], 1: ['Oxnard', '2b'], 2: ['Fresno', '1a']}
+        test_data = self._make_polygon_data_except_vertices(polygon_cities_filenames)
+
+        image_dict = MaskMaker._csv_to_dict_image_names(test_data)
+        assert {city: dict(images) for city, images in image_dict.items()} == \
+            {'Fresno': {'1a': [0, 2]}, 'Oxnard': {'2b': [1]}}
+
     def test_process(self, tmp_path):
         """Test the process runs end to end
         """
@@ -89,12 +118,23 @@ class TestMasks:
         except_vertices_df.to_csv(metadata_path / 'polygonDataExceptVertices.csv')
 
         mask_maker = MaskMaker(tmp_path)
-        mask_maker.process()
+        mask_maker.process(num_workers=2)
 
         for idx, (city, filename) in polygon_city_filenames.items():
-            file_location = tmp_path / f'{city}_masks' / f'{filename}.npy'
+            file_location = tmp_path / f'{city}_masks' / f'{filename}.npz'
             assert file_location.exists(), f'{file_location} not saved'
 
-            mask = np.load(file_location)
+            mask = load_mask(tmp_path / f'{city}_masks', filename)
             assert mask.shape == IMAGE_SIZES[city], \
                 f'Got {mask.shape} for {city}, expected {IMAGE_SIZES[city]}'
+
+    def test_save_load_mask(self, tmp_path):
+        """Masks are bit-packed, and unpacked masks are still read
+        """
+        mask = (np.random.rand(37, 45) > 0.7).astype(np.uint8)
+        save_mask(tmp_path / 'packed.npz', mask)
+        assert (load_mask(tmp_path, 'packed') == mask).all()
+        assert load_mask(tmp_path, 'packed').dtype == np.uint8
+
+        np.save(tmp_path / 'unpacked.npy', mask.astype(float))
+        assert (load_mask(tmp_path, 'unpacked') == mask).all()
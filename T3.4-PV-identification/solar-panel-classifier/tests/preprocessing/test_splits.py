@@ -1,3 +1,6 @@
+import numpy as np
+import pandas as pd
+
 from solarnet.preprocessing.splits import ImageSplitter
 
 
@@ -20,3 +23,17 @@ class TestImageSplitter:
 
         assert new_coords[0] == 90, "x coordinate improperly adjusted"
         assert new_coords[1] == 10, "y coordinate improperly adjusted"
+
+    def test_read_centroids(self, tmp_path):
+        metadata = pd.DataFrame({'polygon_id': [0, 1, 2, 3, 4],
+                                 'city': ['Fresno', 'Fresno', 'Oxnard', 'Fresno', 'Fresno'],
+                                 'image_name': ['a', 'b', 'c', 'a', 'a'],
+                                 'centroid_latitude_pixels': [1., 2., 3., 4., np.nan],
+                                 'centroid_longitude_pixels': [5., 6., 7., 8., 9.]})
+        (tmp_path / 'metadata').mkdir()
+        metadata.to_csv(tmp_path / 'metadata/polygonDataExceptVertices.csv', index=False)
+
+        centroids = ImageSplitter(tmp_path).read_centroids()
+        assert list(centroids) == ['Fresno', 'Oxnard']
+        assert centroids['Fresno'] == {'a': {(1., 5.), (4., 8.)}, 'b': {(2., 6.)}}
+        assert centroids['Oxnard'] == {'c': {(3., 7.)}}